@@ -0,0 +1,225 @@
+"""
+SEP-10 throughput/latency benchmark.
+
+Runs a local fake Horizon (``/accounts/{id}``) and a fake client_domain
+``stellar.toml`` server, then drives ``Sep10.http_get`` + client signing +
+``Sep10.http_post`` at the given concurrency for each scenario::
+
+    python benchmarks/sep10_benchmark.py --requests 500 --concurrency 20
+    python benchmarks/sep10_benchmark.py --scenario client_domain --executor thread
+
+CPU per auth is measured for the whole process, so it includes the client
+signing and the fake servers. It doesn't include work done in process pool
+workers (``--executor process``).
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+from aiohttp import web
+from stellar_sdk import Keypair, MuxedAccount, Network, TransactionEnvelope
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fawaris import (  # noqa: E402
+    CryptoExecutor,
+    PooledAiohttpClient,
+    Sep10,
+    Sep10GetRequest,
+    Sep10PostRequest,
+    TTLCache,
+)
+
+SCENARIOS = ["existing", "new", "muxed", "memo", "client_domain"]
+HOME_DOMAIN = "localhost"
+CLIENT_DOMAIN = "wallet.bench"
+
+
+class LocalDomainsClient(PooledAiohttpClient):
+    """
+    Sends the requests for the fake client domains to the local toml server
+    """
+
+    def __init__(self, domains: Dict[str, str], **kwargs):
+        super().__init__(**kwargs)
+        self.domains = domains
+
+    async def get(self, url, params=None):
+        for domain, local_url in self.domains.items():
+            prefix = f"https://{domain}/"
+            if url.startswith(prefix):
+                url = local_url + url[len(prefix) - 1 :]
+                break
+        return await super().get(url, params)
+
+
+async def start_fake_servers(accounts: Dict[str, Dict], client_domain_kp: Keypair):
+    async def account(request):
+        data = accounts.get(request.match_info["account_id"])
+        if data is None:
+            return web.json_response({"status": 404}, status=404)
+        return web.json_response(data)
+
+    async def stellar_toml(request):
+        return web.Response(text=f'SIGNING_KEY = "{client_domain_kp.public_key}"\n')
+
+    app = web.Application()
+    app.router.add_get("/accounts/{account_id}", account)
+    app.router.add_get("/.well-known/stellar.toml", stellar_toml)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def horizon_account(account_id: str) -> Dict:
+    return {
+        "id": account_id,
+        "account_id": account_id,
+        "sequence": "1",
+        "thresholds": {"low_threshold": 0, "med_threshold": 1, "high_threshold": 0},
+        "signers": [{"key": account_id, "weight": 1, "type": "ed25519_public_key"}],
+    }
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run_scenario(args, scenario: str) -> Dict:
+    server_kp = Keypair.random()
+    client_domain_kp = Keypair.random()
+    existing_kp = Keypair.random()
+    accounts = {existing_kp.public_key: horizon_account(existing_kp.public_key)}
+    runner, base_url = await start_fake_servers(accounts, client_domain_kp)
+    executor = CryptoExecutor(args.executor, max_pending=args.max_pending)
+    http_client = LocalDomainsClient({CLIENT_DOMAIN: base_url})
+    sep10 = Sep10(
+        "http://localhost",
+        [HOME_DOMAIN],
+        base_url,
+        Network.TESTNET_NETWORK_PASSPHRASE,
+        server_kp.secret,
+        "benchmark-jwt-secret-of-at-least-32-bytes",
+        client_signing_key_cache=TTLCache() if args.cache else None,
+        account_signers_cache=TTLCache(ttl=30) if args.cache else None,
+        http_client=http_client,
+        executor=executor,
+    )
+
+    async def authenticate(index: int):
+        client_kp = existing_kp
+        request = {"account": existing_kp.public_key, "home_domain": HOME_DOMAIN}
+        signers = [client_kp]
+        if scenario == "new":
+            client_kp = Keypair.random()
+            request["account"] = client_kp.public_key
+            signers = [client_kp]
+        elif scenario == "muxed":
+            request["account"] = MuxedAccount(existing_kp.public_key, index).account_muxed
+        elif scenario == "memo":
+            request["memo"] = str(index + 1)
+        elif scenario == "client_domain":
+            request["client_domain"] = CLIENT_DOMAIN
+            signers.append(client_domain_kp)
+
+        started_at = time.perf_counter()
+        resp = await sep10.http_get(Sep10GetRequest(**request))
+        get_latency = time.perf_counter() - started_at
+
+        envelope = TransactionEnvelope.from_xdr(
+            resp.transaction, Network.TESTNET_NETWORK_PASSPHRASE
+        )
+        for signer in signers:
+            envelope.sign(signer)
+        transaction = envelope.to_xdr()
+
+        started_at = time.perf_counter()
+        await sep10.http_post(Sep10PostRequest(transaction=transaction))
+        post_latency = time.perf_counter() - started_at
+        return get_latency, post_latency
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited(index: int):
+        async with semaphore:
+            return await authenticate(index)
+
+    try:
+        # warm up connections and caches
+        await asyncio.gather(*[limited(i) for i in range(args.concurrency)])
+        cpu_started_at = time.process_time()
+        started_at = time.perf_counter()
+        latencies = await asyncio.gather(*[limited(i) for i in range(args.requests)])
+        elapsed = time.perf_counter() - started_at
+        cpu = time.process_time() - cpu_started_at
+    finally:
+        await http_client.close()
+        await runner.cleanup()
+        executor.shutdown()
+
+    get_latencies = [get for get, _ in latencies]
+    post_latencies = [post for _, post in latencies]
+    result = {
+        "scenario": scenario,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "executor": args.executor,
+        "auth_per_second": args.requests / elapsed,
+        "cpu_ms_per_auth": cpu / args.requests * 1000,
+    }
+    for name, values in [("http_get", get_latencies), ("http_post", post_latencies)]:
+        result[f"{name}_mean_ms"] = statistics.mean(values) * 1000
+        for q in (0.5, 0.95, 0.99):
+            result[f"{name}_p{int(q * 100)}_ms"] = percentile(values, q) * 1000
+    return result
+
+
+def print_result(result: Dict) -> None:
+    print(
+        f"{result['scenario']:>14}: {result['auth_per_second']:8.1f} auth/s  "
+        f"cpu {result['cpu_ms_per_auth']:6.2f}ms/auth  "
+        f"GET p50/p95/p99 {result['http_get_p50_ms']:.1f}/"
+        f"{result['http_get_p95_ms']:.1f}/{result['http_get_p99_ms']:.1f}ms  "
+        f"POST p50/p95/p99 {result['http_post_p50_ms']:.1f}/"
+        f"{result['http_post_p95_ms']:.1f}/{result['http_post_p99_ms']:.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument(
+        "--scenario", action="append", choices=SCENARIOS, help="default: all"
+    )
+    parser.add_argument(
+        "--executor", default="inline", choices=["inline", "thread", "process"]
+    )
+    parser.add_argument("--max-pending", type=int, default=None)
+    parser.add_argument(
+        "--cache", action="store_true", help="enable the Sep10 caches"
+    )
+    parser.add_argument("--json", action="store_true", help="print JSON results")
+    args = parser.parse_args()
+
+    results = []
+    for scenario in args.scenario or SCENARIOS:
+        result = asyncio.run(run_scenario(args, scenario))
+        results.append(result)
+        if not args.json:
+            print_result(result)
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Withdrawal stream payment decoding benchmark.
+
+Generates a replayed stream of transactions sent to an anchor account and
+extracts their payments with the previous decoding (full
+``TransactionEnvelope`` plus an XDR round trip of each operation) and with
+``fawaris.payments.iter_payment_operations``::
+
+    python benchmarks/withdrawal_stream_benchmark.py --transactions 2000
+    python benchmarks/withdrawal_stream_benchmark.py --operations 10 --json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+from stellar_sdk import (
+    Account,
+    Asset,
+    Keypair,
+    Network,
+    TransactionBuilder,
+    TransactionEnvelope,
+)
+from stellar_sdk import xdr as stellar_xdr
+from stellar_sdk.operation import Payment, PathPaymentStrictReceive
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fawaris.payments import iter_payment_operations  # noqa: E402
+
+NETWORK_PASSPHRASE = Network.TESTNET_NETWORK_PASSPHRASE
+ANCHOR = Keypair.random().public_key
+ISSUER = Keypair.random().public_key
+USD = Asset("USD", ISSUER)
+
+
+def generate_stream(transactions: int, operations: int) -> List[Tuple[str, str]]:
+    """
+    Envelope and result XDR of `transactions` transactions, each with
+    `operations` payments, every other one to the anchor account
+    """
+    payment_result = stellar_xdr.OperationResult(
+        code=stellar_xdr.OperationResultCode.opINNER,
+        tr=stellar_xdr.OperationResultTr(
+            type=stellar_xdr.OperationType.PAYMENT,
+            payment_result=stellar_xdr.PaymentResult(
+                stellar_xdr.PaymentResultCode.PAYMENT_SUCCESS
+            ),
+        ),
+    )
+    result_xdr = stellar_xdr.TransactionResult(
+        fee_charged=stellar_xdr.Int64(100 * operations),
+        result=stellar_xdr.TransactionResultResult(
+            stellar_xdr.TransactionResultCode.txSUCCESS,
+            results=[payment_result] * operations,
+        ),
+        ext=stellar_xdr.TransactionResultExt(0),
+    ).to_xdr()
+    stream = []
+    for i in range(transactions):
+        source = Keypair.random()
+        builder = TransactionBuilder(
+            Account(source.public_key, 1), NETWORK_PASSPHRASE, base_fee=100
+        )
+        builder.add_text_memo(str(i)).set_timeout(30)
+        for op in range(operations):
+            destination = ANCHOR if op % 2 else ISSUER
+            builder.append_payment_op(destination, USD, str(op + 1))
+        envelope = builder.build()
+        envelope.sign(source)
+        stream.append((envelope.to_xdr(), result_xdr))
+    return stream
+
+
+def sdk_decoder(envelope_xdr: str, result_xdr: str) -> List[Dict]:
+    # the decoding done by Sep24.process_stream_response before
+    # fawaris.payments was introduced
+    op_results = stellar_xdr.TransactionResult.from_xdr(result_xdr).result.results
+    horizon_tx = TransactionEnvelope.from_xdr(
+        envelope_xdr, network_passphrase=NETWORK_PASSPHRASE
+    ).transaction
+    payments = []
+    for operation, op_result in zip(horizon_tx.operations, op_results):
+        op_xdr_obj = operation.to_xdr_object()
+        if isinstance(operation, Payment):
+            operation = Payment.from_xdr_object(op_xdr_obj)
+            amount = str(operation.amount)
+            asset = operation.asset
+        elif isinstance(operation, PathPaymentStrictReceive):
+            operation = PathPaymentStrictReceive.from_xdr_object(op_xdr_obj)
+            amount = str(operation.dest_amount)
+            asset = operation.dest_asset
+        else:
+            continue
+        if operation.destination.account_id != ANCHOR:
+            continue
+        source = operation.source or horizon_tx.source
+        payments.append(
+            {
+                "source": source.account_muxed or source.account_id,
+                "amount": amount,
+                "code": asset.code,
+                "issuer": asset.issuer,
+            }
+        )
+    return payments
+
+
+def lean_decoder(envelope_xdr: str, result_xdr: str) -> List[Dict]:
+    return [
+        {
+            "source": payment.source,
+            "amount": payment.amount,
+            "code": payment.code,
+            "issuer": payment.issuer,
+        }
+        for payment in iter_payment_operations(
+            envelope_xdr, result_xdr, destination=ANCHOR
+        )
+    ]
+
+
+DECODERS: Dict[str, Callable[[str, str], List[Dict]]] = {
+    "sdk": sdk_decoder,
+    "lean": lean_decoder,
+}
+
+
+def run_decoder(name: str, stream: List[Tuple[str, str]], rounds: int) -> Dict:
+    decoder = DECODERS[name]
+    best = float("inf")
+    for _ in range(rounds):
+        started_at = time.perf_counter()
+        for envelope_xdr, result_xdr in stream:
+            decoder(envelope_xdr, result_xdr)
+        best = min(best, time.perf_counter() - started_at)
+    return {
+        "decoder": name,
+        "transactions": len(stream),
+        "us_per_transaction": best / len(stream) * 1e6,
+        "transactions_per_second": len(stream) / best,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--transactions", type=int, default=1000)
+    parser.add_argument(
+        "--operations", type=int, default=4, help="payments per transaction"
+    )
+    parser.add_argument("--rounds", type=int, default=3, help="best of N rounds")
+    parser.add_argument("--json", action="store_true", help="print JSON results")
+    args = parser.parse_args()
+
+    stream = generate_stream(args.transactions, args.operations)
+    for envelope_xdr, result_xdr in stream[:10]:
+        assert sdk_decoder(envelope_xdr, result_xdr) == lean_decoder(
+            envelope_xdr, result_xdr
+        )
+    results = [run_decoder(name, stream, args.rounds) for name in DECODERS]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        print(
+            f"{result['decoder']:>5}: {result['us_per_transaction']:8.1f}us/tx  "
+            f"{result['transactions_per_second']:8.1f} tx/s"
+        )
+    print(
+        f"speedup: {results[0]['us_per_transaction'] / results[1]['us_per_transaction']:.2f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from .exceptions import Sep10InvalidToken
+from .exceptions import Sep10InvalidToken, Sep10RateLimitExceeded
 from .models import (
     Asset,
     Sep9Customer,
@@ -29,5 +29,14 @@ from .models import (
     Sep24TransactionGetRequest,
     Sep24TransactionGetResponse,
 )
-from .sep10 import Sep10, Sep10Token
+from .cache import AsyncCache, TTLCache
+from .executor import CryptoExecutor
+from .http_client import PooledAiohttpClient
+from .instrumentation import (
+    Instrumentation,
+    LoggingInstrumentation,
+    HistogramInstrumentation,
+)
+from .ratelimit import RateLimit, Sep10AdmissionControl
+from .sep10 import Sep10, Sep10Token, Sep10TokenCache
 from .sep24 import Sep24
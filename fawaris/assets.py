@@ -0,0 +1,61 @@
+from typing import Dict, Optional, Tuple
+
+from fawaris.cache import LRUCache
+from fawaris.models import Asset
+
+# (code, issuer), the issuer is None for the native asset
+AssetKey = Tuple[str, Optional[str]]
+
+
+class AssetRegistry:
+    """
+    Index of the anchor assets by code and by (code, issuer), built once, so
+    that the payments of the withdrawal streams are matched with dictionary
+    lookups.
+
+    It also remembers the asset of the last `max_transactions` withdrawals
+    resolved with :meth:`fawaris.Sep24.get_transaction_asset`, by
+    transaction id.
+    """
+
+    def __init__(self, assets: Dict[str, Asset], max_transactions: int = 10000):
+        """
+        :param assets: Anchor assets, by code
+        :param max_transactions: Maximum number of transaction assets kept
+        """
+        self._by_code: Dict[str, Asset] = {}
+        self._by_key: Dict[AssetKey, Asset] = {}
+        for asset in assets.values():
+            self._by_code[asset.code] = asset
+            self._by_key[(asset.code, asset.issuer)] = asset
+        self._transaction_assets = LRUCache(max_size=max_transactions)
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+    def get(self, code: str) -> Optional[Asset]:
+        return self._by_code.get(code)
+
+    def find(self, code: str, issuer: Optional[str]) -> Optional[Asset]:
+        return self._by_key.get((code, issuer))
+
+    def is_anchor_asset(self, code: str, issuer: Optional[str]) -> bool:
+        return (code, issuer) in self._by_key
+
+    def transaction_asset(self, transaction_id: str) -> Optional[Asset]:
+        return self._transaction_assets.get(transaction_id)
+
+    def set_transaction_asset(self, transaction_id: str, asset: Asset) -> Asset:
+        """
+        Remember the asset of a transaction. The registered instance is kept
+        if the asset is an anchor asset, and returned.
+        """
+        asset = self._by_key.get((asset.code, asset.issuer), asset)
+        self._transaction_assets.set(transaction_id, asset, float("inf"))
+        return asset
+
+    def forget_transaction(self, transaction_id: str) -> None:
+        self._transaction_assets.pop(transaction_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {"assets": len(self), **self._transaction_assets.stats()}
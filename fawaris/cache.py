@@ -0,0 +1,207 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple, Type
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Bounded in-memory cache where each entry carries its own expiration time.
+    When the cache is full, the least recently used entry is evicted.
+    """
+
+    max_size: int
+    clock: Callable[[], float]
+    hits: int
+    misses: int
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        :param max_size: Maximum number of entries kept in the cache
+        :param clock: Function returning the current time, used to compare
+            against the expiration time of the entries
+        """
+        if max_size < 1:
+            raise ValueError("'max_size' must be a positive integer")
+        self.max_size = max_size
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            expires_at, value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        if self.clock() >= expires_at:
+            del self._entries[key]
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, expires_at: float) -> None:
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self)}
+
+
+class AsyncCache(ABC):
+    """
+    Interface of the async caches accepted by the SEP classes.
+    Implement it to back a cache with an external store shared between
+    processes.
+    """
+
+    @abstractmethod
+    async def get_or_fetch(
+        self, key: str, fetch: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Return the value cached for `key`, calling `fetch` to obtain it if
+        it's not cached. Exceptions raised by `fetch` are propagated.
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    async def invalidate(self, key: str) -> None:
+        raise NotImplementedError()
+
+    async def clear(self) -> None:
+        """
+        Evict every key. Optional, used by the caches dedicated to a single
+        kind of value, like the `info_cache` of :class:`fawaris.Sep24`
+        """
+        raise NotImplementedError()
+
+
+class _Failure:
+    __slots__ = ("exception",)
+
+    def __init__(self, exception: BaseException):
+        self.exception = exception
+
+
+class TTLCache(AsyncCache):
+    """
+    In-memory :class:`AsyncCache` with TTL, negative caching and LRU eviction.
+
+    Concurrent lookups of a key that is not cached share a single call to
+    `fetch` (single-flight), so a burst of requests for the same key results
+    in only one fetch.
+    """
+
+    ttl: float
+    negative_ttl: float
+    negative_exceptions: Tuple[Type[BaseException], ...]
+    coalesced: int
+
+    def __init__(
+        self,
+        ttl: float = 300,
+        negative_ttl: float = 30,
+        max_size: int = 1024,
+        negative_exceptions: Tuple[Type[BaseException], ...] = (Exception,),
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        :param ttl: Seconds a fetched value is kept in the cache
+        :param negative_ttl: Seconds a failed fetch is kept in the cache.
+            While cached, lookups of the key raise the same exception again
+            without calling `fetch`. Set to 0 to disable negative caching
+        :param max_size: Maximum number of entries kept in the cache
+        :param negative_exceptions: Exception types that are negatively
+            cached. Other exceptions are propagated without being cached
+        :param clock: Function returning the current time in seconds
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.negative_exceptions = negative_exceptions
+        self.coalesced = 0
+        self._entries = LRUCache(max_size=max_size, clock=clock)
+        self._inflight: Dict[str, "asyncio.Future[Any]"] = {}
+
+    @property
+    def hits(self) -> int:
+        return self._entries.hits
+
+    @property
+    def misses(self) -> int:
+        return self._entries.misses
+
+    async def get_or_fetch(
+        self, key: str, fetch: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        value = self._entries.get(key, _MISSING)
+        if value is not _MISSING:
+            if isinstance(value, _Failure):
+                # drop the traceback of the previous raise, which would grow
+                # and keep its frames alive on each hit
+                raise value.exception.with_traceback(None)
+            return value
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(key, fetch))
+            self._inflight[key] = future
+        else:
+            self.coalesced += 1
+        # shield the fetch so that a cancelled caller doesn't cancel it for
+        # the other callers waiting on the same key
+        return await asyncio.shield(future)
+
+    async def _fetch(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        task = asyncio.current_task()
+        try:
+            value = await fetch()
+        except asyncio.CancelledError:
+            raise
+        except self.negative_exceptions as e:
+            if self.negative_ttl > 0 and self._inflight.get(key) is task:
+                self._entries.set(
+                    key, _Failure(e), self._entries.clock() + self.negative_ttl
+                )
+            raise
+        else:
+            # don't store the value if the key was invalidated while fetching
+            if self._inflight.get(key) is task:
+                self._entries.set(key, value, self._entries.clock() + self.ttl)
+            return value
+        finally:
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+
+    async def invalidate(self, key: str) -> None:
+        self._entries.pop(key)
+        self._inflight.pop(key, None)
+
+    async def clear(self) -> None:
+        self._entries.clear()
+        # running fetches don't store their value
+        self._inflight.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {**self._entries.stats(), "coalesced": self.coalesced}
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Generic,
+    Iterable,
+    List,
+    Optional,
+    TypeVar,
+    Union,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+async def gather_bounded(
+    fn: Callable[[T], Awaitable[R]],
+    items: Iterable[T],
+    max_concurrency: int,
+    timeout: Optional[float] = None,
+    on_result: Optional[Callable[[T, Union[R, Exception]], Awaitable[Any]]] = None,
+) -> List[Union[R, Exception]]:
+    """
+    Await ``fn(item)`` for every item, with at most `max_concurrency` calls
+    running at the same time. Calls still running after `timeout` seconds are
+    cancelled and get an :exc:`asyncio.TimeoutError` as result.
+
+    Like ``asyncio.gather(..., return_exceptions=True)``, the results are
+    returned in the order of `items`, with exceptions in place of the results
+    of the calls that failed.
+
+    If set, ``on_result(item, result)`` is awaited as soon as each call
+    finishes. Exceptions raised by it cancel the remaining calls and are
+    propagated.
+    """
+    if max_concurrency < 1:
+        raise ValueError("'max_concurrency' must be a positive integer")
+    items = list(items)
+    results: List[Union[R, Exception]] = [None] * len(items)  # type: ignore
+    indexes = iter(range(len(items)))
+
+    async def worker():
+        # workers share the iterator, so each item is taken by one of them
+        for index in indexes:
+            try:
+                if timeout is None:
+                    results[index] = await fn(items[index])
+                else:
+                    results[index] = await asyncio.wait_for(
+                        fn(items[index]), timeout
+                    )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                results[index] = e
+            if on_result is not None:
+                await on_result(items[index], results[index])
+
+    workers = [
+        asyncio.ensure_future(worker())
+        for _ in range(min(max_concurrency, len(items)))
+    ]
+    try:
+        await asyncio.gather(*workers)
+    except BaseException:
+        for task in workers:
+            task.cancel()
+        raise
+    return results
+
+
+class BatchBuffer(Generic[T]):
+    """
+    Accumulates items and passes them to `flush_fn` in batches, when
+    `max_size` items are buffered or when the oldest buffered item has waited
+    for `max_delay` seconds, whichever comes first. Calls to `flush_fn` never
+    overlap.
+
+    :meth:`aclose` must be awaited once done, to flush the remaining items.
+    """
+
+    def __init__(
+        self,
+        flush_fn: Callable[[List[T]], Awaitable[Any]],
+        max_size: int = 100,
+        max_delay: Optional[float] = None,
+    ):
+        """
+        :param flush_fn: Coroutine function called with each batch
+        :param max_size: Number of items triggering a flush
+        :param max_delay: Maximum seconds an item stays in the buffer. If not
+            set, items are only flushed by size and by :meth:`flush`
+        """
+        if max_size < 1:
+            raise ValueError("'max_size' must be a positive integer")
+        self.flush_fn = flush_fn
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.flushes = 0
+        self._items: List[T] = []
+        self._lock: Optional[asyncio.Lock] = None
+        self._timer: Optional["asyncio.Future[None]"] = None
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    async def add(self, item: T) -> None:
+        self._items.append(item)
+        if len(self._items) >= self.max_size:
+            await self.flush()
+        elif self._timer is None and self.max_delay is not None:
+            self._timer = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.max_delay)
+        # cleared first, so that flush() doesn't cancel the running timer
+        self._timer = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("delayed flush failed")
+
+    async def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._lock is None:
+            # created here so that it's bound to the running loop
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            items, self._items = self._items, []
+            if items:
+                self.flushes += 1
+                await self.flush_fn(items)
+
+    async def aclose(self) -> None:
+        await self.flush()
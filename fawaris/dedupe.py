@@ -0,0 +1,88 @@
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Optional
+
+from fawaris.cache import LRUCache
+
+
+class ProcessedTransactionStore(ABC):
+    """
+    Persistent storage of the hashes of the Stellar transactions already
+    processed, ex: a database table with a unique hash column. It lets
+    :class:`TransactionDeduplicator` detect duplicates across restarts.
+    """
+
+    @abstractmethod
+    async def contains(self, transaction_hash: str) -> bool:
+        raise NotImplementedError()
+
+    @abstractmethod
+    async def add(self, transaction_hash: str) -> None:
+        raise NotImplementedError()
+
+
+class TransactionDeduplicator:
+    """
+    Remembers the Stellar transactions seen on the withdrawal streams, so
+    that events replayed by a restart or a reconnection are dropped early.
+
+    The hashes are kept in memory, up to `max_size` of them and for at most
+    `window` seconds. Transactions matched with a withdrawal are also saved
+    to `store`, if set, which is checked before processing a match.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 100000,
+        window: Optional[float] = None,
+        store: Optional[ProcessedTransactionStore] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        :param max_size: Maximum number of hashes kept in memory
+        :param window: Seconds a hash is kept in memory. If not set, hashes
+            are only evicted when `max_size` is reached
+        :param store: Persistent storage of the processed transactions
+        :param clock: Function returning the current time
+        """
+        self.window = window
+        self.store = store
+        self.duplicates = 0
+        self._seen = LRUCache(max_size=max_size, clock=clock)
+
+    def _expires_at(self) -> float:
+        if self.window is None:
+            return float("inf")
+        return self._seen.clock() + self.window
+
+    def seen(self, transaction_hash: str) -> bool:
+        """
+        Whether the transaction was seen recently, without I/O
+        """
+        if self._seen.get(transaction_hash) is None:
+            return False
+        self.duplicates += 1
+        return True
+
+    def mark_seen(self, transaction_hash: str) -> None:
+        self._seen.set(transaction_hash, True, self._expires_at())
+
+    async def is_processed(self, transaction_hash: str) -> bool:
+        """
+        Whether the transaction was seen recently or is in `store`
+        """
+        if self.seen(transaction_hash):
+            return True
+        if self.store is None or not await self.store.contains(transaction_hash):
+            return False
+        self.mark_seen(transaction_hash)
+        self.duplicates += 1
+        return True
+
+    async def mark_processed(self, transaction_hash: str) -> None:
+        if self.store is not None:
+            await self.store.add(transaction_hash)
+        self.mark_seen(transaction_hash)
+
+    def stats(self) -> Dict[str, int]:
+        return {"duplicates": self.duplicates, "size": len(self._seen)}
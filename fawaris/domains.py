@@ -0,0 +1,60 @@
+from functools import lru_cache
+from typing import Dict, Iterable
+from urllib.parse import urlparse
+
+_WILDCARD = "*"
+
+
+@lru_cache(maxsize=4096)
+def is_valid_hostname(hostname: str) -> bool:
+    return urlparse(f"https://{hostname}").netloc == hostname
+
+
+class DomainPolicy:
+    """
+    Set of domain rules compiled for fast lookups with ``domain in policy``.
+
+    A rule is either an exact hostname (``wallet.example``), looked up in a
+    set, or a wildcard (``*.wallet.example``) matching any subdomain of
+    ``wallet.example`` but not ``wallet.example`` itself. Wildcards are
+    stored in a trie of reversed labels, so a lookup costs one step per
+    label of the domain regardless of the number of rules.
+
+    Rules and domains are compared case-insensitively, without a trailing
+    dot.
+    """
+
+    def __init__(self, rules: Iterable[str]):
+        self._exact = set()
+        self._wildcards: Dict = {}
+        for rule in rules:
+            rule = _normalize(rule)
+            if rule.startswith("*."):
+                node = self._wildcards
+                for label in reversed(rule[2:].split(".")):
+                    node = node.setdefault(label, {})
+                node[_WILDCARD] = True
+            else:
+                self._exact.add(rule)
+
+    def __contains__(self, domain: str) -> bool:
+        domain = _normalize(domain)
+        if domain in self._exact:
+            return True
+        if not self._wildcards:
+            return False
+        node = self._wildcards
+        labels = domain.split(".")
+        # stop before the first label, a wildcard needs at least one label
+        for index in range(len(labels) - 1, 0, -1):
+            node = node.get(labels[index])
+            if node is None:
+                return False
+            if _WILDCARD in node:
+                return True
+        return False
+
+
+def _normalize(domain: str) -> str:
+    # hostnames are case-insensitive, and "example.com." is fully qualified
+    return domain.lower().rstrip(".")
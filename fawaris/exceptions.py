@@ -1,2 +1,6 @@
 class Sep10InvalidToken(Exception):
     pass
+
+
+class Sep10RateLimitExceeded(Exception):
+    pass
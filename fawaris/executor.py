@@ -0,0 +1,108 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from typing_extensions import Literal
+
+ExecutionMode = Literal["inline", "thread", "process"]
+
+
+def _timed_call(submitted_at: float, fn: Callable, *args, **kwargs) -> Tuple[float, Any]:
+    # runs in the worker, so it must be a module-level function to be
+    # picklable by ProcessPoolExecutor
+    started_at = time.time()
+    return started_at - submitted_at, fn(*args, **kwargs)
+
+
+class CryptoExecutor:
+    """
+    Runs CPU-bound work, like signing and verifying challenge transactions,
+    according to `mode`:
+
+    - ``inline``: in the event loop thread, blocking it while running
+    - ``thread``: in a thread pool. ed25519 operations release the GIL, so
+      this keeps the event loop responsive without pickling costs
+    - ``process``: in a process pool. Functions and arguments must be
+      picklable
+
+    In pool modes, at most `max_pending` calls are queued or running at the
+    same time. Further calls wait for a free slot, and the time spent waiting
+    (for a slot and for a worker) is recorded in :meth:`stats`.
+    """
+
+    mode: ExecutionMode
+    max_workers: Optional[int]
+    max_pending: Optional[int]
+
+    def __init__(
+        self,
+        mode: ExecutionMode = "inline",
+        max_workers: Optional[int] = None,
+        max_pending: Optional[int] = None,
+    ):
+        """
+        :param mode: One of ``inline``, ``thread`` or ``process``
+        :param max_workers: Number of workers of the pool, defaults to the
+            `concurrent.futures` defaults
+        :param max_pending: Maximum number of calls queued or running in the
+            pool. If not set, the queue is unbounded
+        """
+        if mode not in ("inline", "thread", "process"):
+            raise ValueError(f"invalid execution mode: {mode}")
+        if max_pending is not None and max_pending < 1:
+            raise ValueError("'max_pending' must be a positive integer")
+        self.mode = mode
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._queue_wait_count = 0
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.mode == "thread":
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        if self.mode == "inline":
+            return fn(*args, **kwargs)
+
+        submitted_at = time.time()
+        if self.max_pending is not None:
+            if self._semaphore is None:
+                # created here so that it's bound to the running loop
+                self._semaphore = asyncio.Semaphore(self.max_pending)
+            async with self._semaphore:
+                return await self._submit(submitted_at, fn, *args, **kwargs)
+        return await self._submit(submitted_at, fn, *args, **kwargs)
+
+    async def _submit(self, submitted_at: float, fn: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        queue_wait, result = await loop.run_in_executor(
+            self._get_executor(),
+            functools.partial(_timed_call, submitted_at, fn, *args, **kwargs),
+        )
+        self._queue_wait_count += 1
+        self._queue_wait_total += queue_wait
+        self._queue_wait_max = max(self._queue_wait_max, queue_wait)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "queue_wait_count": self._queue_wait_count,
+            "queue_wait_seconds_total": self._queue_wait_total,
+            "queue_wait_seconds_max": self._queue_wait_max,
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
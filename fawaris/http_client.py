@@ -0,0 +1,128 @@
+from typing import Optional
+
+import aiohttp
+from stellar_sdk.client import defines
+from stellar_sdk.client.aiohttp_client import (
+    AiohttpClient,
+    IDENTIFICATION_HEADERS,
+    USER_AGENT,
+    DEFAULT_BACKOFF_FACTOR,
+)
+from stellar_sdk.client.base_async_client import BaseAsyncClient
+
+
+class PooledAiohttpClient(AiohttpClient):
+    """
+    :class:`AiohttpClient` with a tunable connection pool, meant to be
+    created once and shared by every request made by the process.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 100,
+        limit_per_host: int = 0,
+        keepalive_timeout: float = 30,
+        dns_cache_ttl: Optional[int] = 300,
+        request_timeout: float = defines.DEFAULT_GET_TIMEOUT_SECONDS,
+        post_timeout: float = defines.DEFAULT_POST_TIMEOUT_SECONDS,
+        backoff_factor: Optional[float] = DEFAULT_BACKOFF_FACTOR,
+        user_agent: Optional[str] = None,
+        **kwargs,
+    ):
+        """
+        :param pool_size: Maximum number of simultaneous connections
+        :param limit_per_host: Maximum number of simultaneous connections to
+            the same host. 0 means no limit other than `pool_size`
+        :param keepalive_timeout: Seconds an idle connection is kept open
+            to be reused
+        :param dns_cache_ttl: Seconds DNS lookups are cached. None caches
+            them forever
+        :param request_timeout: Timeout for GET requests
+        :param post_timeout: Timeout for POST requests
+        :param backoff_factor: Backoff factor applied between retries
+        :param user_agent: User-Agent header sent with the requests
+        """
+        # AiohttpClient.__init__ doesn't allow customizing the connector,
+        # so the session is set up here instead
+        self.pool_size = pool_size
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.backoff_factor = backoff_factor
+        self.request_timeout = request_timeout
+        self.post_timeout = post_timeout
+        self.user_agent = user_agent or USER_AGENT
+        self.headers = {
+            **IDENTIFICATION_HEADERS,
+            "Content-Type": "application/x-www-form-urlencoded",
+            "User-Agent": self.user_agent,
+        }
+        connector = aiohttp.TCPConnector(
+            limit=pool_size,
+            limit_per_host=limit_per_host,
+            keepalive_timeout=keepalive_timeout,
+            use_dns_cache=True,
+            ttl_dns_cache=dns_cache_ttl,
+        )
+        self._session = aiohttp.ClientSession(
+            headers=self.headers.copy(),
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=request_timeout),
+            **kwargs,
+        )
+        self._sse_session = None
+
+
+class HttpClientMixin:
+    """
+    Gives a SEP class a long-lived HTTP client, used for every request it
+    makes to Horizon and to other domains.
+
+    The client is created by :meth:`start` (or lazily, on first use) and
+    closed by :meth:`aclose`. A client passed to the constructor is
+    considered shared and is never closed by the SEP class, which allows a
+    framework integration to use a single connection pool per process::
+
+        client = PooledAiohttpClient(limit_per_host=20)
+        sep10 = Sep10(..., http_client=client)
+        sep24 = MySep24(..., http_client=client)
+        ...
+        await client.close()
+    """
+
+    _http_client: Optional[BaseAsyncClient]
+    _owns_http_client: bool
+
+    def _init_http_client(self, http_client: Optional[BaseAsyncClient]) -> None:
+        self._http_client = http_client
+        self._owns_http_client = http_client is None
+
+    def _create_http_client(self) -> BaseAsyncClient:
+        return PooledAiohttpClient()
+
+    def _get_http_client(self) -> BaseAsyncClient:
+        if self._http_client is None:
+            self._http_client = self._create_http_client()
+        return self._http_client
+
+    async def start(self) -> None:
+        """
+        Create the HTTP client. Must be called from within the event loop
+        the class will be used on.
+        """
+        self._get_http_client()
+
+    async def aclose(self) -> None:
+        """
+        Close the HTTP client, if it was created by this instance.
+        """
+        if self._owns_http_client and self._http_client is not None:
+            await self._http_client.close()
+            self._http_client = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.aclose()
@@ -0,0 +1,192 @@
+import asyncio
+import bisect
+import functools
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("instrumentation", "stage", "started_at")
+
+    def __init__(self, instrumentation: "Instrumentation", stage: str):
+        self.instrumentation = instrumentation
+        self.stage = stage
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.instrumentation.observe(
+            self.stage, time.perf_counter() - self.started_at
+        )
+        return False
+
+
+class Instrumentation:
+    """
+    Receives the duration of each stage of the SEP classes (ex:
+    ``sep10.load_account``). This base class discards them; subclasses
+    set `enabled` and implement :meth:`observe`. When `enabled` is False,
+    the stages aren't timed at all.
+    """
+
+    enabled: bool = False
+
+    def observe(self, stage: str, seconds: float) -> None:
+        pass
+
+    def timer(self, stage: str):
+        """
+        Context manager timing the code it wraps as `stage`
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, stage)
+
+
+class LoggingInstrumentation(Instrumentation):
+    """
+    Logs the duration of each stage
+    """
+
+    enabled = True
+
+    def __init__(self, level: int = logging.DEBUG):
+        self.level = level
+
+    def observe(self, stage: str, seconds: float) -> None:
+        logger.log(self.level, f"{stage} took {seconds * 1000:.2f}ms")
+
+
+class HistogramInstrumentation(Instrumentation):
+    """
+    Keeps an in-memory histogram of the durations of each stage, which can
+    be exported in the Prometheus text format with :meth:`render`.
+    """
+
+    enabled = True
+
+    def __init__(
+        self,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        metric_name: str = "fawaris_stage_duration_seconds",
+    ):
+        self.buckets = sorted(buckets)
+        self.metric_name = metric_name
+        self._counts: Dict[str, List[int]] = {}
+        self._sums: Dict[str, float] = {}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        counts = self._counts.get(stage)
+        if counts is None:
+            # the last position counts the observations above every bucket
+            counts = self._counts[stage] = [0] * (len(self.buckets) + 1)
+            self._sums[stage] = 0.0
+        counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self._sums[stage] += seconds
+
+    def count(self, stage: str) -> int:
+        return sum(self._counts.get(stage, ()))
+
+    def quantile(self, stage: str, q: float) -> Optional[float]:
+        """
+        Upper bound of the bucket holding the `q` quantile (0 < q <= 1) of
+        the stage durations, or None if there are no observations. Returns
+        infinity if it's above the largest bucket.
+        """
+        counts = self._counts.get(stage)
+        if not counts:
+            return None
+        rank = q * sum(counts)
+        cumulative = 0
+        for bucket, count in zip(self.buckets, counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bucket
+        return float("inf")
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.metric_name} Duration of the fawaris stages",
+            f"# TYPE {self.metric_name} histogram",
+        ]
+        for stage in sorted(self._counts):
+            counts = self._counts[stage]
+            cumulative = 0
+            for bucket, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(
+                    f'{self.metric_name}_bucket{{stage="{stage}",le="{bucket}"}} {cumulative}'
+                )
+            cumulative += counts[-1]
+            lines.append(
+                f'{self.metric_name}_bucket{{stage="{stage}",le="+Inf"}} {cumulative}'
+            )
+            lines.append(f'{self.metric_name}_sum{{stage="{stage}"}} {self._sums[stage]}')
+            lines.append(f'{self.metric_name}_count{{stage="{stage}"}} {cumulative}')
+        return "\n".join(lines) + "\n"
+
+
+def timed(stage: str) -> Callable:
+    """
+    Decorator timing a method as `stage` with the `instrumentation` attribute
+    of its instance
+    """
+
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def wrapper(self, *args, **kwargs):
+                instrumentation = self.instrumentation
+                if not instrumentation.enabled:
+                    return await fn(self, *args, **kwargs)
+                started_at = time.perf_counter()
+                try:
+                    return await fn(self, *args, **kwargs)
+                finally:
+                    instrumentation.observe(stage, time.perf_counter() - started_at)
+
+        else:
+
+            @functools.wraps(fn)
+            def wrapper(self, *args, **kwargs):
+                with self.instrumentation.timer(stage):
+                    return fn(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
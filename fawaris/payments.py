@@ -0,0 +1,301 @@
+import base64
+import binascii
+import struct
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from xdrlib import Unpacker
+
+from stellar_sdk import MuxedAccount
+from stellar_sdk.strkey import StrKey
+from stellar_sdk.xdr import OperationBody, TransactionResult, TransactionResultCode
+from stellar_sdk.xdr import OperationResult as XdrOperationResult
+from stellar_sdk.xdr.utils import from_xdr_amount
+
+_ONE = 10 ** 7
+_INT32 = struct.Struct(">i")
+_UINT32 = struct.Struct(">I")
+_INT64 = struct.Struct(">q")
+_UINT64 = struct.Struct(">Q")
+
+_ENVELOPE_TYPE_TX_V0 = 0
+_ENVELOPE_TYPE_TX = 2
+_ENVELOPE_TYPE_TX_FEE_BUMP = 5
+_KEY_TYPE_MUXED_ED25519 = 0x100
+_ASSET_TYPE_NATIVE = 0
+_ASSET_TYPE_CREDIT_ALPHANUM4 = 1
+_PRECOND_NONE = 0
+_PRECOND_TIME = 1
+_SIGNER_KEY_TYPE_ED25519_SIGNED_PAYLOAD = 3
+_MEMO_TEXT = 1
+_MEMO_ID = 2
+_PAYMENT = 1
+_PATH_PAYMENT_STRICT_RECEIVE = 2
+_PATH_PAYMENT_STRICT_SEND = 13
+_VERSION_BYTE_ACCOUNT_ID = b"\x30"
+_HORIZON_PAYMENT_TYPES = frozenset(
+    ["payment", "path_payment_strict_send", "path_payment_strict_receive"]
+)
+
+# (ed25519 key, muxed id or None)
+_Account = Tuple[bytes, Optional[int]]
+# (code, issuer ed25519 key), code is empty for the native asset
+_Asset = Tuple[bytes, Optional[bytes]]
+
+
+class PaymentOperation(NamedTuple):
+    """
+    Payment, path payment strict send or path payment strict receive
+    operation of a Stellar transaction, with the amount and asset received
+    by the destination
+    """
+
+    index: int
+    # muxed address (M...) if the source is muxed
+    source: str
+    destination: str
+    amount: str
+    code: str
+    issuer: Optional[str]
+
+
+class _XdrReader:
+    __slots__ = ("data", "position")
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.position = 0
+
+    def _unpack(self, fmt: struct.Struct) -> int:
+        value = fmt.unpack_from(self.data, self.position)[0]
+        self.position += fmt.size
+        return value
+
+    def int32(self) -> int:
+        return self._unpack(_INT32)
+
+    def uint32(self) -> int:
+        return self._unpack(_UINT32)
+
+    def int64(self) -> int:
+        return self._unpack(_INT64)
+
+    def uint64(self) -> int:
+        return self._unpack(_UINT64)
+
+    def opaque(self, size: int) -> bytes:
+        value = self.data[self.position : self.position + size]
+        if len(value) != size:
+            raise ValueError("unexpected end of XDR data")
+        # opaque data is padded to a multiple of 4 bytes
+        self.position += (size + 3) & ~3
+        return value
+
+    def var_opaque(self) -> bytes:
+        return self.opaque(self.uint32())
+
+    def skip(self, size: int) -> None:
+        self.position += size
+
+    def account(self) -> _Account:
+        # MuxedAccount
+        if self.int32() == _KEY_TYPE_MUXED_ED25519:
+            muxed_id = self.uint64()
+            return self.opaque(32), muxed_id
+        return self.opaque(32), None
+
+    def asset(self) -> _Asset:
+        asset_type = self.int32()
+        if asset_type == _ASSET_TYPE_NATIVE:
+            return b"", None
+        code = self.opaque(4 if asset_type == _ASSET_TYPE_CREDIT_ALPHANUM4 else 12)
+        # AccountID, whose only type is ed25519
+        self.skip(4)
+        return code, self.opaque(32)
+
+    def skip_path(self) -> None:
+        for _ in range(self.uint32()):
+            self.asset()
+
+
+def iter_payment_operations(
+    envelope_xdr: str, result_xdr: str, destination: Optional[str] = None
+) -> Iterator[PaymentOperation]:
+    """
+    Yield the payment operations of a successful transaction.
+
+    The envelope XDR is walked once, without building objects for the
+    operations that aren't payments to `destination`, and the result XDR is
+    only decoded if the amount received by a path payment strict send
+    operation is needed. Fee bump transactions are supported.
+
+    :param envelope_xdr: Base64 XDR of the transaction envelope
+    :param result_xdr: Base64 XDR of the transaction result
+    :param destination: If set, only the payments to this account (or to
+        muxed accounts of it) are returned
+    """
+    destination_key = _decode_account_id(destination) if destination else None
+    reader = _XdrReader(base64.b64decode(envelope_xdr))
+    envelope_type = reader.int32()
+    if envelope_type == _ENVELOPE_TYPE_TX_FEE_BUMP:
+        # fee source, fee and type of the inner transaction
+        reader.account()
+        reader.skip(12)
+        envelope_type = _ENVELOPE_TYPE_TX
+    if envelope_type == _ENVELOPE_TYPE_TX_V0:
+        tx_source: _Account = (reader.opaque(32), None)
+        # fee, sequence number and optional time bounds
+        reader.skip(12)
+        if reader.uint32():
+            reader.skip(16)
+    elif envelope_type == _ENVELOPE_TYPE_TX:
+        tx_source = reader.account()
+        reader.skip(12)
+        _skip_preconditions(reader)
+    else:
+        raise ValueError(f"unexpected envelope type: {envelope_type}")
+    _skip_memo(reader)
+
+    results: Optional[List[XdrOperationResult]] = None
+    for index in range(reader.uint32()):
+        source = reader.account() if reader.uint32() else tx_source
+        start = reader.position
+        op_type = reader.int32()
+        if op_type == _PAYMENT:
+            op_destination = reader.account()
+            asset = reader.asset()
+            amount = reader.int64()
+        elif op_type == _PATH_PAYMENT_STRICT_RECEIVE:
+            reader.asset()
+            reader.skip(8)
+            op_destination = reader.account()
+            asset = reader.asset()
+            amount = reader.int64()
+            reader.skip_path()
+        elif op_type == _PATH_PAYMENT_STRICT_SEND:
+            reader.asset()
+            reader.skip(8)
+            op_destination = reader.account()
+            asset = reader.asset()
+            # the minimum amount, the amount received is only in the result
+            reader.skip(8)
+            reader.skip_path()
+            amount = None
+        else:
+            # let the SDK skip the operations that aren't payments
+            unpacker = Unpacker(reader.data)
+            unpacker.set_position(start)
+            OperationBody.unpack(unpacker)
+            reader.position = unpacker.get_position()
+            continue
+        if destination_key is not None and op_destination[0] != destination_key:
+            continue
+        if amount is None:
+            if results is None:
+                results = _operation_results(TransactionResult.from_xdr(result_xdr))
+            strict_send_result = results[index].tr.path_payment_strict_send_result
+            amount = strict_send_result.success.last.amount.int64
+        code, issuer = asset
+        yield PaymentOperation(
+            index=index,
+            source=_address(source),
+            destination=_encode_account_id(op_destination[0]),
+            amount=from_xdr_amount(amount),
+            # same as stellar_sdk.Asset.native()
+            code=code.rstrip(b"\0").decode() if code else "XLM",
+            issuer=_encode_account_id(issuer) if issuer else None,
+        )
+
+
+def payment_from_horizon_record(
+    record: Dict[str, Any]
+) -> Optional[PaymentOperation]:
+    """
+    Build a :class:`PaymentOperation` from a record of the Horizon payments
+    endpoints, or return None if it isn't a payment or path payment. The
+    amount is formatted like :func:`iter_payment_operations` does.
+    """
+    if record.get("type") not in _HORIZON_PAYMENT_TYPES:
+        return None
+    native = record.get("asset_type") == "native"
+    return PaymentOperation(
+        # the low 12 bits of an operation id are its 1-based index
+        index=(int(record["id"]) & 0xFFF) - 1,
+        source=record.get("from_muxed") or record["from"],
+        destination=record["to"],
+        amount=_format_amount(record["amount"]),
+        code="XLM" if native else record["asset_code"],
+        issuer=None if native else record["asset_issuer"],
+    )
+
+
+def _format_amount(amount: str) -> str:
+    # Horizon formats amounts with 7 decimal places, "10.0000000", while
+    # from_xdr_amount gives "10"
+    return str(Decimal(int(Decimal(amount) * _ONE)) / _ONE)
+
+
+def _skip_preconditions(reader: _XdrReader) -> None:
+    precondition_type = reader.int32()
+    if precondition_type == _PRECOND_NONE:
+        return
+    if precondition_type == _PRECOND_TIME:
+        reader.skip(16)
+        return
+    # PreconditionsV2: optional time bounds, optional ledger bounds, optional
+    # minimum sequence number, minimum sequence age and ledger gap, and
+    # extra signers
+    if reader.uint32():
+        reader.skip(16)
+    if reader.uint32():
+        reader.skip(8)
+    if reader.uint32():
+        reader.skip(8)
+    reader.skip(12)
+    for _ in range(reader.uint32()):
+        signer_type = reader.int32()
+        reader.skip(32)
+        if signer_type == _SIGNER_KEY_TYPE_ED25519_SIGNED_PAYLOAD:
+            reader.var_opaque()
+
+
+def _skip_memo(reader: _XdrReader) -> None:
+    memo_type = reader.int32()
+    if memo_type == _MEMO_TEXT:
+        reader.var_opaque()
+    elif memo_type == _MEMO_ID:
+        reader.skip(8)
+    elif memo_type:
+        # hash or return hash
+        reader.skip(32)
+
+
+def _operation_results(result: TransactionResult) -> List[XdrOperationResult]:
+    result = result.result
+    if result.code == TransactionResultCode.txFEE_BUMP_INNER_SUCCESS:
+        result = result.inner_result_pair.result.result
+    elif result.code != TransactionResultCode.txSUCCESS:
+        return []
+    return result.results
+
+
+@lru_cache(maxsize=4096)
+def _encode_account_id(key: bytes) -> str:
+    # same as StrKey.encode_ed25519_public_key, which is much slower because
+    # of its runtime type checks. StrKey checksums are CRC16-XModem
+    payload = _VERSION_BYTE_ACCOUNT_ID + key
+    checksum = struct.pack("<H", binascii.crc_hqx(payload, 0))
+    return base64.b32encode(payload + checksum).decode()
+
+
+@lru_cache(maxsize=4096)
+def _decode_account_id(account_id: str) -> bytes:
+    return StrKey.decode_ed25519_public_key(account_id)
+
+
+def _address(account: _Account) -> str:
+    key, muxed_id = account
+    account_id = _encode_account_id(key)
+    if muxed_id is None:
+        return account_id
+    return MuxedAccount(account_id, muxed_id).account_muxed
@@ -0,0 +1,135 @@
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, NamedTuple, Optional, Tuple
+
+from fawaris.exceptions import Sep10RateLimitExceeded
+
+
+class RateLimit(NamedTuple):
+    """
+    Token bucket refilled with `rate` tokens per second, holding up to
+    `burst` tokens. Each request takes one token.
+    """
+
+    rate: float
+    burst: int
+
+
+class RateLimitStore(ABC):
+    """
+    Storage of the token buckets. Implement it on top of a shared store
+    (ex: Redis) to enforce the limits across multiple nodes.
+    """
+
+    @abstractmethod
+    async def consume(self, key: str, limit: RateLimit) -> bool:
+        """
+        Take one token from the bucket of `key`, returning False if the
+        bucket is empty. Must be atomic.
+        """
+        raise NotImplementedError()
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    """
+    Process-local :class:`RateLimitStore`. The least recently used buckets
+    are dropped when there are more than `max_keys`, which is the same as
+    refilling them.
+    """
+
+    def __init__(
+        self, max_keys: int = 100000, clock: Callable[[], float] = time.monotonic
+    ):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def consume(self, key: str, limit: RateLimit) -> bool:
+        now = self.clock()
+        tokens, updated_at = self._buckets.pop(key, (limit.burst, now))
+        tokens = min(limit.burst, tokens + (now - updated_at) * limit.rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return allowed
+
+
+class Sep10AdmissionControl:
+    """
+    Rate limits for the SEP-10 endpoints, keyed by client account,
+    client_domain and home_domain, plus a cap on the concurrent stellar.toml
+    fetches for the same client_domain.
+
+    Rejected requests raise :exc:`Sep10RateLimitExceeded`, which framework
+    integrations should map to HTTP 429.
+    """
+
+    def __init__(
+        self,
+        account_limit: Optional[RateLimit] = None,
+        client_domain_limit: Optional[RateLimit] = None,
+        home_domain_limit: Optional[RateLimit] = None,
+        max_client_domain_fetches: Optional[int] = None,
+        store: Optional[RateLimitStore] = None,
+    ):
+        """
+        :param account_limit: Limit per client account
+        :param client_domain_limit: Limit per client_domain
+        :param home_domain_limit: Limit per home_domain
+        :param max_client_domain_fetches: Maximum number of concurrent
+            stellar.toml fetches for the same client_domain. The count is
+            local to the process
+        :param store: Where the token buckets are kept, defaults to a
+            :class:`MemoryRateLimitStore`
+        """
+        self.account_limit = account_limit
+        self.client_domain_limit = client_domain_limit
+        self.home_domain_limit = home_domain_limit
+        self.max_client_domain_fetches = max_client_domain_fetches
+        self.store = store or MemoryRateLimitStore()
+        self._client_domain_fetches: Dict[str, int] = {}
+
+    async def admit(
+        self,
+        account: Optional[str] = None,
+        client_domain: Optional[str] = None,
+        home_domain: Optional[str] = None,
+    ) -> None:
+        """
+        :raises: :exc:`Sep10RateLimitExceeded` if any of the limits is exceeded
+        """
+        for scope, key, limit in (
+            ("account", account, self.account_limit),
+            ("client_domain", client_domain, self.client_domain_limit),
+            ("home_domain", home_domain, self.home_domain_limit),
+        ):
+            if key and limit and not await self.store.consume(f"{scope}:{key}", limit):
+                raise Sep10RateLimitExceeded(f"rate limit exceeded for {scope} {key}")
+
+    @asynccontextmanager
+    async def client_domain_fetch(self, client_domain: str) -> AsyncIterator[None]:
+        """
+        Hold one of the concurrent fetch slots of `client_domain`.
+
+        :raises: :exc:`Sep10RateLimitExceeded` if all slots are taken
+        """
+        if self.max_client_domain_fetches is None:
+            yield
+            return
+        fetches = self._client_domain_fetches.get(client_domain, 0)
+        if fetches >= self.max_client_domain_fetches:
+            raise Sep10RateLimitExceeded(
+                f"too many concurrent requests for client_domain {client_domain}"
+            )
+        self._client_domain_fetches[client_domain] = fetches + 1
+        try:
+            yield
+        finally:
+            fetches = self._client_domain_fetches.pop(client_domain) - 1
+            if fetches:
+                self._client_domain_fetches[client_domain] = fetches
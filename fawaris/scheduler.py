@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledTask:
+    """
+    A coroutine function run periodically by :class:`TaskScheduler`
+    """
+
+    name: str
+    fn: Callable[[], Awaitable[Any]]
+    interval: float
+    jitter: float
+    max_backoff: float
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[], Awaitable[Any]],
+        interval: float,
+        jitter: float = 0,
+        max_backoff: Optional[float] = None,
+    ):
+        """
+        :param name: Name used in logs and stats
+        :param fn: Coroutine function to run
+        :param interval: Seconds between the start of two runs
+        :param jitter: Up to this many seconds are randomly added to each
+            interval, so that tasks of multiple workers don't run in lockstep
+        :param max_backoff: Maximum seconds between runs after repeated
+            failures, defaults to 10 times `interval`
+        """
+        if interval <= 0:
+            raise ValueError("'interval' must be positive")
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.jitter = jitter
+        self.max_backoff = max_backoff if max_backoff is not None else interval * 10
+        self.runs = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.skipped_ticks = 0
+        self.last_duration: Optional[float] = None
+        self.last_lag: Optional[float] = None
+        self.last_error: Optional[BaseException] = None
+
+    def next_delay(self) -> float:
+        if self.consecutive_failures:
+            delay = min(
+                self.interval * 2 ** self.consecutive_failures, self.max_backoff
+            )
+        else:
+            delay = self.interval
+        return delay + random.uniform(0, self.jitter)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "skipped_ticks": self.skipped_ticks,
+            "last_duration": self.last_duration,
+            "last_lag": self.last_lag,
+        }
+
+
+class TaskScheduler:
+    """
+    Runs :class:`ScheduledTask` objects periodically until :meth:`stop` is
+    called.
+
+    A task never overlaps with itself: if a run is still going when the next
+    one is due, that tick is skipped. After a failed run, the interval
+    doubles for each consecutive failure, up to the task `max_backoff`.
+    """
+
+    tasks: List[ScheduledTask]
+
+    def __init__(self, tasks: List[ScheduledTask]):
+        self.tasks = tasks
+        self._stopping: Optional[asyncio.Event] = None
+        self._running: Dict[str, "asyncio.Future[Any]"] = {}
+
+    async def run(self) -> None:
+        """
+        Run the tasks until :meth:`stop` is called. Runs in progress are
+        waited for before returning.
+        """
+        self._stopping = asyncio.Event()
+        try:
+            await asyncio.gather(*[self._schedule(task) for task in self.tasks])
+        finally:
+            running = [f for f in self._running.values() if not f.done()]
+            if running:
+                await asyncio.wait(running)
+
+    def stop(self) -> None:
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def _schedule(self, task: ScheduledTask) -> None:
+        loop = asyncio.get_running_loop()
+        due_at = loop.time()
+        while not self._stopping.is_set():
+            started_at = loop.time()
+            task.last_lag = started_at - due_at
+            running = asyncio.ensure_future(self._run(task))
+            self._running[task.name] = running
+            # the ticks due while the run is still going are skipped
+            tick_at = started_at + task.interval
+            while not self._stopping.is_set():
+                await self._wait_run(running, timeout=max(0, tick_at - loop.time()))
+                if running.done():
+                    break
+                task.skipped_ticks += 1
+                logger.debug(f"skipping {task.name}, previous run still going")
+                tick_at += task.interval
+            # computed once the run is done, so that a failed run backs off
+            # the next one
+            due_at = started_at + task.next_delay()
+            try:
+                await asyncio.wait_for(
+                    self._stopping.wait(), timeout=max(0, due_at - loop.time())
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    async def _wait_run(self, running: "asyncio.Future[Any]", timeout: float) -> None:
+        # wait until the run is done, `stop` is called or `timeout` expires
+        stopping = asyncio.ensure_future(self._stopping.wait())
+        try:
+            await asyncio.wait(
+                [running, stopping],
+                timeout=timeout,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+        finally:
+            stopping.cancel()
+
+    async def _run(self, task: ScheduledTask) -> None:
+        started_at = time.monotonic()
+        try:
+            await task.fn()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            task.failures += 1
+            task.consecutive_failures += 1
+            task.last_error = e
+            logger.exception(f"{task.name} failed")
+        else:
+            task.consecutive_failures = 0
+        finally:
+            task.runs += 1
+            task.last_duration = time.monotonic() - started_at
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {task.name: task.stats() for task in self.tasks}
@@ -1,28 +1,31 @@
-from typing import Optional, List, Dict, Union, Iterable, Callable, Any
+from typing import Optional, List, Dict, Union, Iterable, Callable, Any, Tuple
 from urllib.parse import urlparse
+import asyncio
 from datetime import datetime, timezone
 import logging
 import os
 import os.path
+import time
 
 import jwt
 from jwt import decode
 from jwt.exceptions import InvalidTokenError
 import toml
 from stellar_sdk.sep.stellar_web_authentication import (
+    ChallengeTransaction,
     build_challenge_transaction,
     read_challenge_transaction,
-    verify_challenge_transaction_threshold,
-    verify_challenge_transaction_signed_by_client_master_key,
 )
 from stellar_sdk.operation import ManageData
-from stellar_sdk import ServerAsync, Keypair, MuxedAccount
-from stellar_sdk.sep.stellar_toml import fetch_stellar_toml
+from stellar_sdk import ServerAsync, Keypair
+from stellar_sdk.sep.stellar_toml import fetch_stellar_toml_async
+from stellar_sdk.sep.ed25519_public_key_signer import Ed25519PublicKeySigner
 from stellar_sdk.sep.exceptions import (
     InvalidSep10ChallengeError,
     StellarTomlNotFoundError,
 )
 from stellar_sdk.exceptions import (
+    BadSignatureError,
     NotFoundError,
     ConnectionError,
     Ed25519PublicKeyInvalidError,
@@ -30,7 +33,7 @@ from stellar_sdk.exceptions import (
     MuxedEd25519AccountInvalidError,
     ValueError as StellarSdkValueError,
 )
-from stellar_sdk.client.aiohttp_client import AiohttpClient
+from stellar_sdk.client.base_async_client import BaseAsyncClient
 from stellar_sdk.strkey import StrKey
 
 from fawaris.models import (
@@ -40,10 +43,211 @@ from fawaris.models import (
     Sep10PostResponse,
 )
 from fawaris.exceptions import Sep10InvalidToken
+from fawaris.ratelimit import Sep10AdmissionControl
+from fawaris.cache import AsyncCache, LRUCache
+from fawaris.http_client import HttpClientMixin
+from fawaris.executor import CryptoExecutor
+from fawaris.domains import DomainPolicy, is_valid_hostname
+from fawaris.instrumentation import Instrumentation, timed
 
 logger = logging.getLogger(__name__)
 
-class Sep10:
+# Horizon effect types that change the signers or thresholds of an account
+ACCOUNT_SIGNERS_EFFECT_TYPES = frozenset(
+    [
+        "account_created",
+        "account_removed",
+        "account_thresholds_updated",
+        "signer_created",
+        "signer_removed",
+        "signer_updated",
+    ]
+)
+
+class Sep10Challenge:
+    """
+    A challenge transaction read by :func:`read_challenge_transaction`.
+
+    Holds everything needed to verify the challenge signatures and to
+    generate the JWT, so that the challenge XDR is decoded only once per
+    request.
+    """
+
+    __slots__ = (
+        "envelope",
+        "client_account_id",
+        "account_id",
+        "memo",
+        "home_domain",
+        "client_domain",
+        "client_domain_account_id",
+        "min_time",
+        "max_time",
+        "hash",
+    )
+
+    def __init__(self, challenge: ChallengeTransaction):
+        envelope = challenge.transaction
+        transaction = envelope.transaction
+        self.envelope = envelope
+        # G... or M... address
+        self.client_account_id = challenge.client_account_id
+        # Stellar account of client_account_id, used to load its signers
+        self.account_id = transaction.operations[0].source.account_id
+        self.memo = challenge.memo
+        self.home_domain = challenge.matched_home_domain
+        self.client_domain = None
+        self.client_domain_account_id = None
+        for operation in transaction.operations:
+            if (
+                isinstance(operation, ManageData)
+                and operation.data_name == "client_domain"
+            ):
+                self.client_domain = operation.data_value.decode()
+                self.client_domain_account_id = operation.source.account_id
+                break
+        self.min_time = transaction.time_bounds.min_time
+        self.max_time = transaction.time_bounds.max_time
+        self.hash = envelope.hash()
+
+    @classmethod
+    def read(
+        cls,
+        challenge_transaction: str,
+        server_account_id: str,
+        home_domains: Union[str, Iterable[str]],
+        web_auth_domain: str,
+        network_passphrase: str,
+    ) -> "Sep10Challenge":
+        return cls(
+            read_challenge_transaction(
+                challenge_transaction=challenge_transaction,
+                server_account_id=server_account_id,
+                home_domains=home_domains,
+                web_auth_domain=web_auth_domain,
+                network_passphrase=network_passphrase,
+            )
+        )
+
+    def verify(
+        self,
+        server_account_id: str,
+        signers: Optional[List[Ed25519PublicKeySigner]],
+        threshold: Optional[int],
+    ) -> List[Ed25519PublicKeySigner]:
+        """
+        Verify the challenge signatures against the signers of the client
+        account, or against its master key if `signers` is None (the account
+        doesn't exist). Returns the client signers found.
+        """
+        if signers is None:
+            self.verify_signed_by_client_master_key(server_account_id)
+            return [Ed25519PublicKeySigner(self.account_id, 255)]
+        return self.verify_threshold(server_account_id, threshold, signers)
+
+    def verify_signed_by_client_master_key(self, server_account_id: str) -> None:
+        """
+        Verify the challenge of an account that doesn't exist, which can only
+        be signed by the account's master key.
+        """
+        self.verify_signers(
+            server_account_id, [Ed25519PublicKeySigner(self.account_id, 255)]
+        )
+        expected_signatures = 3 if self.client_domain else 2
+        if len(self.envelope.signatures) != expected_signatures:
+            raise InvalidSep10ChallengeError(
+                "There is more than one client signer on a challenge "
+                "transaction for an account that doesn't exist"
+            )
+
+    def verify_threshold(
+        self,
+        server_account_id: str,
+        threshold: int,
+        signers: List[Ed25519PublicKeySigner],
+    ) -> List[Ed25519PublicKeySigner]:
+        signers_found = self.verify_signers(server_account_id, signers)
+        weight = sum(signer.weight for signer in signers_found)
+        if weight < threshold:
+            raise InvalidSep10ChallengeError(
+                f"signers with weight {weight} do not meet threshold {threshold}."
+            )
+        return signers_found
+
+    def verify_signers(
+        self, server_account_id: str, signers: List[Ed25519PublicKeySigner]
+    ) -> List[Ed25519PublicKeySigner]:
+        """
+        Same as :func:`stellar_sdk.sep.stellar_web_authentication.verify_challenge_transaction_signers`,
+        without decoding the challenge again.
+        """
+        if not signers:
+            raise InvalidSep10ChallengeError("No signers provided.")
+
+        # the server must not play a part in the authentication of the client
+        all_signers = [s for s in signers if s.account_id != server_account_id]
+        all_signers.append(Ed25519PublicKeySigner(server_account_id))
+        if self.client_domain_account_id:
+            all_signers.append(Ed25519PublicKeySigner(self.client_domain_account_id))
+        all_signers_found = self._verify_signatures(all_signers)
+
+        signers_found = []
+        found_account_ids = set()
+        server_signer_found = False
+        client_domain_signer_found = False
+        for signer in all_signers_found:
+            if signer.account_id == server_account_id:
+                server_signer_found = True
+            elif signer.account_id == self.client_domain_account_id:
+                client_domain_signer_found = True
+            elif signer.account_id not in found_account_ids:
+                found_account_ids.add(signer.account_id)
+                signers_found.append(signer)
+
+        if not server_signer_found:
+            raise InvalidSep10ChallengeError(
+                f"Transaction not signed by server: {server_account_id}."
+            )
+        if self.client_domain_account_id and not client_domain_signer_found:
+            raise InvalidSep10ChallengeError(
+                "Transaction not signed by the source account of the "
+                "'client_domain' ManageData operation"
+            )
+        if not signers_found:
+            raise InvalidSep10ChallengeError(
+                "Transaction not signed by any client signer."
+            )
+        if len(all_signers_found) != len(self.envelope.signatures):
+            raise InvalidSep10ChallengeError("Transaction has unrecognized signatures.")
+        return signers_found
+
+    def _verify_signatures(
+        self, signers: List[Ed25519PublicKeySigner]
+    ) -> List[Ed25519PublicKeySigner]:
+        signatures = self.envelope.signatures
+        if not signatures:
+            raise InvalidSep10ChallengeError("Transaction has no signatures.")
+
+        signers_found = []
+        # prevent a signature from being used by more than one signer
+        signatures_used = set()
+        for signer in signers:
+            kp = Keypair.from_public_key(signer.account_id)
+            hint = kp.signature_hint()
+            for index, signature in enumerate(signatures):
+                if index in signatures_used or signature.signature_hint != hint:
+                    continue
+                try:
+                    kp.verify(self.hash, signature.signature)
+                except BadSignatureError:
+                    continue
+                signatures_used.add(index)
+                signers_found.append(signer)
+                break
+        return signers_found
+
+
+class Sep10(HttpClientMixin):
     host_url: str
     home_domains: Union[str, Iterable[str]]
     horizon_url: str
@@ -53,6 +257,11 @@ class Sep10:
     client_domain_required: bool
     client_domains_allowed: Optional[List[str]]
     client_domains_denied: Optional[List[str]]
+    client_signing_key_cache: Optional[AsyncCache]
+    account_signers_cache: Optional[AsyncCache]
+    executor: CryptoExecutor
+    admission_control: Optional[Sep10AdmissionControl]
+    instrumentation: Instrumentation
 
     server_account_id: str
     web_auth_domain: str
@@ -68,6 +277,12 @@ class Sep10:
         client_domain_required: bool = False,
         client_domains_allowed: Optional[List[str]] = None,
         client_domains_denied: Optional[List[str]] = None,
+        client_signing_key_cache: Optional[AsyncCache] = None,
+        account_signers_cache: Optional[AsyncCache] = None,
+        http_client: Optional[BaseAsyncClient] = None,
+        executor: Optional[CryptoExecutor] = None,
+        admission_control: Optional[Sep10AdmissionControl] = None,
+        instrumentation: Optional[Instrumentation] = None,
     ):
         """
         Implementation of `SEP0010 <https://github.com/stellar/stellar-protocol/blob/master/ecosystem/sep-0010.md>`_
@@ -86,17 +301,55 @@ class Sep10:
         :param client_domain_required: Require client_domain when building
             challenge transaction
         :param client_domains_allowed: List of allowed client_domain values.
+            Wildcards like ``*.wallet.example`` match any subdomain.
             If not set, any client_domain is accepted
         :param client_domains_denied: List of denied client_domain values.
+            Wildcards like ``*.wallet.example`` match any subdomain.
             If not set, any client_domain is accepted. If a client_domain is
             listed both here and in client_domains_allowed, it will be denied
+        :param client_signing_key_cache: Cache for the SIGNING_KEY values
+            fetched from the client_domain stellar.toml files, ex:
+            :class:`fawaris.cache.TTLCache`. If not set, the stellar.toml is
+            fetched on every request
+        :param account_signers_cache: Cache for the signers and medium
+            threshold of the client accounts, loaded from Horizon to verify
+            the challenge transactions. Accounts that don't exist are cached
+            as a :class:`stellar_sdk.exceptions.NotFoundError`, so a cache
+            only negatively caching that exception is recommended, ex:
+            ``TTLCache(ttl=30, negative_ttl=5, negative_exceptions=(NotFoundError,))``.
+            Use :meth:`invalidate_account` to evict an account when its
+            signers change. If not set, the account is loaded on every request
+        :param http_client: HTTP client used for the requests to Horizon and
+            to the client_domain stellar.toml files, ex:
+            :class:`fawaris.http_client.PooledAiohttpClient`. If not set, a
+            client is created on :meth:`start` (or first use) and closed on
+            :meth:`aclose`
+        :param executor: Where challenge transactions are built and verified,
+            ex: ``CryptoExecutor("thread")`` to keep the event loop
+            responsive under load. If not set, they run in the event loop.
+            The executor is not shut down by :meth:`aclose`
+        :param admission_control: Rate limits for :meth:`http_get` and
+            :meth:`http_post`, which raise
+            :exc:`fawaris.exceptions.Sep10RateLimitExceeded` when exceeded.
+            The concurrent client_domain fetch cap only applies without
+            `client_signing_key_cache`, since the cache already makes a
+            single fetch per client_domain at a time
+        :param instrumentation: Receives the duration of each stage of the
+            authentication, ex:
+            :class:`fawaris.instrumentation.HistogramInstrumentation`.
+            If not set, the stages are not timed
         """
         if not urlparse(host_url).netloc:
             raise ValueError(f"{host_url} is not a valid host_url")
         self.host_url = host_url
         self.web_auth_domain = urlparse(host_url).netloc
 
+        if not isinstance(home_domains, str):
+            home_domains = list(home_domains)
         self.home_domains = home_domains
+        self._home_domains = frozenset(
+            [home_domains] if isinstance(home_domains, str) else home_domains
+        )
         self.horizon_url = horizon_url
         self.network_passphrase = network_passphrase
 
@@ -111,7 +364,24 @@ class Sep10:
         self.client_domain_required = client_domain_required
         self.client_domains_allowed = client_domains_allowed
         self.client_domains_denied = client_domains_denied
-
+        self._client_domains_allowed = (
+            DomainPolicy(client_domains_allowed)
+            if client_domains_allowed is not None
+            else None
+        )
+        self._client_domains_denied = (
+            DomainPolicy(client_domains_denied)
+            if client_domains_denied is not None
+            else None
+        )
+        self.client_signing_key_cache = client_signing_key_cache
+        self.account_signers_cache = account_signers_cache
+        self.executor = executor or CryptoExecutor()
+        self.admission_control = admission_control
+        self.instrumentation = instrumentation or Instrumentation()
+        self._init_http_client(http_client)
+
+    @timed("sep10.http_get")
     async def http_get(
         self,
         request: Sep10GetRequest,
@@ -131,33 +401,42 @@ class Sep10:
         else:
             memo = None
 
-        if request.home_domain not in self.home_domains:
+        if request.home_domain not in self._home_domains:
             raise ValueError(
                 "invalid 'home_domain' value. Accepted values: " f"{self.home_domains}"
             )
 
-        if urlparse(f"https://{request.home_domain}").netloc != request.home_domain:
+        if not is_valid_hostname(request.home_domain):
             raise ValueError("'home_domain' must be a valid hostname")
 
         if request.client_domain:
-            if (
-                urlparse(f"https://{request.client_domain}").netloc
-                != request.client_domain
-            ):
+            if not is_valid_hostname(request.client_domain):
                 raise ValueError("'client_domain' must be a valid hostname")
 
             if (
-                self.client_domains_denied is not None
-                and request.client_domain in self.client_domains_denied
+                self._client_domains_denied is not None
+                and request.client_domain in self._client_domains_denied
             ):
                 raise ValueError("'client_domain' value is denied")
 
             if (
-                self.client_domains_allowed is not None
-                and request.client_domain not in self.client_domains_allowed
+                self._client_domains_allowed is not None
+                and request.client_domain not in self._client_domains_allowed
             ):
                 raise ValueError("'client_domain' value is not allowed")
+        elif self.client_domain_required:
+            raise ValueError("'client_domain' is required")
+
+        # after the request validation, so that rejected requests don't take
+        # tokens or create buckets
+        if self.admission_control is not None:
+            await self.admission_control.admit(
+                account=_rate_limit_account(request.account),
+                client_domain=request.client_domain,
+                home_domain=request.home_domain,
+            )
 
+        if request.client_domain:
             try:
                 client_signing_key = await self._get_client_signing_key(
                     request.client_domain
@@ -168,38 +447,111 @@ class Sep10:
                 toml.decoder.TomlDecodeError,
             ):
                 raise ValueError("unable to fetch 'client_domain' SIGNING_KEY")
-
         else:
-            if self.client_domain_required:
-                raise ValueError("'client_domain' is required")
-            client_domain = None
             client_signing_key = None
 
-        transaction = build_challenge_transaction(
-            server_secret=self.signing_secret,
-            client_account_id=request.account,
-            home_domain=request.home_domain,
-            web_auth_domain=self.web_auth_domain,
-            network_passphrase=self.network_passphrase,
-            timeout=timeout,
-            client_domain=request.client_domain,
-            client_signing_key=client_signing_key,
-            memo=memo,
-        )
+        with self.instrumentation.timer("sep10.build_challenge"):
+            transaction = await self.executor.run(
+                build_challenge_transaction,
+                server_secret=self.signing_secret,
+                client_account_id=request.account,
+                home_domain=request.home_domain,
+                web_auth_domain=self.web_auth_domain,
+                network_passphrase=self.network_passphrase,
+                timeout=timeout,
+                client_domain=request.client_domain,
+                client_signing_key=client_signing_key,
+                memo=memo,
+            )
         return Sep10GetResponse(
             transaction=transaction,
             network_passphrase=self.network_passphrase,
         )
 
+    @timed("sep10.http_post")
     async def http_post(self, request: Sep10PostRequest) -> Sep10PostResponse:
-        client_domain = await self._validate_challenge_xdr(request)
-        return Sep10PostResponse(token=self._generate_jwt(request, client_domain))
+        challenge = await self._validate_challenge_xdr(request)
+        return Sep10PostResponse(token=self._generate_jwt(challenge))
 
-    def _get_http_client(self, request_timeout=11):
-        return AiohttpClient(request_timeout=request_timeout)
+    @timed("sep10.http_post_batch")
+    async def http_post_batch(
+        self, requests: List[Sep10PostRequest], max_concurrency: int = 10
+    ) -> List[Union[Sep10PostResponse, Exception]]:
+        """
+        Verify many signed challenges at once, ex: to re-authenticate
+        accounts after a JWT secret rotation. The client accounts are loaded
+        from Horizon once each, with at most `max_concurrency` requests at
+        the same time.
+
+        Returns, in the same order as `requests`, a :class:`Sep10PostResponse`
+        for each challenge verified or the exception `http_post` would have
+        raised for it. Each challenge goes through `admission_control`, like
+        in `http_post`, before its account is loaded.
+        """
+        if max_concurrency < 1:
+            raise ValueError("'max_concurrency' must be a positive integer")
+
+        async def read_and_admit(request):
+            challenge = await self._read_challenge(request.transaction)
+            if self.admission_control is not None:
+                await self.admission_control.admit(
+                    account=challenge.account_id,
+                    client_domain=challenge.client_domain,
+                    home_domain=challenge.home_domain,
+                )
+            return challenge
 
+        challenges = await asyncio.gather(
+            *[read_and_admit(request) for request in requests],
+            return_exceptions=True,
+        )
+        account_ids = list(
+            set(c.account_id for c in challenges if isinstance(c, Sep10Challenge))
+        )
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def load_account_signers(account_id):
+            async with semaphore:
+                try:
+                    return await self._get_account_signers(account_id)
+                except NotFoundError:
+                    return None, None
+
+        account_signers = await asyncio.gather(
+            *[load_account_signers(account_id) for account_id in account_ids],
+            return_exceptions=True,
+        )
+        signers_by_account = dict(zip(account_ids, account_signers))
+
+        async def verify(challenge):
+            if isinstance(challenge, Exception):
+                raise challenge
+            signers = signers_by_account[challenge.account_id]
+            if isinstance(signers, Exception):
+                raise signers
+            await self._verify_challenge(challenge, *signers)
+            return Sep10PostResponse(token=self._generate_jwt(challenge))
+
+        return await asyncio.gather(
+            *[verify(challenge) for challenge in challenges],
+            return_exceptions=True,
+        )
+
+    @timed("sep10.client_signing_key")
     async def _get_client_signing_key(self, client_domain):
-        client_toml_contents = await fetch_stellar_toml(
+        if self.client_signing_key_cache is None:
+            if self.admission_control is not None:
+                async with self.admission_control.client_domain_fetch(client_domain):
+                    return await self._fetch_client_signing_key(client_domain)
+            return await self._fetch_client_signing_key(client_domain)
+        return await self.client_signing_key_cache.get_or_fetch(
+            client_domain, lambda: self._fetch_client_signing_key(client_domain)
+        )
+
+    @timed("sep10.fetch_stellar_toml")
+    async def _fetch_client_signing_key(self, client_domain):
+        logger.debug(f"Fetching SIGNING_KEY from {client_domain} stellar.toml")
+        client_toml_contents = await fetch_stellar_toml_async(
             client_domain,
             client=self._get_http_client(),
         )
@@ -212,11 +564,12 @@ class Sep10:
             raise ValueError("invalid SIGNING_KEY value on 'client_domain' TOML")
         return client_signing_key
 
-    async def _validate_challenge_xdr(self, request: Sep10GetRequest):
-        logger.debug("Validating challenge transaction")
+    @timed("sep10.read_challenge")
+    async def _read_challenge(self, challenge_transaction: str) -> Sep10Challenge:
         try:
-            challenge = read_challenge_transaction(
-                challenge_transaction=request.transaction,
+            return await self.executor.run(
+                Sep10Challenge.read,
+                challenge_transaction=challenge_transaction,
                 server_account_id=self.server_account_id,
                 home_domains=self.home_domains,
                 web_auth_domain=self.web_auth_domain,
@@ -225,85 +578,99 @@ class Sep10:
         except (InvalidSep10ChallengeError, TypeError) as e:
             raise ValueError(e)
 
-        client_domain = None
-        for operation in challenge.transaction.transaction.operations:
-            if (
-                isinstance(operation, ManageData)
-                and operation.data_name == "client_domain"
-            ):
-                client_domain = operation.data_value.decode()
-                break
-
-        # extract the Stellar account from the muxed account to check for its existence
-        stellar_account = challenge.client_account_id
-        if challenge.client_account_id.startswith("M"):
-            stellar_account = MuxedAccount.from_account(
-                challenge.client_account_id
-            ).account_id
-
+    @timed("sep10.validate_challenge")
+    async def _validate_challenge_xdr(
+        self, request: Sep10PostRequest
+    ) -> Sep10Challenge:
+        logger.debug("Validating challenge transaction")
+        challenge = await self._read_challenge(request.transaction)
+        if self.admission_control is not None:
+            await self.admission_control.admit(
+                account=challenge.account_id,
+                client_domain=challenge.client_domain,
+                home_domain=challenge.home_domain,
+            )
         try:
-            async with ServerAsync(
-                horizon_url=self.horizon_url, client=self._get_http_client()
-            ) as server:
-                account = await server.load_account(stellar_account)
+            signers, threshold = await self._get_account_signers(
+                challenge.account_id
+            )
         except NotFoundError:
             logger.debug("Account does not exist, using client's master key to verify")
-            try:
-                verify_challenge_transaction_signed_by_client_master_key(
-                    challenge_transaction=request.transaction,
-                    server_account_id=self.server_account_id,
-                    home_domains=self.home_domains,
-                    web_auth_domain=self.web_auth_domain,
-                    network_passphrase=self.network_passphrase,
-                )
-                if (client_domain and len(challenge.transaction.signatures) != 3) or (
-                    not client_domain and len(challenge.transaction.signatures) != 2
-                ):
-                    raise InvalidSep10ChallengeError(
-                        "There is more than one client signer on a challenge "
-                        "transaction for an account that doesn't exist"
-                    )
-            except InvalidSep10ChallengeError as e:
-                raise ValueError(
-                    f"Missing or invalid signature(s) for {challenge.client_account_id}: {str(e)}"
-                )
-            else:
-                logger.debug("Challenge verified using client's master key")
-                return client_domain
-
-        signers = account.load_ed25519_public_key_signers()
-        threshold = account.thresholds.med_threshold
-        signers_found = verify_challenge_transaction_threshold(
-            challenge_transaction=request.transaction,
-            server_account_id=self.server_account_id,
-            home_domains=self.home_domains,
-            web_auth_domain=self.web_auth_domain,
-            network_passphrase=self.network_passphrase,
-            threshold=threshold,
-            signers=signers,
-        )
+            signers, threshold = None, None
+        await self._verify_challenge(challenge, signers, threshold)
+        return challenge
+
+    @timed("sep10.verify_challenge")
+    async def _verify_challenge(
+        self,
+        challenge: Sep10Challenge,
+        signers: Optional[List[Ed25519PublicKeySigner]],
+        threshold: Optional[int],
+    ) -> None:
+        try:
+            signers_found = await self.executor.run(
+                challenge.verify, self.server_account_id, signers, threshold
+            )
+        except InvalidSep10ChallengeError as e:
+            raise ValueError(
+                f"Missing or invalid signature(s) for {challenge.client_account_id}: {str(e)}"
+            )
         logger.debug(
-            f"Challenge verified using account signers: {[s.account_id for s in signers_found]}"
+            f"Challenge verified using signers: {[s.account_id for s in signers_found]}"
         )
 
-        return client_domain
+    @timed("sep10.load_account")
+    async def _get_account_signers(
+        self, account_id: str
+    ) -> Tuple[List[Ed25519PublicKeySigner], int]:
+        if self.account_signers_cache is None:
+            return await self._load_account_signers(account_id)
+        return await self.account_signers_cache.get_or_fetch(
+            account_id, lambda: self._load_account_signers(account_id)
+        )
 
-    def _generate_jwt(
-        self, request: Sep10PostRequest, client_domain: str = None
-    ) -> str:
-        challenge = read_challenge_transaction(
-            challenge_transaction=request.transaction,
-            server_account_id=self.server_account_id,
-            home_domains=self.home_domains,
-            web_auth_domain=self.web_auth_domain,
-            network_passphrase=self.network_passphrase,
+    async def _load_account_signers(
+        self, account_id: str
+    ) -> Tuple[List[Ed25519PublicKeySigner], int]:
+        server = ServerAsync(
+            horizon_url=self.horizon_url, client=self._get_http_client()
         )
+        account = await server.load_account(account_id)
+        return (
+            account.load_ed25519_public_key_signers(),
+            account.thresholds.med_threshold,
+        )
+
+    async def invalidate_account(self, account_id: str) -> None:
+        """
+        Evict an account from `account_signers_cache`, so that the next
+        challenge verification for it loads its signers from Horizon.
+        """
+        if self.account_signers_cache is not None:
+            await self.account_signers_cache.invalidate(account_id)
+
+    async def process_account_effect(self, effect: Dict) -> None:
+        """
+        Invalidate the cached signers of the account an effect refers to, if
+        the effect changes its signers or thresholds. Meant to be fed with
+        the records of a Horizon effects stream, ex::
+
+            async for effect in server.effects().cursor("now").stream():
+                await sep10.process_account_effect(effect)
+        """
+        if effect.get("type") in ACCOUNT_SIGNERS_EFFECT_TYPES and effect.get(
+            "account"
+        ):
+            await self.invalidate_account(effect["account"])
+
+    @timed("sep10.encode_jwt")
+    def _generate_jwt(self, challenge: Sep10Challenge) -> str:
         logger.debug(f"Generating SEP-10 token for account {challenge.client_account_id}")
 
         # set iat value to minimum timebound of the challenge so that the JWT returned
         # for a given challenge is always the same.
         # https://github.com/stellar/stellar-protocol/pull/982
-        issued_at = challenge.transaction.transaction.time_bounds.min_time
+        issued_at = challenge.min_time
 
         # format sub value based on muxed account or memo
         if challenge.client_account_id.startswith("M") or not challenge.memo:
@@ -316,8 +683,8 @@ class Sep10:
             "sub": sub,
             "iat": issued_at,
             "exp": issued_at + 24 * 60 * 60,
-            "jti": challenge.transaction.hash().hex(),
-            "client_domain": client_domain,
+            "jti": challenge.hash.hex(),
+            "client_domain": challenge.client_domain,
         }
         return jwt.encode(jwt_dict, self.jwt_secret, algorithm="HS256")
 
@@ -325,8 +692,20 @@ class Sep10Token:
     """
     SEP-10 token representation.
     See https://github.com/stellar/django-polaris/blob/v2.2.0/polaris/polaris/sep10/token.py
+
+    All the values derived from the payload are resolved when the token is
+    created, so reading them is just an attribute access.
     """
 
+    __slots__ = (
+        "_payload",
+        "_account",
+        "_muxed_account",
+        "_memo",
+        "_issued_at",
+        "_expires_at",
+    )
+
     _REQUIRED_FIELDS = {"iss", "sub", "iat", "exp"}
 
     def __init__(self, jwt: Union[str, Dict], jwt_secret):
@@ -346,29 +725,35 @@ class Sep10Token:
             )
 
         memo = None
-        stellar_account = None
+        muxed_account = None
         if jwt["sub"].startswith("M"):
+            muxed_account = jwt["sub"]
             try:
-                StrKey.decode_muxed_account(jwt["sub"])
-            except (MuxedEd25519AccountInvalidError, StellarSdkValueError):
+                stellar_account = _muxed_account_id(muxed_account)
+            except (
+                MuxedEd25519AccountInvalidError,
+                Ed25519PublicKeyInvalidError,
+                StellarSdkValueError,
+            ):
                 raise Sep10InvalidToken(f"invalid muxed account address: {jwt['sub']}")
-        elif ":" in jwt["sub"]:
-            try:
-                stellar_account, memo = jwt["sub"].split(":")
-            except ValueError:
-                raise Sep10InvalidToken(f"improperly formatted 'sub' value: {jwt['sub']}")
         else:
-            stellar_account = jwt["sub"]
-
-        if stellar_account:
+            if ":" in jwt["sub"]:
+                try:
+                    stellar_account, memo = jwt["sub"].split(":")
+                except ValueError:
+                    raise Sep10InvalidToken(
+                        f"improperly formatted 'sub' value: {jwt['sub']}"
+                    )
+            else:
+                stellar_account = jwt["sub"]
             try:
                 Keypair.from_public_key(stellar_account)
             except Ed25519PublicKeyInvalidError:
                 raise Sep10InvalidToken(f"invalid Stellar public key: {jwt['sub']}")
 
-        if memo:
+        if memo is not None:
             try:
-                int(memo)
+                memo = int(memo)
             except ValueError:
                 raise Sep10InvalidToken(
                     f"invalid memo in 'sub' value, expected 64-bit integer: {memo}"
@@ -388,13 +773,39 @@ class Sep10Token:
             raise Sep10InvalidToken("jwt is no longer valid")
 
         client_domain = jwt.get("client_domain")
-        if (
-            client_domain
-            and urlparse(f"https://{client_domain}").netloc != client_domain
-        ):
+        if client_domain and not is_valid_hostname(client_domain):
             raise Sep10InvalidToken("'client_domain' must be a hostname")
 
         self._payload = jwt
+        self._account = stellar_account
+        self._muxed_account = muxed_account
+        self._memo = memo
+        self._issued_at = iat
+        self._expires_at = exp
+
+    @classmethod
+    def from_verified_payload(cls, payload: Dict) -> "Sep10Token":
+        """
+        Create a token from a payload that is known to be valid, ex: one
+        generated by :class:`Sep10`, skipping the validations done by the
+        constructor. Never use it with payloads received from clients.
+        """
+        token = cls.__new__(cls)
+        sub = payload["sub"]
+        token._payload = payload
+        token._muxed_account = None
+        token._memo = None
+        if sub.startswith("M"):
+            token._muxed_account = sub
+            token._account = _muxed_account_id(sub)
+        elif ":" in sub:
+            token._account, memo = sub.split(":")
+            token._memo = int(memo)
+        else:
+            token._account = sub
+        token._issued_at = datetime.fromtimestamp(payload["iat"], tz=timezone.utc)
+        token._expires_at = datetime.fromtimestamp(payload["exp"], tz=timezone.utc)
+        return token
 
     @property
     def account(self) -> str:
@@ -403,30 +814,21 @@ class Sep10Token:
         could have been authenticated, in which case `Token.muxed_account` should
         be used.
         """
-        if self._payload["sub"].startswith("M"):
-            return MuxedAccount.from_account(self._payload["sub"]).account_id
-        elif ":" in self._payload["sub"]:
-            return self._payload["sub"].split(":")[0]
-        else:
-            return self._payload["sub"]
+        return self._account
 
     @property
     def muxed_account(self) -> Optional[str]:
         """
         The M-address specified in the payload's ``sub`` value, if present
         """
-        return self._payload["sub"] if self._payload["sub"].startswith("M") else None
+        return self._muxed_account
 
     @property
     def memo(self) -> Optional[int]:
         """
         The memo included with the payload's ``sub`` value, if present
         """
-        return (
-            int(self._payload["sub"].split(":")[1])
-            if ":" in self._payload["sub"]
-            else None
-        )
+        return self._memo
 
     @property
     def issuer(self) -> str:
@@ -443,7 +845,7 @@ class Sep10Token:
         The time at which the JWT was issued RFC7519, Section 4.1.6 -
         represented as a UTC datetime object
         """
-        return datetime.fromtimestamp(self._payload["iat"], tz=timezone.utc)
+        return self._issued_at
 
     @property
     def expires_at(self) -> datetime:
@@ -451,7 +853,7 @@ class Sep10Token:
         The expiration time on or after which the JWT will not accepted for
         processing, RFC7519, Section 4.1.4 — represented as a UTC datetime object
         """
-        return datetime.fromtimestamp(self._payload["exp"], tz=timezone.utc)
+        return self._expires_at
 
     @property
     def client_domain(self) -> Optional[str]:
@@ -467,3 +869,78 @@ class Sep10Token:
         The decoded contents of the JWT string
         """
         return self._payload
+
+
+def _rate_limit_account(account: str) -> str:
+    """
+    Rate limits apply to the Stellar account, so that the muxed accounts of
+    an account share its limit
+    """
+    if account.startswith("M"):
+        try:
+            return _muxed_account_id(account)
+        except (
+            MuxedEd25519AccountInvalidError,
+            Ed25519PublicKeyInvalidError,
+            StellarSdkValueError,
+        ):
+            pass
+    return account
+
+
+def _muxed_account_id(muxed_account: str) -> str:
+    """
+    Return the Stellar account (G...) of a muxed account (M...)
+    """
+    muxed = StrKey.decode_muxed_account(muxed_account)
+    if muxed.med25519 is None:
+        raise MuxedEd25519AccountInvalidError(
+            f"Invalid Muxed Account: {muxed_account}"
+        )
+    return StrKey.encode_ed25519_public_key(muxed.med25519.ed25519.uint256)
+
+
+class Sep10TokenCache:
+    """
+    Bounded cache of verified :class:`Sep10Token` objects, keyed by the raw
+    JWT string. Wallets reuse the same token for up to 24 hours, so a cache
+    hit skips decoding and validating the JWT again, leaving only the
+    expiration check. Entries are evicted when the token expires.
+
+    Tokens stay cached after the JWT secret is rotated, so :meth:`clear`
+    must be called when it happens.
+    """
+
+    jwt_secret: str
+
+    def __init__(self, jwt_secret: str, max_size: int = 10000):
+        """
+        :param jwt_secret: JWT secret key used to decode the tokens
+        :param max_size: Maximum number of tokens kept in the cache
+        """
+        self.jwt_secret = jwt_secret
+        self._tokens = LRUCache(max_size=max_size, clock=time.time)
+
+    def get_token(self, jwt: str) -> Sep10Token:
+        """
+        Same as ``Sep10Token(jwt, jwt_secret)``, served from the cache if
+        the token was already verified.
+
+        :raises: :exc:`Sep10InvalidToken` if the token is invalid
+        """
+        token = self._tokens.get(jwt)
+        if token is None:
+            token = Sep10Token(jwt, self.jwt_secret)
+            self._tokens.set(jwt, token, expires_at=token.payload["exp"])
+        return token
+
+    def clear(self) -> None:
+        self._tokens.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self._tokens.hits + self._tokens.misses
+        return self._tokens.hits / lookups if lookups else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._tokens.stats(), "hit_rate": self.hit_rate}
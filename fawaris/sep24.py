@@ -1,28 +1,36 @@
 import asyncio
-from typing import Optional, Callable, Any, Union, List, Dict, Tuple
+import inspect
+import warnings
+from contextlib import asynccontextmanager
+from typing import (
+    Optional,
+    Callable,
+    Any,
+    Union,
+    List,
+    Dict,
+    Tuple,
+    AsyncIterator,
+    FrozenSet,
+)
 from abc import ABC, abstractmethod
 import logging
 from pydantic import BaseModel
-from stellar_sdk.client.aiohttp_client import AiohttpClient
-from stellar_sdk import ServerAsync, TransactionEnvelope
-from stellar_sdk.transaction import Transaction as HorizonTransaction
-from stellar_sdk.exceptions import (
-    NotFoundError,
-)
-from stellar_sdk.xdr.utils import from_xdr_amount
-from stellar_sdk.xdr import (
-    PaymentResult,
-    PathPaymentStrictSendResult,
-    PathPaymentStrictReceiveResult,
-    OperationResult,
-    TransactionResult,
-)
+from typing_extensions import Literal
+from stellar_sdk.client.base_async_client import BaseAsyncClient
+from stellar_sdk import ServerAsync
 from stellar_sdk.operation import (
     Operation,
     Payment,
     PathPaymentStrictReceive,
     PathPaymentStrictSend,
 )
+from stellar_sdk.transaction import Transaction as HorizonTransaction
+from stellar_sdk.xdr import OperationResult
+from stellar_sdk.xdr.utils import from_xdr_amount
+from stellar_sdk.exceptions import (
+    NotFoundError,
+)
 
 from fawaris.models import (
     Sep9Customer,
@@ -43,21 +51,67 @@ from fawaris.models import (
     Asset,
 )
 from fawaris.sep10 import Sep10Token
+from fawaris.assets import AssetRegistry
+from fawaris.cache import AsyncCache
+from fawaris.http_client import HttpClientMixin
+from fawaris.scheduler import ScheduledTask, TaskScheduler
+from fawaris.concurrency import BatchBuffer, gather_bounded
+from fawaris.dedupe import TransactionDeduplicator
+from fawaris.payments import (
+    PaymentOperation,
+    iter_payment_operations,
+    payment_from_horizon_record,
+)
+from fawaris.streams import (
+    CursorCheckpointer,
+    PendingWithdrawalIndex,
+    WithdrawalStreamManager,
+)
 
-PaymentOpResult = Union[
-    PaymentResult, PathPaymentStrictSendResult, PathPaymentStrictReceiveResult
-]
 PaymentOp = Union[Payment, PathPaymentStrictReceive, PathPaymentStrictSend]
 
-
 logger = logging.getLogger(__name__)
 
+# hooks no longer called by process_stream_response, and their replacement
+_DEPRECATED_HOOKS = {
+    "find_matching_payment_data": "find_matching_payment",
+    "cast_operation_and_result": "find_matching_payment",
+    "get_payment_values": "find_matching_payment",
+}
+
+WithdrawalStreamMode = Literal["transactions", "payments"]
+
+# seconds between runs of each task by the scheduler of Sep24.create_scheduler
+DEFAULT_TASK_INTERVALS = {
+    "task_poll_deposits_to_receive": 10,
+    "task_send_deposits": 10,
+    "task_poll_withdrawals_sent": 10,
+    "task_send_withdrawals": 10,
+}
+
+# tasks that only check the status of transactions, whose processing can be
+# cancelled safely by `task_item_timeout`
+_CHECK_TASKS = frozenset(
+    ["task_poll_deposits_to_receive", "task_poll_withdrawals_sent"]
+)
+DEFAULT_TASK_MAX_CONCURRENCY = 50
+
 
-class Sep24(ABC):
+class Sep24(HttpClientMixin, ABC):
     sep10_jwt_secret: str
     horizon_url: str
     network_passphrase: str
-    assets: Dict[str, Asset]
+    asset_registry: AssetRegistry
+    task_max_concurrency: Union[int, Dict[str, int]]
+    task_item_timeout: Union[Optional[float], Dict[str, Optional[float]]]
+    task_page_size: int
+    task_batch_size: int
+    task_flush_size: int
+    task_flush_delay: Optional[float]
+    pending_withdrawal_index: Optional[PendingWithdrawalIndex]
+    transaction_deduplicator: TransactionDeduplicator
+    withdrawal_stream_mode: WithdrawalStreamMode
+    info_cache: Optional[AsyncCache]
 
     def __init__(
         self,
@@ -65,20 +119,130 @@ class Sep24(ABC):
         horizon_url: str,
         network_passphrase: str,
         assets: Dict[str, Asset],
+        http_client: Optional[BaseAsyncClient] = None,
+        task_max_concurrency: Union[int, Dict[str, int]] = DEFAULT_TASK_MAX_CONCURRENCY,
+        task_item_timeout: Union[Optional[float], Dict[str, Optional[float]]] = None,
+        task_page_size: int = 500,
+        task_batch_size: int = 100,
+        task_flush_size: int = 100,
+        task_flush_delay: Optional[float] = 5,
+        pending_withdrawal_index: Optional[PendingWithdrawalIndex] = None,
+        transaction_deduplicator: Optional[TransactionDeduplicator] = None,
+        withdrawal_stream_mode: WithdrawalStreamMode = "transactions",
+        info_cache: Optional[AsyncCache] = None,
     ):
+        """
+        :param http_client: HTTP client used for the requests to Horizon, ex:
+            :class:`fawaris.http_client.PooledAiohttpClient`. If not set, a
+            client is created on :meth:`start` (or first use) and closed on
+            :meth:`aclose`
+        :param task_max_concurrency: Maximum number of transactions processed
+            at the same time by each of the `task_*` methods, or a dict of it
+            by task name, like the intervals of :meth:`create_scheduler`.
+            Tasks missing from the dict use `DEFAULT_TASK_MAX_CONCURRENCY`
+        :param task_item_timeout: Seconds after which the check of a
+            transaction by :meth:`task_poll_deposits_to_receive` or
+            :meth:`task_poll_withdrawals_sent` is cancelled, or a dict of it
+            by task name. Disabled by default. The send tasks are only timed
+            out if they are in the dict: cancelling :meth:`send_deposit` or
+            :meth:`send_withdrawal` after the payment is submitted, but
+            before the status is updated, would send it again on the next run
+        :param task_page_size: Number of transactions loaded at a time by the
+            `task_*` methods, if :meth:`get_transactions_page` is implemented
+        :param task_batch_size: Maximum number of transactions passed to each
+            call of the batch hooks, like :meth:`are_deposits_received`
+        :param task_flush_size: Maximum number of transactions passed to each
+            call of :meth:`update_transactions` by the polling tasks
+        :param task_flush_delay: Maximum seconds the polling tasks wait before
+            updating a transaction whose check is done. None disables it
+        :param pending_withdrawal_index: If set, the stream events are matched
+            against this index instead of querying :meth:`get_transactions`.
+            The anchor must call its `update` method whenever a withdrawal
+            enters or leaves the ``pending_user_transfer_start`` status,
+            otherwise the index only learns about it on the next refresh of
+            the stream manager. The events that miss the index are only
+            looked up with :meth:`get_transactions` before its first reload
+            or while it's being reloaded
+
+        :param transaction_deduplicator: Drops the stream events of Stellar
+            transactions already seen. Defaults to an in-memory
+            :class:`fawaris.dedupe.TransactionDeduplicator`
+        :param withdrawal_stream_mode: Horizon stream used to detect the
+            withdrawals: ``transactions`` streams every transaction of the
+            anchor accounts and decodes their XDR, ``payments`` streams their
+            payments, already decoded by Horizon, which are filtered by
+            destination and asset before any lookup. The paging tokens of
+            both are ordered the same way, so the saved cursors remain valid
+            when switching
+        :param info_cache: Cache for the :meth:`http_get_info` responses, by
+            language, ex: :class:`fawaris.cache.TTLCache`. It's used by
+            :meth:`get_info` and by the interactive endpoints to check if an
+            asset is enabled. If not set, :meth:`http_get_info` is called
+            every time. It must be dedicated to it and implement
+            :meth:`fawaris.cache.AsyncCache.clear`. See also
+            :meth:`invalidate_info`
+        """
         self.sep10_jwt_secret = sep10_jwt_secret
         self.horizon_url = horizon_url
         self.network_passphrase = network_passphrase
+        # also builds asset_registry
         self.assets = assets
+        for setting in (task_max_concurrency, task_item_timeout):
+            unknown = set(setting if isinstance(setting, dict) else ())
+            unknown -= set(DEFAULT_TASK_INTERVALS)
+            if unknown:
+                raise ValueError(f"unknown tasks: {', '.join(sorted(unknown))}")
+        self.task_max_concurrency = task_max_concurrency
+        self.task_item_timeout = task_item_timeout
+        self.task_page_size = task_page_size
+        self.task_batch_size = task_batch_size
+        self.task_flush_size = task_flush_size
+        self.task_flush_delay = task_flush_delay
+        self.pending_withdrawal_index = pending_withdrawal_index
+        self.transaction_deduplicator = (
+            transaction_deduplicator or TransactionDeduplicator()
+        )
+        if withdrawal_stream_mode not in ("transactions", "payments"):
+            raise ValueError(
+                f"invalid withdrawal stream mode: {withdrawal_stream_mode}"
+            )
+        self.withdrawal_stream_mode = withdrawal_stream_mode
+        self.info_cache = info_cache
+        self._init_http_client(http_client)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # overrides of the hooks replaced by fawaris.payments would be
+        # silently ignored, or fail on the first payment
+        for name, replacement in _DEPRECATED_HOOKS.items():
+            if name in cls.__dict__:
+                raise TypeError(
+                    f"{cls.__name__}.{name} is no longer called, "
+                    f"override {replacement} instead"
+                )
+        check = cls.__dict__.get("check_for_payment_match")
+        if check is not None and len(inspect.signature(check).parameters) != 3:
+            raise TypeError(
+                f"{cls.__name__}.check_for_payment_match must take "
+                "(payment, transaction), where payment is a "
+                "fawaris.payments.PaymentOperation"
+            )
+
+    @property
+    def assets(self) -> Dict[str, Asset]:
+        return self._assets
+
+    @assets.setter
+    def assets(self, assets: Dict[str, Asset]) -> None:
+        # the registry is rebuilt when the assets are replaced, not when the
+        # dict is modified in place
+        self._assets = assets
+        self.asset_registry = AssetRegistry(assets)
 
     async def http_post_transactions_deposit_interactive(
         self, request: Sep24DepositPostRequest, token: Sep10Token
     ) -> Sep24PostResponse:
-        info = await self.http_get_info(Sep24InfoRequest(lang=request.lang))
-        try:
-            if not info["deposit"][request.asset_code].enabled:
-                raise KeyError()
-        except KeyError:
+        if not await self.is_asset_enabled("deposit", request.asset_code, request.lang):
             raise ValueError(f"Deposit is not enabled for asset {request.asset_code}")
         tx = await self.create_transaction(request, token)
         url = await self.get_interactive_url(request, token, tx)
@@ -90,11 +254,9 @@ class Sep24(ABC):
     async def http_post_transactions_withdraw_interactive(
         self, request: Sep24WithdrawPostRequest, token: Sep10Token
     ) -> Sep24PostResponse:
-        info = await self.http_get_info(Sep24InfoRequest(lang=request.lang))
-        try:
-            if not info["withdraw"][request.asset_code].enabled:
-                raise KeyError()
-        except KeyError:
+        if not await self.is_asset_enabled(
+            "withdrawal", request.asset_code, request.lang
+        ):
             raise ValueError(f"Withdrawal is not enabled for asset {request.asset_code}")
         tx = await self.create_transaction(request, token)
         url = await self.get_interactive_url(request, token, tx)
@@ -103,6 +265,44 @@ class Sep24(ABC):
             id=tx.id,
         )
 
+    async def get_info(self, request: Sep24InfoRequest) -> Sep24InfoResponse:
+        """
+        :meth:`http_get_info`, served from `info_cache` when set. Framework
+        integrations should use it for the ``/info`` endpoint.
+        """
+        return (await self._get_info(request.lang)).response
+
+    async def is_asset_enabled(
+        self, kind: Sep24TransactionKind, asset_code: str, lang: Optional[str] = "en"
+    ) -> bool:
+        """
+        Whether `kind` is enabled for the asset in the ``/info`` response
+        """
+        info = await self._get_info(lang)
+        if kind == "deposit":
+            return asset_code in info.deposit_enabled
+        return asset_code in info.withdraw_enabled
+
+    async def invalidate_info(self, lang: Optional[str] = None) -> None:
+        """
+        Evict the ``/info`` response of `lang`, or of every language, from
+        `info_cache`. To be called when the assets or their settings change.
+        """
+        if self.info_cache is None:
+            return
+        if lang is None:
+            await self.info_cache.clear()
+        else:
+            await self.info_cache.invalidate(_info_cache_key(lang))
+
+    async def _get_info(self, lang: Optional[str]) -> "_Sep24Info":
+        async def fetch() -> _Sep24Info:
+            return _Sep24Info(await self.http_get_info(Sep24InfoRequest(lang=lang)))
+
+        if self.info_cache is None:
+            return await fetch()
+        return await self.info_cache.get_or_fetch(_info_cache_key(lang), fetch)
+
     async def task_all(self) -> None:
         print("running task_all")
         coroutines = [
@@ -113,98 +313,338 @@ class Sep24(ABC):
         ]
         results = await asyncio.gather(*coroutines)
 
-    async def task_poll_deposits_to_receive(self) -> None:
-        deposits_to_receive = await self.get_transactions(
-            kind="deposit", status="pending_user_transfer_start"
+    def create_scheduler(
+        self,
+        intervals: Optional[Dict[str, Optional[float]]] = None,
+        jitter: float = 0,
+    ) -> TaskScheduler:
+        """
+        Create a scheduler running the tasks of :meth:`task_all` periodically.
+        A task is never run again while its previous run is still going, and
+        it backs off after repeated failures::
+
+            scheduler = sep24.create_scheduler({"task_send_deposits": 30})
+            asyncio.ensure_future(scheduler.run())
+            ...
+            scheduler.stop()
+
+        :param intervals: Seconds between runs of each task, by task name.
+            Defaults to `DEFAULT_TASK_INTERVALS`. A task whose interval is
+            None isn't scheduled
+        :param jitter: Up to this many seconds are randomly added to each
+            interval
+        """
+        unknown = set(intervals or {}) - set(DEFAULT_TASK_INTERVALS)
+        if unknown:
+            raise ValueError(f"unknown tasks: {', '.join(sorted(unknown))}")
+        intervals = {**DEFAULT_TASK_INTERVALS, **(intervals or {})}
+        return TaskScheduler(
+            [
+                ScheduledTask(name, getattr(self, name), interval, jitter=jitter)
+                for name, interval in intervals.items()
+                if interval is not None
+            ]
         )
-        print(f"deposits_to_receive: {len(deposits_to_receive)}")
-        coroutines = [
-            self.is_deposit_received(deposit) for deposit in deposits_to_receive
-        ]
-        results = await asyncio.gather(*coroutines, return_exceptions=True)
-        received_deposits = []
-        for deposit, result in zip(deposits_to_receive, results):
-            if result is True:
-                received_deposits.append(deposit)
-            elif isinstance(result, Exception):
-                logger.exception(result)
-        await self.update_transactions(received_deposits, status="pending_anchor")
+
+    async def task_poll_deposits_to_receive(self) -> None:
+        async with self._task_updates(status="pending_anchor") as updates:
+            async for deposits_to_receive in self.iter_transactions(
+                kind="deposit", status="pending_user_transfer_start"
+            ):
+                logger.debug(f"deposits_to_receive: {len(deposits_to_receive)}")
+                await self._check_task_items(
+                    "task_poll_deposits_to_receive",
+                    self.is_deposit_received,
+                    self.are_deposits_received,
+                    deposits_to_receive,
+                    on_result=updates,
+                )
 
     async def task_send_deposits(self) -> None:
-        deposits_received = await self.get_transactions(
+        async for deposits_received in self.iter_transactions(
             kind="deposit", status="pending_anchor"
-        )
-        print(f"deposits_received: {len(deposits_received)}")
-        coroutines = [self.send_deposit(deposit) for deposit in deposits_received]
-        results = await asyncio.gather(*coroutines, return_exceptions=True)
-        for result in results:
-            if isinstance(result, Exception):
-                logger.exception(result)
+        ):
+            logger.debug(f"deposits_received: {len(deposits_received)}")
+            await self._gather_task_items(
+                "task_send_deposits", self.send_deposit, deposits_received
+            )
 
     async def task_poll_withdrawals_sent(self) -> None:
-        withdrawals_sent = await self.get_transactions(
-            kind="withdrawal", status="pending_external"
-        )
-        print(f"withdrawals_sent: {len(withdrawals_sent)}")
-        coroutines = [
-            self.is_withdrawal_complete(withdrawal) for withdrawal in withdrawals_sent
-        ]
-        results = await asyncio.gather(*coroutines, return_exceptions=True)
-        completed_withdrawals = []
-        for withdrawal, result in zip(withdrawals_sent, results):
-            if result is True:
-                completed_withdrawals.append(withdrawal)
-            elif isinstance(result, Exception):
-                logger.exception(result)
-        await self.update_transactions(completed_withdrawals, status="completed")
+        async with self._task_updates(status="completed") as updates:
+            async for withdrawals_sent in self.iter_transactions(
+                kind="withdrawal", status="pending_external"
+            ):
+                logger.debug(f"withdrawals_sent: {len(withdrawals_sent)}")
+                await self._check_task_items(
+                    "task_poll_withdrawals_sent",
+                    self.is_withdrawal_complete,
+                    self.are_withdrawals_complete,
+                    withdrawals_sent,
+                    on_result=updates,
+                )
 
     async def task_send_withdrawals(self) -> None:
-        withdrawals_received = await self.get_transactions(
+        async for withdrawals_received in self.iter_transactions(
             kind="withdrawal", status="pending_anchor"
+        ):
+            logger.debug(f"withdrawals_received: {len(withdrawals_received)}")
+            await self._gather_task_items(
+                "task_send_withdrawals", self.send_withdrawal, withdrawals_received
+            )
+
+    async def iter_transactions(
+        self,
+        kind: Optional[Sep24TransactionKind] = None,
+        status: Optional[Sep24TransactionStatus] = None,
+        memo: Optional[str] = None,
+        withdraw_anchor_account: Optional[str] = None,
+        page_size: Optional[int] = None,
+    ) -> AsyncIterator[List[Sep24Transaction]]:
+        """
+        Iterate over the transactions matching the filters, one page at a
+        time, using :meth:`get_transactions_page`. If it isn't overridden,
+        all the transactions are returned in a single page by
+        :meth:`get_transactions`.
+
+        :param page_size: Defaults to `task_page_size`
+        """
+        if type(self).get_transactions_page is Sep24.get_transactions_page:
+            yield await self.get_transactions(
+                kind=kind,
+                status=status,
+                memo=memo,
+                withdraw_anchor_account=withdraw_anchor_account,
+            )
+            return
+        page_size = page_size or self.task_page_size
+        after_id = None
+        while True:
+            page = await self.get_transactions_page(
+                kind=kind,
+                status=status,
+                memo=memo,
+                withdraw_anchor_account=withdraw_anchor_account,
+                after_id=after_id,
+                limit=page_size,
+            )
+            if page:
+                yield page
+            if len(page) < page_size:
+                return
+            after_id = page[-1].id
+
+    @asynccontextmanager
+    async def _task_updates(self, **values):
+        """
+        Yields an `on_result` callback for :meth:`_check_task_items`, which
+        updates the transactions checked successfully with `values`. Updates
+        are made in chunks of `task_flush_size` transactions, or after
+        `task_flush_delay` seconds, and the remaining ones on exit.
+        """
+
+        async def flush(transactions: List[Sep24Transaction]) -> None:
+            await self.update_transactions(transactions, **values)
+
+        buffer = BatchBuffer(
+            flush, max_size=self.task_flush_size, max_delay=self.task_flush_delay
         )
-        print(f"withdrawals_received: {len(withdrawals_received)}")
-        coroutines = [
-            self.send_withdrawal(withdrawal) for withdrawal in withdrawals_received
+
+        async def on_result(transaction: Sep24Transaction, result: Any) -> None:
+            if result is True:
+                await buffer.add(transaction)
+
+        try:
+            yield on_result
+        finally:
+            await buffer.aclose()
+
+    def _task_limits(self, task: str) -> Tuple[int, Optional[float]]:
+        """
+        `task_max_concurrency` and `task_item_timeout` of `task`
+        """
+        max_concurrency = self.task_max_concurrency
+        if isinstance(max_concurrency, dict):
+            max_concurrency = max_concurrency.get(task, DEFAULT_TASK_MAX_CONCURRENCY)
+        timeout = self.task_item_timeout
+        if isinstance(timeout, dict):
+            timeout = timeout.get(task)
+        elif task not in _CHECK_TASKS:
+            timeout = None
+        return max_concurrency, timeout
+
+    async def _gather_task_items(
+        self,
+        task: str,
+        fn: Callable[[Sep24Transaction], Any],
+        transactions: List[Sep24Transaction],
+        on_result: Optional[Callable[[Sep24Transaction, Any], Any]] = None,
+    ) -> List[Any]:
+        """
+        Call `fn` for each transaction, limited by the `task_max_concurrency`
+        and `task_item_timeout` of `task`. Exceptions are logged and returned
+        in place of the results. If set, ``on_result(transaction, result)``
+        is awaited as soon as each result is available.
+        """
+
+        async def _on_result(transaction: Sep24Transaction, result: Any) -> None:
+            if isinstance(result, Exception):
+                logger.error(
+                    f"{fn.__name__} failed for transaction {transaction.id}",
+                    exc_info=result,
+                )
+            if on_result is not None:
+                await on_result(transaction, result)
+
+        max_concurrency, timeout = self._task_limits(task)
+        return await gather_bounded(
+            fn,
+            transactions,
+            max_concurrency=max_concurrency,
+            timeout=timeout,
+            on_result=_on_result,
+        )
+
+    async def _check_task_items(
+        self,
+        task: str,
+        fn: Callable[[Sep24Transaction], Any],
+        batch_fn: Callable[[List[Sep24Transaction]], Any],
+        transactions: List[Sep24Transaction],
+        on_result: Optional[Callable[[Sep24Transaction, Any], Any]] = None,
+    ) -> List[Any]:
+        """
+        Same as :meth:`_gather_task_items`, but if the anchor implements
+        `batch_fn`, it's called with chunks of `task_batch_size` transactions
+        instead of calling `fn` for each of them. Transactions missing from
+        the result of `batch_fn` are considered False.
+        """
+        if getattr(Sep24, batch_fn.__name__) is batch_fn.__func__:
+            return await self._gather_task_items(task, fn, transactions, on_result)
+        chunks = [
+            transactions[i : i + self.task_batch_size]
+            for i in range(0, len(transactions), self.task_batch_size)
         ]
-        await asyncio.gather(*coroutines, return_exceptions=True)
 
-    async def watch_withdrawals_to_receive(self) -> None:
-        withdrawals_to_receive = await self.get_transactions(
-            kind="withdrawal", status="pending_user_transfer_start"
+        async def on_chunk_result(chunk: List[Sep24Transaction], result: Any) -> None:
+            if isinstance(result, Exception):
+                logger.error(
+                    f"{batch_fn.__name__} failed for transactions "
+                    f"{', '.join(tx.id for tx in chunk)}",
+                    exc_info=result,
+                )
+            if on_result is not None:
+                for transaction, transaction_result in zip(
+                    chunk, _chunk_results(chunk, result)
+                ):
+                    await on_result(transaction, transaction_result)
+
+        max_concurrency, timeout = self._task_limits(task)
+        chunk_results = await gather_bounded(
+            batch_fn,
+            chunks,
+            max_concurrency=max_concurrency,
+            timeout=timeout,
+            on_result=on_chunk_result,
         )
-        accounts = set([withdrawal.withdraw_anchor_account for withdrawal in withdrawals_to_receive])
-        await asyncio.gather(
-            *[
-                self.stream_withdraw_anchor_account(account)
-                for account in accounts
-            ],
+        results = []
+        for chunk, chunk_result in zip(chunks, chunk_results):
+            results.extend(_chunk_results(chunk, chunk_result))
+        return results
+
+    async def watch_withdrawals_to_receive(self) -> None:
+        """
+        Watch the withdrawal anchor accounts with pending withdrawals, with a
+        :class:`fawaris.streams.WithdrawalStreamManager` with the default
+        settings, until cancelled
+        """
+        await self.create_stream_manager().run()
+
+    def create_stream_manager(self, **kwargs) -> WithdrawalStreamManager:
+        """
+        Create a manager streaming the transactions of the withdrawal anchor
+        accounts with pending withdrawals::
+
+            manager = sep24.create_stream_manager(refresh_interval=10)
+            asyncio.ensure_future(manager.run())
+            ...
+            manager.stop()
+
+        :param kwargs: Arguments of
+            :class:`fawaris.streams.WithdrawalStreamManager`
+        """
+        return WithdrawalStreamManager(self, **kwargs)
+
+    def stream_withdraw_anchor_account_events(
+        self, account: str, cursor: str
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream the Horizon responses passed to :meth:`process_stream_response`
+        for `account`, starting after `cursor`: transactions, or payments
+        with their transaction in the ``payments`` stream mode
+        """
+        server = ServerAsync(
+            horizon_url=self.horizon_url, client=self._get_http_client()
         )
+        if self.withdrawal_stream_mode == "payments":
+            endpoint = server.payments().for_account(account).join("transactions")
+        else:
+            endpoint = server.transactions().for_account(account)
+        return endpoint.cursor(cursor).stream()
 
-    async def stream_withdraw_anchor_account(self, account: str):
-        async with ServerAsync(
-            horizon_url=self.horizon_url, client=AiohttpClient()
-        ) as server:
-            try:
-                # Ensure the distribution account actually exists
-                await server.load_account(account)
-            except NotFoundError:
-                # This exception will crash the process, but the anchor needs
-                # to provide valid accounts to watch.
-                raise RuntimeError(
-                    "Stellar distribution account does not exist in horizon"
-                )
-            cursor = self.get_withdraw_anchor_account_cursor(account)
-            if cursor is None:
-                cursor = "0"
+    async def stream_withdraw_anchor_account(
+        self, account: str, max_event_retries: int = 3
+    ):
+        server = ServerAsync(
+            horizon_url=self.horizon_url, client=self._get_http_client()
+        )
+        try:
+            # Ensure the distribution account actually exists
+            await server.load_account(account)
+        except NotFoundError:
+            # This exception will crash the process, but the anchor needs
+            # to provide valid accounts to watch.
+            raise RuntimeError(
+                "Stellar distribution account does not exist in horizon"
+            )
+        cursor = await self.get_withdraw_anchor_account_cursor(account)
+        if cursor is None:
+            cursor = "0"
 
-            endpoint = server.transactions().for_account(account).cursor(cursor)
-            async for response in endpoint.stream():
-                try:
-                    await self.process_stream_response(response, account)
-                except Exception as e:
-                    logger.exception(e)
+        checkpointer = CursorCheckpointer(self.save_withdraw_anchor_account_cursor)
+        try:
+            async for response in self.stream_withdraw_anchor_account_events(
+                account, cursor
+            ):
+                # the stream isn't reopened, failed events are retried in place
+                for attempt in range(max_event_retries + 1):
+                    try:
+                        await self.process_stream_response(response, account)
+                        break
+                    except Exception as e:
+                        if attempt < max_event_retries:
+                            logger.exception(e)
+                            await asyncio.sleep(2 ** attempt)
+                            continue
+                        logger.exception(
+                            f"skipping event {response.get('paging_token')} "
+                            f"of {account} after {attempt + 1} failures"
+                        )
+                        try:
+                            await self.dead_letter_stream_response(
+                                response, account, e
+                            )
+                        except Exception:
+                            logger.exception("failed to dead-letter the event")
+                if "paging_token" in response:
+                    await checkpointer.record(account, response["paging_token"])
+        finally:
+            await checkpointer.aclose()
 
     async def process_stream_response(self, response, account: str):
+        if self.withdrawal_stream_mode == "payments":
+            await self.process_payment_stream_response(response, account)
+            return
+
         # We should not match valid pending transactions with ones that were
         # unsuccessful on the stellar network. If they were unsuccessful, the
         # client is also aware of the failure and will likely attempt to
@@ -213,46 +653,189 @@ class Sep24(ABC):
             return
 
         try:
-            _ = response["id"]
+            transaction_hash = response["id"]
             envelope_xdr = response["envelope_xdr"]
             memo = response["memo"]
             result_xdr = response["result_xdr"]
         except KeyError:
             return
 
-        transactions = await self.get_transactions(
-            kind="withdrawal",
-            status="pending_user_transfer_start",
-            memo=memo,
-            withdraw_anchor_account=account,
-        )
+        if self.transaction_deduplicator.seen(transaction_hash):
+            return
 
-        if not transactions:
+        payments = self._anchor_payments(envelope_xdr, result_xdr, account)
+        if not payments:
+            # can't match any withdrawal, now or later
+            self.transaction_deduplicator.mark_seen(transaction_hash)
             return
-        elif len(transactions) > 1:
-            raise ValueError(f"Found multiple transactions matching memo: {memo}")
-        transaction = transactions[0]
 
-        #TODO check if tx hash has already been processed (relevant if cursor is 0)
+        # not marked as seen if no withdrawal matches, since the withdrawal
+        # may not be pending yet when the payment arrives
+        transaction = await self._find_pending_withdrawal(account, memo)
+        if transaction is None:
+            return
 
-        op_results = TransactionResult.from_xdr(result_xdr).result.results
-        horizon_tx = TransactionEnvelope.from_xdr(
-            envelope_xdr, network_passphrase=self.network_passphrase,
-        ).transaction
+        if await self.transaction_deduplicator.is_processed(transaction_hash):
+            return
 
-        payment_data, source = await self.find_matching_payment_data(
-            response, horizon_tx, op_results, transaction
+        payment = await self.find_matching_payment(
+            envelope_xdr, result_xdr, account, transaction, payments=payments
         )
-        if payment_data is None:
+        if payment is None:
             logger.info(f"Transaction matching memo {memo} has no payment operation")
+            self.transaction_deduplicator.mark_seen(transaction_hash)
             return
 
+        await self._receive_withdrawal(transaction, payment, transaction_hash, response)
+
+    async def process_payment_stream_response(self, response, account: str):
+        """
+        Same as :meth:`process_stream_response`, for the payment records
+        (with the joined transaction) of the ``payments`` stream mode. The
+        `horizon_response` passed to :meth:`process_withdrawal_received` is
+        the joined transaction record, as in the ``transactions`` mode.
+        """
+        payment = payment_from_horizon_record(response)
+        if (
+            payment is None
+            or payment.destination != account
+            or not response.get("transaction_successful")
+            or not self.asset_registry.is_anchor_asset(payment.code, payment.issuer)
+        ):
+            return
+
+        try:
+            operation_id = response["id"]
+            transaction_hash = response["transaction_hash"]
+            horizon_transaction = response["transaction"]
+            memo = horizon_transaction["memo"]
+        except KeyError:
+            return
+
+        # a transaction can hold multiple payments, only the first one
+        # matching a withdrawal is processed
+        deduplicator = self.transaction_deduplicator
+        if deduplicator.seen(operation_id) or deduplicator.seen(transaction_hash):
+            return
+
+        transaction = await self._find_pending_withdrawal(account, memo)
+        if transaction is None:
+            return
+        if not await self.check_for_payment_match(payment, transaction):
+            deduplicator.mark_seen(operation_id)
+            return
+
+        if await deduplicator.is_processed(transaction_hash):
+            return
+
+        await self._receive_withdrawal(
+            transaction, payment, transaction_hash, horizon_transaction
+        )
+
+    async def _find_pending_withdrawal(
+        self, account: str, memo: Optional[str]
+    ) -> Optional[Sep24Transaction]:
+        """
+        Find the withdrawal matching a stream event holding a payment of an
+        anchor asset to `account`. A miss of `pending_withdrawal_index` is
+        trusted once it's synced, otherwise :meth:`get_transactions` is
+        queried.
+        """
+        index = self.pending_withdrawal_index
+        transactions = index.get(account, memo) if index is not None else []
+        if not transactions and (index is None or not index.synced):
+            transactions = await self.get_transactions(
+                kind="withdrawal",
+                status="pending_user_transfer_start",
+                memo=memo,
+                withdraw_anchor_account=account,
+            )
+            if index is not None:
+                for transaction in transactions:
+                    index.update(transaction)
+
+        if not transactions:
+            return None
+        elif len(transactions) > 1:
+            raise ValueError(f"Found multiple transactions matching memo: {memo}")
+        return transactions[0]
+
+    def _anchor_payments(
+        self, envelope_xdr: str, result_xdr: str, account: str
+    ) -> List[PaymentOperation]:
+        registry = self.asset_registry
+        return [
+            payment
+            for payment in iter_payment_operations(
+                envelope_xdr, result_xdr, destination=account
+            )
+            if registry.is_anchor_asset(payment.code, payment.issuer)
+        ]
+
+    async def _receive_withdrawal(
+        self,
+        transaction: Sep24Transaction,
+        payment: PaymentOperation,
+        transaction_hash: str,
+        horizon_response: Dict,
+    ) -> None:
         await self.process_withdrawal_received(
             transaction=transaction,
-            amount_received=payment_data["amount"],
-            from_address=source,
-            horizon_response=response,
+            amount_received=payment.amount,
+            from_address=payment.source,
+            horizon_response=horizon_response,
         )
+        await self.transaction_deduplicator.mark_processed(transaction_hash)
+        self.asset_registry.forget_transaction(transaction.id)
+        if self.pending_withdrawal_index is not None:
+            self.pending_withdrawal_index.remove(transaction.id)
+
+    async def find_matching_payment(
+        self,
+        envelope_xdr: str,
+        result_xdr: str,
+        account: str,
+        transaction: Sep24Transaction,
+        payments: Optional[List[PaymentOperation]] = None,
+    ) -> Optional[PaymentOperation]:
+        """
+        Return the first payment operation of the Stellar transaction
+        sending the asset of `transaction` to `account`, if any. Payments of
+        assets that aren't in `assets` are skipped without I/O.
+
+        :param payments: Payments of anchor assets to `account` already
+            decoded from the XDR, passed by :meth:`process_stream_response`
+        """
+        if payments is None:
+            payments = self._anchor_payments(envelope_xdr, result_xdr, account)
+        for payment in payments:
+            if await self.check_for_payment_match(payment, transaction):
+                return payment
+        return None
+
+    async def check_for_payment_match(
+        self, payment: PaymentOperation, transaction: Sep24Transaction
+    ) -> bool:
+        #TODO add doc saying these fields need to be set when creating the tx
+        asset = await self.resolve_transaction_asset(transaction)
+        return (
+            payment.destination == transaction.withdraw_anchor_account
+            and payment.code == asset.code
+            and payment.issuer == asset.issuer
+        )
+
+    async def resolve_transaction_asset(self, transaction: Sep24Transaction) -> Asset:
+        """
+        :meth:`get_transaction_asset`, called once per transaction: the
+        result is kept in :attr:`asset_registry` until the withdrawal is
+        received
+        """
+        asset = self.asset_registry.transaction_asset(transaction.id)
+        if asset is None:
+            asset = self.asset_registry.set_transaction_asset(
+                transaction.id, await self.get_transaction_asset(transaction)
+            )
+        return asset
 
     async def find_matching_payment_data(
         self,
@@ -260,97 +843,80 @@ class Sep24(ABC):
         horizon_tx: HorizonTransaction,
         result_ops: List[OperationResult],
         transaction: Sep24Transaction,
-    ) -> Optional[Dict]:
-        matching_payment_data = None
-        source = None
-        ops = horizon_tx.operations
-        for idx, op_result in enumerate(result_ops):
-            op, op_result = await self.cast_operation_and_result(ops[idx], op_result)
-            if not op_result:  # not a payment op
-                continue
-            maybe_payment_data = await self.check_for_payment_match(
-                op, op_result, transaction.asset
-            )
-            if maybe_payment_data:
-                if ops[idx].source:
-                    _source = ops[idx].source.account_muxed or ops[idx].source.account_id
-                else:
-                    _source = (
-                        horizon_tx.source.account_muxed or horizon_tx.source.account_id
-                    )
-                matching_payment_data = maybe_payment_data
-                source = _source
-                break
-
-        return matching_payment_data, source
+    ) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        Deprecated, use :meth:`find_matching_payment`. Returns the payment
+        values, as :meth:`get_payment_values` does, and the source
+        """
+        warnings.warn(
+            "find_matching_payment_data is deprecated, use find_matching_payment",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        payment = await self.find_matching_payment(
+            response["envelope_xdr"],
+            response["result_xdr"],
+            transaction.withdraw_anchor_account,
+            transaction,
+        )
+        if payment is None:
+            return None, None
+        values = {
+            "destination": payment.destination,
+            "amount": payment.amount,
+            "code": payment.code,
+            "issuer": payment.issuer,
+        }
+        return values, payment.source
 
     async def cast_operation_and_result(
         self, operation: Operation, op_result: OperationResult
-    ) -> Tuple[Optional[PaymentOp], Optional[PaymentOpResult]]:
-        op_xdr_obj = operation.to_xdr_object()
+    ) -> Tuple[Optional[PaymentOp], Optional[Any]]:
+        """
+        Deprecated, :func:`fawaris.payments.iter_payment_operations` decodes
+        the payments of a transaction
+        """
+        warnings.warn(
+            "cast_operation_and_result is deprecated, use "
+            "fawaris.payments.iter_payment_operations",
+            DeprecationWarning,
+            stacklevel=2,
+        )
         if isinstance(operation, Payment):
-            return (
-                Payment.from_xdr_object(op_xdr_obj),
-                op_result.tr.payment_result,
-            )
+            return operation, op_result.tr.payment_result
         elif isinstance(operation, PathPaymentStrictSend):
-            return (
-                PathPaymentStrictSend.from_xdr_object(op_xdr_obj),
-                op_result.tr.path_payment_strict_send_result,
-            )
+            return operation, op_result.tr.path_payment_strict_send_result
         elif isinstance(operation, PathPaymentStrictReceive):
-            return (
-                PathPaymentStrictReceive.from_xdr_object(op_xdr_obj),
-                op_result.tr.path_payment_strict_receive_result,
-            )
-        else:
-            return None, None
-
-    async def check_for_payment_match(
-        self, operation: PaymentOp, op_result: PaymentOpResult, transaction: Sep24Transaction
-    ) -> Optional[Dict]:
-        payment_data = await self.get_payment_values(operation, op_result)
-        #TODO add doc saying these fields need to be set when creating the tx
-        asset = await self.get_transaction_asset(transaction)
-        if (
-            payment_data["destination"] == transaction.withdraw_anchor_account
-            and payment_data["code"] == asset.code
-            and payment_data["issuer"] == asset.issuer
-        ):
-            return payment_data
-        else:
-            return None
+            return operation, op_result.tr.path_payment_strict_receive_result
+        return None, None
 
-    async def get_payment_values(
-        self, operation: PaymentOp, op_result: PaymentOpResult
-    ) -> Dict:
-        values = {
-            "destination": operation.destination.account_id,
-            "amount": None,
-            "code": None,
-            "issuer": None,
-        }
+    async def get_payment_values(self, operation: PaymentOp, op_result: Any) -> Dict:
+        """
+        Deprecated, :func:`fawaris.payments.iter_payment_operations` decodes
+        the payments of a transaction
+        """
+        warnings.warn(
+            "get_payment_values is deprecated, use "
+            "fawaris.payments.iter_payment_operations",
+            DeprecationWarning,
+            stacklevel=2,
+        )
         if isinstance(operation, Payment):
-            values["amount"] = str(operation.amount)
-            values["code"] = operation.asset.code
-            values["issuer"] = operation.asset.issuer
+            amount, asset = str(operation.amount), operation.asset
         elif isinstance(operation, PathPaymentStrictSend):
-            # since the dest amount is not specified in a strict-send op,
-            # we need to get the dest amount from the operation's result
-            #
-            # this method of fetching amounts gives the "raw" amount, so
-            # we need to divide by Operation._ONE: 10000000
-            # (Stellar uses 7 decimals places of precision)
-            values["amount"] = from_xdr_amount(op_result.success.last.amount.int64)
-            values["code"] = operation.dest_asset.code
-            values["issuer"] = operation.dest_asset.issuer
+            # the amount received is only in the result
+            amount = from_xdr_amount(op_result.success.last.amount.int64)
+            asset = operation.dest_asset
         elif isinstance(operation, PathPaymentStrictReceive):
-            values["amount"] = str(operation.dest_amount)
-            values["code"] = operation.dest_asset.code
-            values["issuer"] = operation.dest_asset.issuer
+            amount, asset = str(operation.dest_amount), operation.dest_asset
         else:
             raise ValueError("Unexpected operation, expected payment or path payment")
-        return values
+        return {
+            "destination": operation.destination.account_id,
+            "amount": amount,
+            "code": asset.code,
+            "issuer": asset.issuer,
+        }
 
     @abstractmethod
     async def http_get_info(self, request: Sep24InfoRequest) -> Sep24InfoResponse:
@@ -400,6 +966,23 @@ class Sep24(ABC):
     ) -> List[Sep24Transaction]:
         raise NotImplementedError()
 
+    async def get_transactions_page(
+        self,
+        kind: Optional[Sep24TransactionKind] = None,
+        status: Optional[Sep24TransactionStatus] = None,
+        memo: Optional[str] = None,
+        withdraw_anchor_account: Optional[str] = None,
+        after_id: Optional[str] = None,
+        limit: int = 500,
+    ) -> List[Sep24Transaction]:
+        """
+        Same as :meth:`get_transactions`, but returning at most `limit`
+        transactions ordered by id, starting after the transaction with id
+        `after_id` (keyset pagination). Implementing it lets the `task_*`
+        methods process large backlogs with bounded memory.
+        """
+        raise NotImplementedError()
+
     @abstractmethod
     async def get_transaction_asset(self, transaction: Sep24Transaction) -> Asset:
         raise NotImplementedError()
@@ -408,10 +991,30 @@ class Sep24(ABC):
     async def is_deposit_received(self, deposit: Sep24Transaction) -> bool:
         raise NotImplementedError()
 
+    async def are_deposits_received(
+        self, deposits: List[Sep24Transaction]
+    ) -> Dict[str, bool]:
+        """
+        Batch version of :meth:`is_deposit_received`, returning whether each
+        deposit was received by transaction id. Implement it if the bank
+        supports checking many transfers in one call, it will be used
+        instead of :meth:`is_deposit_received`.
+        """
+        raise NotImplementedError()
+
     @abstractmethod
     async def is_withdrawal_complete(self, withdrawal: Sep24Transaction) -> bool:
         raise NotImplementedError()
 
+    async def are_withdrawals_complete(
+        self, withdrawals: List[Sep24Transaction]
+    ) -> Dict[str, bool]:
+        """
+        Batch version of :meth:`is_withdrawal_complete`, see
+        :meth:`are_deposits_received`
+        """
+        raise NotImplementedError()
+
     @abstractmethod
     async def process_withdrawal_received(self,
         transaction: Sep24Transaction,
@@ -437,3 +1040,50 @@ class Sep24(ABC):
     async def get_withdraw_anchor_account_cursor(self, account: str) -> Optional[str]:
         raise NotImplementedError()
 
+    async def save_withdraw_anchor_account_cursor(
+        self, account: str, cursor: str
+    ) -> None:
+        """
+        Persist the paging token of the last processed transaction of
+        `account`, to be returned by :meth:`get_withdraw_anchor_account_cursor`
+        when the stream restarts. Calls are batched, so only some of the
+        tokens are saved. By default, tokens aren't saved and streams restart
+        from the cursor returned by :meth:`get_withdraw_anchor_account_cursor`.
+        """
+        pass
+
+    async def dead_letter_stream_response(
+        self, response: Dict, account: str, exception: Exception
+    ) -> None:
+        """
+        Called with a Horizon response of the stream of `account` that
+        :meth:`process_stream_response` failed to process after all its
+        retries, before it's skipped. Persist it to reprocess it later, by
+        default it's only logged.
+        """
+        pass
+
+
+def _chunk_results(chunk: List[Sep24Transaction], result: Any) -> List[Any]:
+    # maps the result of a batch hook to the results of each transaction
+    if isinstance(result, Exception):
+        return [result] * len(chunk)
+    return [result.get(tx.id, False) for tx in chunk]
+
+
+class _Sep24Info:
+    # /info response with the enabled assets precomputed
+    __slots__ = ("response", "deposit_enabled", "withdraw_enabled")
+
+    def __init__(self, response: Sep24InfoResponse):
+        self.response = response
+        self.deposit_enabled: FrozenSet[str] = frozenset(
+            code for code, asset in response.deposit.items() if asset.enabled
+        )
+        self.withdraw_enabled: FrozenSet[str] = frozenset(
+            code for code, asset in response.withdraw.items() if asset.enabled
+        )
+
+
+def _info_cache_key(lang: Optional[str]) -> str:
+    return lang or ""
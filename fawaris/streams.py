@@ -0,0 +1,489 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from fawaris.concurrency import BatchBuffer
+from fawaris.models import Sep24Transaction
+
+if TYPE_CHECKING:
+    from fawaris.sep24 import Sep24
+
+logger = logging.getLogger(__name__)
+
+
+PendingWithdrawalKey = Tuple[str, Optional[str]]
+
+
+class PendingWithdrawalIndex:
+    """
+    In-memory index of the withdrawals in ``pending_user_transfer_start``
+    status, by withdrawal anchor account and memo, used to match the stream
+    events without querying the database.
+
+    The index must be kept up to date with :meth:`update` whenever a
+    withdrawal is created or changes status, and it's fully reloaded by
+    :class:`WithdrawalStreamManager` on each refresh. Updates made while a
+    reload is running take precedence over the reloaded data.
+
+    Once a reload finished, and until the next one starts, the index is
+    :attr:`synced` and a miss is trusted without querying the database.
+    """
+
+    def __init__(self):
+        self._by_key: Dict[PendingWithdrawalKey, Dict[str, Sep24Transaction]] = {}
+        self._keys: Dict[str, PendingWithdrawalKey] = {}
+        self._changed_during_resync: Optional[Set[str]] = None
+        self.resyncs = 0
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @property
+    def synced(self) -> bool:
+        return self.resyncs > 0 and self._changed_during_resync is None
+
+    def get(self, account: str, memo: Optional[str]) -> List[Sep24Transaction]:
+        return list(self._by_key.get((account, memo), {}).values())
+
+    def update(self, transaction: Sep24Transaction) -> None:
+        """
+        Add `transaction` to the index if it's a pending withdrawal, remove it
+        otherwise
+        """
+        if (
+            transaction.kind == "withdrawal"
+            and transaction.status == "pending_user_transfer_start"
+            and transaction.withdraw_anchor_account
+        ):
+            self._remove(transaction.id)
+            key = (transaction.withdraw_anchor_account, transaction.withdraw_memo)
+            self._by_key.setdefault(key, {})[transaction.id] = transaction
+            self._keys[transaction.id] = key
+        else:
+            self._remove(transaction.id)
+        if self._changed_during_resync is not None:
+            self._changed_during_resync.add(transaction.id)
+
+    def remove(self, transaction_id: str) -> None:
+        self._remove(transaction_id)
+        if self._changed_during_resync is not None:
+            self._changed_during_resync.add(transaction_id)
+
+    def _remove(self, transaction_id: str) -> None:
+        key = self._keys.pop(transaction_id, None)
+        if key is not None:
+            transactions = self._by_key[key]
+            del transactions[transaction_id]
+            if not transactions:
+                del self._by_key[key]
+
+    def start_resync(self) -> None:
+        """
+        Start tracking the changes made until :meth:`finish_resync`
+        """
+        self._changed_during_resync = set()
+
+    def finish_resync(self, transactions: List[Sep24Transaction]) -> None:
+        """
+        Replace the content of the index with `transactions`, loaded since
+        :meth:`start_resync`, keeping the changes made in the meantime
+        """
+        changed = self._changed_during_resync or set()
+        self._changed_during_resync = None
+        current = self._keys
+        previous_by_key = self._by_key
+        self._by_key = {}
+        self._keys = {}
+        for transaction in transactions:
+            if transaction.id not in changed:
+                self.update(transaction)
+        for transaction_id in changed:
+            key = current.get(transaction_id)
+            if key is not None:
+                self.update(previous_by_key[key][transaction_id])
+        self.resyncs += 1
+
+
+class CursorCheckpointer:
+    """
+    Saves the paging token of the last processed event of each account with
+    `save_fn`, in batches: once `max_events` events are recorded or after
+    `max_delay` seconds, only the last token of each account is saved.
+    Failed saves are logged, the next token recorded for the account is
+    saved as usual.
+
+    :meth:`aclose` must be awaited once done, to save the remaining tokens.
+    """
+
+    def __init__(
+        self,
+        save_fn: Callable[[str, str], Awaitable[Any]],
+        max_events: int = 100,
+        max_delay: Optional[float] = 5,
+    ):
+        """
+        :param save_fn: Coroutine function called with an account and its
+            paging token, ex: `Sep24.save_withdraw_anchor_account_cursor`
+        :param max_events: Number of recorded events triggering a save
+        :param max_delay: Maximum seconds before a recorded token is saved
+        """
+        self.save_fn = save_fn
+        self._buffer: BatchBuffer[Tuple[str, str]] = BatchBuffer(
+            self._save, max_size=max_events, max_delay=max_delay
+        )
+        self._latest: Dict[str, str] = {}
+
+    @property
+    def saves(self) -> int:
+        return self._buffer.flushes
+
+    def latest(self, account: str) -> Optional[str]:
+        """
+        Last token recorded for `account`, saved or not
+        """
+        return self._latest.get(account)
+
+    async def record(self, account: str, cursor: str) -> None:
+        self._latest[account] = cursor
+        await self._buffer.add((account, cursor))
+
+    async def _save(self, checkpoints: List[Tuple[str, str]]) -> None:
+        # later tokens overwrite earlier ones of the same account
+        for account, cursor in dict(checkpoints).items():
+            try:
+                await self.save_fn(account, cursor)
+            except Exception:
+                logger.exception(f"failed to save the cursor of {account}")
+
+    async def flush(self) -> None:
+        await self._buffer.flush()
+
+    async def aclose(self) -> None:
+        await self._buffer.aclose()
+
+
+class _StreamIdle(Exception):
+    pass
+
+
+class AccountStream:
+    """
+    State and metrics of the stream of one withdrawal anchor account
+    """
+
+    account: str
+    cursor: Optional[str]
+
+    def __init__(self, account: str):
+        self.account = account
+        self.cursor = None
+        self.task: Optional["asyncio.Future[None]"] = None
+        self.connected = False
+        self.events = 0
+        self.failed_events = 0
+        self.dead_letters = 0
+        # paging token of the event failing to be processed, and its failures
+        self.failing_event: Optional[str] = None
+        self.event_failures = 0
+        self.reconnects = 0
+        self.idle_reconnects = 0
+        self.consecutive_failures = 0
+        self.last_event_at: Optional[float] = None
+        # seconds between the ledger close of the last event and its processing
+        self.lag: Optional[float] = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cursor": self.cursor,
+            "connected": self.connected,
+            "events": self.events,
+            "failed_events": self.failed_events,
+            "dead_letters": self.dead_letters,
+            "reconnects": self.reconnects,
+            "idle_reconnects": self.idle_reconnects,
+            "idle_seconds": (
+                time.monotonic() - self.last_event_at
+                if self.last_event_at is not None
+                else None
+            ),
+            "lag_seconds": self.lag,
+        }
+
+
+class WithdrawalStreamManager:
+    """
+    Streams the transactions of the withdrawal anchor accounts of a
+    :class:`fawaris.Sep24`, passing them to its `process_stream_response`.
+
+    The accounts with pending withdrawals are reloaded every
+    `refresh_interval` seconds: a stream is opened for new accounts and
+    closed for accounts without pending withdrawals. A stream that fails is
+    reopened from its last cursor after an exponential backoff. A stream
+    that doesn't receive any event for `heartbeat_timeout` seconds is
+    reopened right away, since the Horizon client doesn't expose keep-alive
+    messages and an idle account is indistinguishable from a stalled stream.
+
+    The paging token of each processed event is checkpointed with the
+    `save_withdraw_anchor_account_cursor` method of the Sep24, through a
+    :class:`CursorCheckpointer`, and streams resume from the token returned
+    by `get_withdraw_anchor_account_cursor`. If processing an event fails,
+    the stream is reopened after a backoff from the last processed event, so
+    that the failed event is retried. After `max_event_retries` retries, the
+    event is passed to the `dead_letter_stream_response` method of the Sep24
+    and skipped, so that it doesn't block the following events.
+
+    If the Sep24 has a `pending_withdrawal_index`, it's reloaded with the
+    pending withdrawals on each refresh.
+    """
+
+    refresh_interval: float
+    heartbeat_timeout: Optional[float]
+    min_backoff: float
+    max_backoff: float
+    max_event_retries: Optional[int]
+
+    def __init__(
+        self,
+        sep24: "Sep24",
+        refresh_interval: float = 30,
+        heartbeat_timeout: Optional[float] = 120,
+        min_backoff: float = 1,
+        max_backoff: float = 60,
+        checkpoint_max_events: int = 100,
+        checkpoint_max_delay: Optional[float] = 5,
+        max_event_retries: Optional[int] = 3,
+    ):
+        """
+        :param sep24: Sep24 whose withdrawals are watched
+        :param refresh_interval: Seconds between reloads of the accounts
+        :param heartbeat_timeout: Seconds without events after which a
+            stream is reopened, without backoff. None disables it
+        :param min_backoff: Seconds before the first reconnection attempt
+        :param max_backoff: Maximum seconds between reconnection attempts
+        :param checkpoint_max_events: Number of processed events after which
+            the cursors are saved
+        :param checkpoint_max_delay: Maximum seconds before the cursor of a
+            processed event is saved
+        :param max_event_retries: Number of times a failed event is retried
+            before being skipped. None retries it until it succeeds
+        """
+        self.sep24 = sep24
+        self.refresh_interval = refresh_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.max_event_retries = max_event_retries
+        self.checkpointer = CursorCheckpointer(
+            sep24.save_withdraw_anchor_account_cursor,
+            max_events=checkpoint_max_events,
+            max_delay=checkpoint_max_delay,
+        )
+        self.streams: Dict[str, AccountStream] = {}
+        self._stopping: Optional[asyncio.Event] = None
+
+    async def run(self) -> None:
+        """
+        Watch the accounts until :meth:`stop` is called
+        """
+        self._stopping = asyncio.Event()
+        try:
+            while not self._stopping.is_set():
+                try:
+                    await self.refresh()
+                except Exception:
+                    logger.exception("failed to refresh the withdrawal streams")
+                try:
+                    await asyncio.wait_for(
+                        self._stopping.wait(), timeout=self.refresh_interval
+                    )
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for account in list(self.streams):
+                await self.remove_account(account)
+            await self.checkpointer.aclose()
+
+    def stop(self) -> None:
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def refresh(self) -> None:
+        """
+        Open and close streams to match the accounts with pending withdrawals
+        """
+        index = self.sep24.pending_withdrawal_index
+        accounts: Set[str] = set()
+        pending: List[Sep24Transaction] = []
+        if index is not None:
+            index.start_resync()
+        async for withdrawals in self.sep24.iter_transactions(
+            kind="withdrawal", status="pending_user_transfer_start"
+        ):
+            accounts.update(
+                withdrawal.withdraw_anchor_account
+                for withdrawal in withdrawals
+                if withdrawal.withdraw_anchor_account
+            )
+            if index is not None:
+                pending.extend(withdrawals)
+        if index is not None:
+            index.finish_resync(pending)
+        for account in accounts.difference(self.streams):
+            self.add_account(account)
+        for account in set(self.streams).difference(accounts):
+            await self.remove_account(account)
+
+    def add_account(self, account: str) -> AccountStream:
+        stream = self.streams.get(account)
+        if stream is None:
+            logger.info(f"opening withdrawal stream for {account}")
+            stream = self.streams[account] = AccountStream(account)
+            stream.task = asyncio.ensure_future(self._run_stream(stream))
+        return stream
+
+    async def remove_account(self, account: str) -> None:
+        stream = self.streams.pop(account, None)
+        if stream is None or stream.task is None:
+            return
+        logger.info(f"closing withdrawal stream for {account}")
+        stream.task.cancel()
+        try:
+            await stream.task
+        except asyncio.CancelledError:
+            pass
+
+    def backoff(self, stream: AccountStream) -> float:
+        return min(
+            self.min_backoff * 2 ** max(stream.consecutive_failures - 1, 0),
+            self.max_backoff,
+        )
+
+    async def _run_stream(self, stream: AccountStream) -> None:
+        while True:
+            try:
+                if stream.cursor is None:
+                    # a token recorded by a previous stream of the account
+                    # may not be saved yet
+                    cursor = self.checkpointer.latest(stream.account)
+                    if cursor is None:
+                        cursor = await self.sep24.get_withdraw_anchor_account_cursor(
+                            stream.account
+                        )
+                    stream.cursor = cursor or "0"
+                await self._consume(stream)
+            except _StreamIdle:
+                # not a failure, the account may just have no transactions
+                logger.debug(
+                    f"no events from the stream of {stream.account} for "
+                    f"{self.heartbeat_timeout}s, reconnecting"
+                )
+                stream.idle_reconnects += 1
+                stream.reconnects += 1
+                continue
+            except Exception:
+                logger.exception(f"stream of {stream.account} failed")
+            stream.consecutive_failures += 1
+            await asyncio.sleep(self.backoff(stream))
+            stream.reconnects += 1
+
+    async def _consume(self, stream: AccountStream) -> None:
+        events = self.sep24.stream_withdraw_anchor_account_events(
+            stream.account, stream.cursor
+        )
+        iterator = events.__aiter__()
+        stream.connected = True
+        try:
+            while True:
+                try:
+                    response = await self._next_event(iterator)
+                except StopAsyncIteration:
+                    return
+                try:
+                    await self.sep24.process_stream_response(response, stream.account)
+                except Exception as e:
+                    stream.failed_events += 1
+                    if not self._retries_exhausted(stream, response):
+                        # retried from the current cursor on reconnection
+                        raise
+                    await self._dead_letter(stream, response, e)
+                stream.consecutive_failures = 0
+                stream.failing_event = None
+                stream.event_failures = 0
+                if "paging_token" in response:
+                    stream.cursor = response["paging_token"]
+                    await self.checkpointer.record(stream.account, stream.cursor)
+                stream.events += 1
+                stream.last_event_at = time.monotonic()
+                stream.lag = _ledger_lag(response)
+        finally:
+            stream.connected = False
+            aclose = getattr(iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    def _retries_exhausted(self, stream: AccountStream, response: Dict) -> bool:
+        paging_token = response.get("paging_token")
+        if stream.failing_event != paging_token:
+            stream.failing_event = paging_token
+            stream.event_failures = 0
+        stream.event_failures += 1
+        return (
+            self.max_event_retries is not None
+            and stream.event_failures > self.max_event_retries
+        )
+
+    async def _dead_letter(
+        self, stream: AccountStream, response: Dict, exception: Exception
+    ) -> None:
+        logger.exception(
+            f"skipping event {response.get('paging_token')} of {stream.account} "
+            f"after {stream.event_failures} failures"
+        )
+        stream.dead_letters += 1
+        try:
+            await self.sep24.dead_letter_stream_response(
+                response, stream.account, exception
+            )
+        except Exception:
+            logger.exception(
+                f"failed to dead-letter event {response.get('paging_token')} "
+                f"of {stream.account}"
+            )
+
+    async def _next_event(self, iterator: AsyncIterator[Dict[str, Any]]) -> Dict:
+        # unlike wait_for, tells the heartbeat timeout apart from a timeout
+        # raised by the stream itself
+        next_event = asyncio.ensure_future(iterator.__anext__())
+        try:
+            await asyncio.wait([next_event], timeout=self.heartbeat_timeout)
+        finally:
+            if not next_event.done():
+                next_event.cancel()
+                await asyncio.wait([next_event])
+        if next_event.cancelled():
+            raise _StreamIdle()
+        return next_event.result()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {account: stream.stats() for account, stream in self.streams.items()}
+
+
+def _ledger_lag(response: Dict[str, Any]) -> Optional[float]:
+    try:
+        created_at = datetime.strptime(response["created_at"], "%Y-%m-%dT%H:%M:%SZ")
+    except (KeyError, TypeError, ValueError):
+        return None
+    return time.time() - created_at.replace(tzinfo=timezone.utc).timestamp()
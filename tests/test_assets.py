@@ -0,0 +1,32 @@
+import unittest
+
+from fawaris import Asset
+from fawaris.assets import AssetRegistry
+
+
+class TestAssetRegistry(unittest.TestCase):
+    def test_lookups(self):
+        usd = Asset(code="USD", issuer="GA")
+        registry = AssetRegistry({"USD": usd, "XLM": Asset(code="XLM", issuer=None)})
+        assert registry.get("USD") is usd
+        assert registry.find("USD", "GA") is usd
+        assert registry.find("USD", "GB") is None
+        assert registry.is_anchor_asset("XLM", None)
+        assert not registry.is_anchor_asset("EUR", "GA")
+
+    def test_transaction_assets(self):
+        usd = Asset(code="USD", issuer="GA")
+        registry = AssetRegistry({"USD": usd}, max_transactions=2)
+        resolved = registry.set_transaction_asset("1", Asset(code="USD", issuer="GA"))
+        assert resolved is usd
+        eur = Asset(code="EUR", issuer="GA")
+        assert registry.set_transaction_asset("2", eur) is eur
+        assert registry.transaction_asset("1") is usd
+        registry.set_transaction_asset("3", eur)
+        assert registry.transaction_asset("2") is None
+        registry.forget_transaction("1")
+        assert registry.transaction_asset("1") is None
+
+
+if __name__ == "__main__":
+    unittest.main()
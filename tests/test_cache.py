@@ -0,0 +1,110 @@
+import asyncio
+import traceback
+import unittest
+
+from fawaris.cache import LRUCache, TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_expiration_and_eviction(self):
+        clock = FakeClock()
+        cache = LRUCache(max_size=2, clock=clock)
+        cache.set("a", 1, expires_at=10)
+        cache.set("b", 2, expires_at=10)
+        assert cache.get("a") == 1
+        cache.set("c", 3, expires_at=10)
+        # "b" was the least recently used entry
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        clock.now = 10
+        assert cache.get("a") is None
+        assert cache.stats() == {"hits": 2, "misses": 2, "size": 1}
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_single_flight(self):
+        async def _async():
+            calls = []
+
+            async def fetch():
+                calls.append(1)
+                await asyncio.sleep(0.01)
+                return "value"
+
+            cache = TTLCache(ttl=60)
+            results = await asyncio.gather(
+                *[cache.get_or_fetch("key", fetch) for _ in range(10)]
+            )
+            assert results == ["value"] * 10
+            assert len(calls) == 1
+            assert await cache.get_or_fetch("key", fetch) == "value"
+            assert len(calls) == 1
+            assert cache.hits == 1
+            assert cache.coalesced == 9
+
+        asyncio.run(_async())
+
+    def test_negative_caching(self):
+        async def _async():
+            clock = FakeClock()
+            calls = []
+
+            async def fetch():
+                calls.append(1)
+                raise ValueError("unreachable")
+
+            cache = TTLCache(ttl=60, negative_ttl=5, clock=clock)
+            for _ in range(3):
+                with self.assertRaises(ValueError):
+                    await cache.get_or_fetch("key", fetch)
+            assert len(calls) == 1
+            clock.now = 5
+            with self.assertRaises(ValueError):
+                await cache.get_or_fetch("key", fetch)
+            assert len(calls) == 2
+
+        asyncio.run(_async())
+
+    def test_negative_hits_dont_grow_traceback(self):
+        async def _async():
+            async def fetch():
+                raise ValueError("unreachable")
+
+            cache = TTLCache(ttl=60, negative_ttl=60)
+            depths = []
+            for _ in range(5):
+                try:
+                    await cache.get_or_fetch("key", fetch)
+                except ValueError as e:
+                    depths.append(len(traceback.extract_tb(e.__traceback__)))
+            assert len(set(depths[1:])) == 1
+
+        asyncio.run(_async())
+
+    def test_invalidate(self):
+        async def _async():
+            values = iter(["old", "new", "newer"])
+
+            async def fetch():
+                return next(values)
+
+            cache = TTLCache(ttl=60)
+            assert await cache.get_or_fetch("key", fetch) == "old"
+            await cache.invalidate("key")
+            assert await cache.get_or_fetch("key", fetch) == "new"
+            await cache.clear()
+            assert await cache.get_or_fetch("key", fetch) == "newer"
+
+        asyncio.run(_async())
+
+
+if __name__ == "__main__":
+    unittest.main()
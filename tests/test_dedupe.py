@@ -0,0 +1,100 @@
+import asyncio
+import unittest
+
+from fawaris.dedupe import ProcessedTransactionStore, TransactionDeduplicator
+
+from test_payments import (
+    ANCHOR,
+    CLIENT,
+    ISSUER,
+    WithdrawingFakeSep24,
+    payment_transaction,
+    pending_withdrawal,
+)
+
+
+class MemoryStore(ProcessedTransactionStore):
+    def __init__(self):
+        self.hashes = set()
+        self.lookups = 0
+
+    async def contains(self, transaction_hash):
+        self.lookups += 1
+        return transaction_hash in self.hashes
+
+    async def add(self, transaction_hash):
+        self.hashes.add(transaction_hash)
+
+
+class TestTransactionDeduplicator(unittest.TestCase):
+    def test_window(self):
+        now = [0.0]
+        deduplicator = TransactionDeduplicator(window=10, clock=lambda: now[0])
+        deduplicator.mark_seen("a")
+        assert deduplicator.seen("a")
+        now[0] = 10
+        assert not deduplicator.seen("a")
+        assert deduplicator.stats() == {"duplicates": 1, "size": 0}
+
+    def test_max_size(self):
+        deduplicator = TransactionDeduplicator(max_size=2)
+        for transaction_hash in "abc":
+            deduplicator.mark_seen(transaction_hash)
+        assert not deduplicator.seen("a")
+        assert deduplicator.seen("c")
+
+    def test_store(self):
+        async def _async():
+            store = MemoryStore()
+            await TransactionDeduplicator(store=store).mark_processed("a")
+            # a new process only knows "a" from the store
+            deduplicator = TransactionDeduplicator(store=store)
+            assert not deduplicator.seen("a")
+            assert await deduplicator.is_processed("a")
+            assert await deduplicator.is_processed("a")
+            assert not await deduplicator.is_processed("b")
+            assert store.lookups == 2
+
+        asyncio.run(_async())
+
+    def test_stream_replay_skips_lookups(self):
+        async def _async():
+            sep24 = WithdrawingFakeSep24()
+            envelope_xdr, result_xdr = payment_transaction(destination=ISSUER)
+            response = {
+                "successful": True,
+                "id": "abc",
+                "envelope_xdr": envelope_xdr,
+                "result_xdr": result_xdr,
+                "memo": "999",
+            }
+            await sep24.process_stream_response(response, ANCHOR)
+            await sep24.process_stream_response(response, ANCHOR)
+            assert sep24.queries == 0
+            assert sep24.transaction_deduplicator.duplicates == 1
+
+        asyncio.run(_async())
+
+    def test_unmatched_payment_not_marked_seen(self):
+        async def _async():
+            sep24 = WithdrawingFakeSep24()
+            envelope_xdr, result_xdr = payment_transaction(memo="100")
+            response = {
+                "successful": True,
+                "id": "abc",
+                "envelope_xdr": envelope_xdr,
+                "result_xdr": result_xdr,
+                "memo": "100",
+            }
+            await sep24.process_stream_response(response, ANCHOR)
+            assert sep24.queries == 1
+            # the withdrawal only becomes pending after the payment arrived,
+            # it's matched when the event is replayed
+            sep24.transactions["1"] = pending_withdrawal()
+            await sep24.process_stream_response(response, ANCHOR)
+            assert sep24.withdrawals_received == [("1", "10", CLIENT)]
+
+        asyncio.run(_async())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+
+from fawaris.domains import DomainPolicy, is_valid_hostname
+
+
+class TestDomainPolicy(unittest.TestCase):
+    def test_exact_and_wildcard_rules(self):
+        policy = DomainPolicy(["wallet.example", "*.partner.example"])
+        assert "wallet.example" in policy
+        assert "app.wallet.example" not in policy
+        assert "app.partner.example" in policy
+        assert "a.b.partner.example" in policy
+        assert "partner.example" not in policy
+        assert "otherpartner.example" not in policy
+        assert "example" not in policy
+        assert "anything.example" not in DomainPolicy([])
+
+    def test_case_and_trailing_dot(self):
+        policy = DomainPolicy(["Wallet.Example.", "*.partner.example"])
+        assert "wallet.example" in policy
+        assert "WALLET.example." in policy
+        assert "Evil.Partner.Example" in policy
+        assert "app.partner.example." in policy
+
+    def test_is_valid_hostname(self):
+        assert is_valid_hostname("wallet.example")
+        assert is_valid_hostname("localhost:8000")
+        assert not is_valid_hostname("wallet.example/path")
+
+
+if __name__ == "__main__":
+    unittest.main()
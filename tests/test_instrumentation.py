@@ -0,0 +1,32 @@
+import unittest
+
+from fawaris import HistogramInstrumentation, Instrumentation
+
+
+class TestHistogramInstrumentation(unittest.TestCase):
+    def test_histogram(self):
+        histogram = HistogramInstrumentation(buckets=[0.1, 1])
+        for seconds in [0.05, 0.1, 0.5, 2]:
+            histogram.observe("stage", seconds)
+        with histogram.timer("other"):
+            pass
+        assert histogram.count("stage") == 4
+        assert histogram.count("other") == 1
+        assert histogram.quantile("stage", 0.5) == 0.1
+        assert histogram.quantile("stage", 0.75) == 1
+        assert histogram.quantile("stage", 1) == float("inf")
+        assert histogram.quantile("missing", 0.5) is None
+        rendered = histogram.render()
+        assert 'fawaris_stage_duration_seconds_bucket{stage="stage",le="0.1"} 2' in rendered
+        assert 'fawaris_stage_duration_seconds_bucket{stage="stage",le="+Inf"} 4' in rendered
+        assert 'fawaris_stage_duration_seconds_count{stage="stage"} 4' in rendered
+
+    def test_disabled(self):
+        instrumentation = Instrumentation()
+        with instrumentation.timer("stage") as timer:
+            pass
+        assert timer is instrumentation.timer("other")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,370 @@
+import asyncio
+import unittest
+
+from stellar_sdk import (
+    Account,
+    Asset,
+    Keypair,
+    MuxedAccount,
+    Network,
+    TransactionBuilder,
+)
+from stellar_sdk import xdr as stellar_xdr
+from stellar_sdk.operation import Payment
+
+from fawaris import Asset as AnchorAsset
+from fawaris import Sep24Transaction
+from fawaris.payments import (
+    PaymentOperation,
+    iter_payment_operations,
+    payment_from_horizon_record,
+)
+
+from test_sep24 import FakeSep24
+
+ANCHOR = Keypair.random().public_key
+CLIENT = Keypair.random().public_key
+ISSUER = Keypair.random().public_key
+USD = Asset("USD", ISSUER)
+
+
+def _operation_result(op_type, **kwargs):
+    return stellar_xdr.OperationResult(
+        code=stellar_xdr.OperationResultCode.opINNER,
+        tr=stellar_xdr.OperationResultTr(type=op_type, **kwargs),
+    )
+
+
+def payment_transaction(
+    destination=ANCHOR, source=CLIENT, memo="100", received="12.5", fee_bump=False
+):
+    """
+    Base64 XDR of the envelope and result of a successful transaction with
+    a manage data operation, a payment of 10 USD and a path payment strict
+    send of USD to `destination`, and a payment of XLM to another account
+    """
+    builder = TransactionBuilder(
+        Account(source, 1), Network.TESTNET_NETWORK_PASSPHRASE, base_fee=100
+    )
+    builder.add_text_memo(memo).set_timeout(30)
+    builder.append_manage_data_op("key", "value")
+    builder.append_payment_op(destination, USD, "10")
+    builder.append_path_payment_strict_send_op(
+        destination, Asset.native(), "100", USD, "1", []
+    )
+    builder.append_payment_op(ISSUER, Asset.native(), "1")
+    envelope = builder.build()
+    envelope.sign(Keypair.random())
+    received_amount = stellar_xdr.Int64(int(float(received) * 10 ** 7))
+    results = [
+        _operation_result(
+            stellar_xdr.OperationType.MANAGE_DATA,
+            manage_data_result=stellar_xdr.ManageDataResult(
+                stellar_xdr.ManageDataResultCode.MANAGE_DATA_SUCCESS
+            ),
+        ),
+        _operation_result(
+            stellar_xdr.OperationType.PAYMENT,
+            payment_result=stellar_xdr.PaymentResult(
+                stellar_xdr.PaymentResultCode.PAYMENT_SUCCESS
+            ),
+        ),
+        _operation_result(
+            stellar_xdr.OperationType.PATH_PAYMENT_STRICT_SEND,
+            path_payment_strict_send_result=stellar_xdr.PathPaymentStrictSendResult(
+                stellar_xdr.PathPaymentStrictSendResultCode.PATH_PAYMENT_STRICT_SEND_SUCCESS,
+                success=stellar_xdr.PathPaymentStrictSendResultSuccess(
+                    offers=[],
+                    last=stellar_xdr.SimplePaymentResult(
+                        destination=Keypair.from_public_key(
+                            MuxedAccount.from_account(destination).account_id
+                        ).xdr_account_id(),
+                        asset=USD.to_xdr_object(),
+                        amount=received_amount,
+                    ),
+                ),
+            ),
+        ),
+        _operation_result(
+            stellar_xdr.OperationType.PAYMENT,
+            payment_result=stellar_xdr.PaymentResult(
+                stellar_xdr.PaymentResultCode.PAYMENT_SUCCESS
+            ),
+        ),
+    ]
+    result = stellar_xdr.TransactionResultResult(
+        stellar_xdr.TransactionResultCode.txSUCCESS, results=results
+    )
+    if fee_bump:
+        envelope = TransactionBuilder.build_fee_bump_transaction(
+            CLIENT, 200, envelope, Network.TESTNET_NETWORK_PASSPHRASE
+        )
+        result = stellar_xdr.TransactionResultResult(
+            stellar_xdr.TransactionResultCode.txFEE_BUMP_INNER_SUCCESS,
+            inner_result_pair=stellar_xdr.InnerTransactionResultPair(
+                transaction_hash=stellar_xdr.Hash(b"\0" * 32),
+                result=stellar_xdr.InnerTransactionResult(
+                    fee_charged=stellar_xdr.Int64(400),
+                    result=stellar_xdr.InnerTransactionResultResult(
+                        stellar_xdr.TransactionResultCode.txSUCCESS, results=results
+                    ),
+                    ext=stellar_xdr.InnerTransactionResultExt(0),
+                ),
+            ),
+        )
+    transaction_result = stellar_xdr.TransactionResult(
+        fee_charged=stellar_xdr.Int64(400),
+        result=result,
+        ext=stellar_xdr.TransactionResultExt(0),
+    )
+    return envelope.to_xdr(), transaction_result.to_xdr()
+
+
+class TestIterPaymentOperations(unittest.TestCase):
+    def test_payments_to_destination(self):
+        envelope_xdr, result_xdr = payment_transaction()
+        payments = list(
+            iter_payment_operations(envelope_xdr, result_xdr, destination=ANCHOR)
+        )
+        assert payments == [
+            PaymentOperation(1, CLIENT, ANCHOR, "10", "USD", ISSUER),
+            PaymentOperation(2, CLIENT, ANCHOR, "12.5", "USD", ISSUER),
+        ]
+        payments = list(iter_payment_operations(envelope_xdr, result_xdr))
+        assert len(payments) == 3
+        assert payments[2] == PaymentOperation(3, CLIENT, ISSUER, "1", "XLM", None)
+
+    def test_muxed_accounts(self):
+        muxed_destination = MuxedAccount(ANCHOR, 7).account_muxed
+        muxed_source = MuxedAccount(CLIENT, 9).account_muxed
+        envelope_xdr, result_xdr = payment_transaction(
+            destination=muxed_destination, source=muxed_source
+        )
+        payment = next(
+            iter_payment_operations(envelope_xdr, result_xdr, destination=ANCHOR)
+        )
+        assert payment.destination == ANCHOR
+        assert payment.source == muxed_source
+
+    def test_fee_bump(self):
+        envelope_xdr, result_xdr = payment_transaction(fee_bump=True)
+        payments = list(
+            iter_payment_operations(envelope_xdr, result_xdr, destination=ANCHOR)
+        )
+        assert [payment.amount for payment in payments] == ["10", "12.5"]
+
+    def test_other_destination(self):
+        envelope_xdr, result_xdr = payment_transaction(destination=ISSUER)
+        assert list(iter_payment_operations(envelope_xdr, result_xdr, ANCHOR)) == []
+
+
+class WithdrawingFakeSep24(FakeSep24):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.assets = {"USD": AnchorAsset(code="USD", issuer=ISSUER)}
+        self.withdrawals_received = []
+        self.queries = 0
+        self.asset_queries = 0
+
+    async def get_transactions(self, **kwargs):
+        self.queries += 1
+        return await super().get_transactions(**kwargs)
+
+    async def get_transaction_asset(self, transaction):
+        self.asset_queries += 1
+        return AnchorAsset(code="USD", issuer=ISSUER)
+
+    async def process_withdrawal_received(
+        self, transaction, amount_received, from_address, horizon_response
+    ):
+        self.withdrawals_received.append(
+            (transaction.id, amount_received, from_address)
+        )
+
+
+def pending_withdrawal():
+    return Sep24Transaction(
+        id="1",
+        kind="withdrawal",
+        status="pending_user_transfer_start",
+        withdraw_anchor_account=ANCHOR,
+        withdraw_memo="100",
+    )
+
+
+def payment_record(operation_id, asset_code="USD", **kwargs):
+    return {
+        "id": str(operation_id),
+        "paging_token": str(operation_id),
+        "type": "payment",
+        "transaction_successful": True,
+        "transaction_hash": "abc",
+        "from": CLIENT,
+        "to": ANCHOR,
+        "amount": "10.0000000",
+        "asset_type": "credit_alphanum4",
+        "asset_code": asset_code,
+        "asset_issuer": ISSUER,
+        "transaction": {"id": "abc", "hash": "abc", "memo": "100"},
+        **kwargs,
+    }
+
+
+class TestPaymentFromHorizonRecord(unittest.TestCase):
+    def test_payment(self):
+        assert payment_from_horizon_record(
+            payment_record(4294971393)
+        ) == PaymentOperation(0, CLIENT, ANCHOR, "10", "USD", ISSUER)
+        native = payment_from_horizon_record(
+            payment_record(4294971394, asset_type="native", from_muxed="M...")
+        )
+        assert (native.index, native.source, native.code, native.issuer) == (
+            1,
+            "M...",
+            "XLM",
+            None,
+        )
+        record = payment_record(1, type="create_account")
+        assert payment_from_horizon_record(record) is None
+
+
+class TestDeprecatedHooks(unittest.TestCase):
+    def test_overrides_rejected(self):
+        with self.assertRaisesRegex(TypeError, "override find_matching_payment"):
+
+            class LegacySep24(WithdrawingFakeSep24):
+                async def get_payment_values(self, operation, op_result):
+                    pass
+
+        with self.assertRaisesRegex(TypeError, "PaymentOperation"):
+
+            class LegacyMatchSep24(WithdrawingFakeSep24):
+                async def check_for_payment_match(self, operation, op_result, tx):
+                    pass
+
+        class MatchSep24(WithdrawingFakeSep24):
+            async def check_for_payment_match(self, payment, transaction):
+                return True
+
+    def test_wrappers(self):
+        async def _async():
+            sep24 = WithdrawingFakeSep24()
+            envelope_xdr, result_xdr = payment_transaction()
+            response = {"envelope_xdr": envelope_xdr, "result_xdr": result_xdr}
+            with self.assertWarns(DeprecationWarning):
+                values, source = await sep24.find_matching_payment_data(
+                    response, None, [], pending_withdrawal()
+                )
+            assert values == {
+                "destination": ANCHOR,
+                "amount": "10",
+                "code": "USD",
+                "issuer": ISSUER,
+            }
+            assert source == CLIENT
+            operation = Payment(ANCHOR, USD, "10")
+            with self.assertWarns(DeprecationWarning):
+                assert await sep24.get_payment_values(operation, None) == values
+
+        asyncio.run(_async())
+
+
+class TestProcessStreamResponse(unittest.TestCase):
+    def test_withdrawal_received_once(self):
+        async def _async():
+            sep24 = WithdrawingFakeSep24([pending_withdrawal()])
+            envelope_xdr, result_xdr = payment_transaction()
+            response = {
+                "successful": True,
+                "id": "abc",
+                "envelope_xdr": envelope_xdr,
+                "result_xdr": result_xdr,
+                "memo": "100",
+            }
+            await sep24.process_stream_response(response, ANCHOR)
+            # replayed event
+            await sep24.process_stream_response(response, ANCHOR)
+            assert sep24.withdrawals_received == [("1", "10", CLIENT)]
+
+        asyncio.run(_async())
+
+    def test_payments_decoded_once(self):
+        class DecodingSep24(WithdrawingFakeSep24):
+            decodes = 0
+
+            def _anchor_payments(self, *args):
+                self.decodes += 1
+                return super()._anchor_payments(*args)
+
+        async def _async():
+            sep24 = DecodingSep24([pending_withdrawal()])
+            envelope_xdr, result_xdr = payment_transaction()
+            response = {
+                "successful": True,
+                "id": "abc",
+                "envelope_xdr": envelope_xdr,
+                "result_xdr": result_xdr,
+                "memo": "100",
+            }
+            await sep24.process_stream_response(response, ANCHOR)
+            assert sep24.withdrawals_received == [("1", "10", CLIENT)]
+            assert sep24.decodes == 1
+
+        asyncio.run(_async())
+
+    def test_transaction_asset_resolved_once(self):
+        async def _async():
+            sep24 = WithdrawingFakeSep24()
+            withdrawal = pending_withdrawal()
+            envelope_xdr, result_xdr = payment_transaction()
+            payment = await sep24.find_matching_payment(
+                envelope_xdr, result_xdr, ANCHOR, withdrawal
+            )
+            assert payment.amount == "10"
+            for payment in iter_payment_operations(envelope_xdr, result_xdr):
+                await sep24.check_for_payment_match(payment, withdrawal)
+            assert sep24.asset_queries == 1
+            # forgotten once received
+            await sep24._receive_withdrawal(withdrawal, payment, "abc", {})
+            await sep24.check_for_payment_match(payment, withdrawal)
+            assert sep24.asset_queries == 2
+
+        asyncio.run(_async())
+
+    def test_other_assets_skipped_without_io(self):
+        async def _async():
+            sep24 = WithdrawingFakeSep24()
+            sep24.assets = {"USD": AnchorAsset(code="USD", issuer=CLIENT)}
+            envelope_xdr, result_xdr = payment_transaction()
+            payment = await sep24.find_matching_payment(
+                envelope_xdr, result_xdr, ANCHOR, pending_withdrawal()
+            )
+            assert payment is None
+            assert sep24.asset_queries == 0
+
+        asyncio.run(_async())
+
+    def test_payments_mode(self):
+        async def _async():
+            sep24 = WithdrawingFakeSep24(
+                [pending_withdrawal()], withdrawal_stream_mode="payments"
+            )
+            # not an anchor asset, dropped before any lookup
+            await sep24.process_stream_response(payment_record(1, "EUR"), ANCHOR)
+            # to another account
+            await sep24.process_stream_response(
+                payment_record(2, to=ISSUER), ANCHOR
+            )
+            assert sep24.queries == 0
+            await sep24.process_stream_response(payment_record(3), ANCHOR)
+            # second payment of the same transaction, and replay
+            await sep24.process_stream_response(payment_record(4), ANCHOR)
+            await sep24.process_stream_response(payment_record(3), ANCHOR)
+            assert sep24.withdrawals_received == [("1", "10", CLIENT)]
+            assert sep24.queries == 1
+
+        asyncio.run(_async())
+
+
+if __name__ == "__main__":
+    unittest.main()
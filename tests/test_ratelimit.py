@@ -0,0 +1,65 @@
+import asyncio
+import unittest
+
+from fawaris import RateLimit, Sep10AdmissionControl, Sep10RateLimitExceeded
+from fawaris.ratelimit import MemoryRateLimitStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestMemoryRateLimitStore(unittest.TestCase):
+    def test_token_bucket(self):
+        async def _async():
+            clock = FakeClock()
+            store = MemoryRateLimitStore(clock=clock)
+            limit = RateLimit(rate=1, burst=2)
+            assert await store.consume("key", limit)
+            assert await store.consume("key", limit)
+            assert not await store.consume("key", limit)
+            assert await store.consume("other", limit)
+            clock.now = 1
+            assert await store.consume("key", limit)
+            assert not await store.consume("key", limit)
+
+        asyncio.run(_async())
+
+
+class TestSep10AdmissionControl(unittest.TestCase):
+    def test_admit(self):
+        async def _async():
+            admission = Sep10AdmissionControl(
+                account_limit=RateLimit(rate=0.1, burst=1),
+                home_domain_limit=RateLimit(rate=0.1, burst=2),
+            )
+            await admission.admit(account="A", home_domain="localhost")
+            with self.assertRaises(Sep10RateLimitExceeded):
+                await admission.admit(account="A", home_domain="localhost")
+            await admission.admit(account="B", home_domain="localhost")
+            with self.assertRaises(Sep10RateLimitExceeded):
+                await admission.admit(account="C", home_domain="localhost")
+
+        asyncio.run(_async())
+
+    def test_client_domain_fetch(self):
+        async def _async():
+            admission = Sep10AdmissionControl(max_client_domain_fetches=1)
+            async with admission.client_domain_fetch("wallet.example"):
+                async with admission.client_domain_fetch("other.example"):
+                    pass
+                with self.assertRaises(Sep10RateLimitExceeded):
+                    async with admission.client_domain_fetch("wallet.example"):
+                        pass
+            async with admission.client_domain_fetch("wallet.example"):
+                pass
+
+        asyncio.run(_async())
+
+
+if __name__ == "__main__":
+    unittest.main()
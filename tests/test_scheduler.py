@@ -0,0 +1,66 @@
+import asyncio
+import unittest
+
+from fawaris.scheduler import ScheduledTask, TaskScheduler
+
+
+class TestTaskScheduler(unittest.TestCase):
+    def test_no_overlap_and_backoff(self):
+        async def _async():
+            running = []
+            overlaps = []
+
+            async def slow():
+                if running:
+                    overlaps.append(1)
+                running.append(1)
+                await asyncio.sleep(0.05)
+                running.pop()
+
+            async def failing():
+                raise RuntimeError("failed")
+
+            slow_task = ScheduledTask("slow", slow, interval=0.01)
+            failing_task = ScheduledTask(
+                "failing", failing, interval=0.01, max_backoff=0.04
+            )
+            scheduler = TaskScheduler([slow_task, failing_task])
+            asyncio.get_running_loop().call_later(0.2, scheduler.stop)
+            await scheduler.run()
+
+            assert not overlaps
+            assert not running
+            assert slow_task.runs >= 2
+            assert slow_task.skipped_ticks > 0
+            assert slow_task.stats()["last_duration"] >= 0.05
+            # without backoff it would have run ~20 times
+            assert 2 <= failing_task.runs < 10
+            assert failing_task.consecutive_failures == failing_task.runs
+            assert scheduler.stats()["failing"]["failures"] == failing_task.runs
+
+        asyncio.run(_async())
+
+    def test_backoff_starts_after_first_failure(self):
+        async def _async():
+            loop = asyncio.get_running_loop()
+            started_at = loop.time()
+            runs = []
+
+            async def failing():
+                runs.append(loop.time() - started_at)
+                raise RuntimeError("failed")
+
+            task = ScheduledTask("failing", failing, interval=0.05, max_backoff=1)
+            scheduler = TaskScheduler([task])
+            loop.call_later(0.25, scheduler.stop)
+            await scheduler.run()
+
+            # runs at 0, 0.1 and 0.3 (not 0.05) with the backoff
+            assert len(runs) == 2
+            assert runs[1] >= 0.09
+
+        asyncio.run(_async())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,104 @@
 import asyncio
+import json
+import time
 import unittest
-from stellar_sdk import Network, Keypair, TransactionEnvelope
-from fawaris import Sep10, Sep10GetRequest, Sep10PostRequest
+from stellar_sdk import Network, Keypair, MuxedAccount, TransactionEnvelope
+from stellar_sdk.client.base_async_client import BaseAsyncClient
+from stellar_sdk.client.response import Response
+from stellar_sdk.exceptions import NotFoundError
+from fawaris import (
+    CryptoExecutor,
+    HistogramInstrumentation,
+    Sep10,
+    Sep10Token,
+    Sep10TokenCache,
+    Sep10GetRequest,
+    Sep10PostRequest,
+    TTLCache,
+    Sep10InvalidToken,
+    RateLimit,
+    Sep10AdmissionControl,
+    Sep10RateLimitExceeded,
+)
+
+SERVER_SIGNING_SECRET = "SALAW2MR7I7L47W5ZKJXJMGUZSKRSTVUQ7O3ZHEZ6O7MUKLDGWZ5U2JW"
+CLIENT_ACCOUNT_SECRET = "SBLZPFTQY74COGBRJYKC6Y3X46KDYO46BPBRZK27IXUQ73DP6IDNUB7X"
+
+
+class FakeHorizonClient(BaseAsyncClient):
+    """
+    Serves the Horizon accounts endpoint and stellar.toml files from memory
+    """
+
+    def __init__(self, accounts=None, tomls=None):
+        self.accounts = accounts or {}
+        self.tomls = tomls or {}
+        self.requests = []
+
+    async def get(self, url, params=None):
+        self.requests.append(url)
+        if url.endswith("/.well-known/stellar.toml"):
+            domain = url.split("/")[2]
+            if domain not in self.tomls:
+                return Response(404, "", {}, url)
+            return Response(200, self.tomls[domain], {}, url)
+        account_id = url.rstrip("/").split("/")[-1]
+        if account_id not in self.accounts:
+            return Response(404, json.dumps({"status": 404}), {}, url)
+        return Response(200, json.dumps(self.accounts[account_id]), {}, url)
+
+    async def post(self, url, data=None):
+        raise NotImplementedError()
+
+    async def stream(self, url, params=None):
+        raise NotImplementedError()
+
+    async def close(self):
+        pass
+
+
+def horizon_account(account_id, signers=None, med_threshold=0):
+    return {
+        "id": account_id,
+        "account_id": account_id,
+        "sequence": "1",
+        "thresholds": {
+            "low_threshold": 0,
+            "med_threshold": med_threshold,
+            "high_threshold": 0,
+        },
+        "signers": signers
+        or [{"key": account_id, "weight": 1, "type": "ed25519_public_key"}],
+    }
+
+
+async def authenticate(sep10, client_kp, signers=None, **request):
+    resp = await sep10.http_get(
+        Sep10GetRequest(
+            account=request.pop("account", client_kp.public_key),
+            home_domain="localhost",
+            **request,
+        )
+    )
+    envelope = TransactionEnvelope.from_xdr(
+        resp.transaction, Network.TESTNET_NETWORK_PASSPHRASE
+    )
+    for signer in signers or [client_kp]:
+        envelope.sign(signer)
+    return await sep10.http_post(Sep10PostRequest(transaction=envelope.to_xdr()))
+
+
+def offline_sep10(horizon, **kwargs):
+    return Sep10(
+        "http://localhost",
+        ["localhost"],
+        "https://horizon-testnet.stellar.org",
+        Network.TESTNET_NETWORK_PASSPHRASE,
+        SERVER_SIGNING_SECRET,
+        "jwtsecret",
+        http_client=horizon,
+        **kwargs,
+    )
 
 
 class TestSep10(unittest.TestCase):
@@ -47,5 +144,265 @@ class TestSep10(unittest.TestCase):
         asyncio.run(_async())
 
 
+class TestSep10Verification(unittest.TestCase):
+    def test_client_domain_and_muxed_account(self):
+        async def _async():
+            client_kp = Keypair.from_secret(CLIENT_ACCOUNT_SECRET)
+            client_domain_kp = Keypair.random()
+            horizon = FakeHorizonClient(
+                {client_kp.public_key: horizon_account(client_kp.public_key)},
+                {"wallet.test": f'SIGNING_KEY = "{client_domain_kp.public_key}"'},
+            )
+            sep10 = offline_sep10(horizon)
+            resp = await authenticate(
+                sep10,
+                client_kp,
+                signers=[client_kp, client_domain_kp],
+                client_domain="wallet.test",
+            )
+            token = Sep10Token(resp.token, "jwtsecret")
+            assert token.client_domain == "wallet.test"
+
+            muxed = MuxedAccount(client_kp.public_key, 123).account_muxed
+            resp = await authenticate(sep10, client_kp, account=muxed)
+            token = Sep10Token(resp.token, "jwtsecret")
+            assert token.muxed_account == muxed
+            assert token.account == client_kp.public_key
+
+        asyncio.run(_async())
+
+    def test_invalid_signatures(self):
+        async def _async():
+            client_kp = Keypair.from_secret(CLIENT_ACCOUNT_SECRET)
+            other_kp = Keypair.random()
+            horizon = FakeHorizonClient(
+                {
+                    client_kp.public_key: horizon_account(
+                        client_kp.public_key, med_threshold=2
+                    )
+                }
+            )
+            sep10 = offline_sep10(horizon)
+            with self.assertRaises(ValueError):
+                # doesn't meet the threshold
+                await authenticate(sep10, client_kp)
+            with self.assertRaises(ValueError):
+                await authenticate(sep10, client_kp, signers=[other_kp])
+            with self.assertRaises(ValueError):
+                # the account doesn't exist, only the master key can sign
+                await authenticate(
+                    sep10, other_kp, signers=[other_kp, client_kp]
+                )
+
+        asyncio.run(_async())
+
+
+class TestSep10Instrumentation(unittest.TestCase):
+    def test_stages_are_timed(self):
+        async def _async():
+            client_kp = Keypair.from_secret(CLIENT_ACCOUNT_SECRET)
+            horizon = FakeHorizonClient(
+                {client_kp.public_key: horizon_account(client_kp.public_key)}
+            )
+            histogram = HistogramInstrumentation()
+            sep10 = offline_sep10(horizon, instrumentation=histogram)
+            await authenticate(sep10, client_kp)
+            for stage in [
+                "sep10.http_get",
+                "sep10.build_challenge",
+                "sep10.http_post",
+                "sep10.read_challenge",
+                "sep10.load_account",
+                "sep10.verify_challenge",
+                "sep10.encode_jwt",
+            ]:
+                assert histogram.count(stage) == 1, stage
+
+        asyncio.run(_async())
+
+
+class TestSep10Batch(unittest.TestCase):
+    def test_http_post_batch(self):
+        async def _async():
+            client_kp = Keypair.from_secret(CLIENT_ACCOUNT_SECRET)
+            new_kp = Keypair.random()
+            horizon = FakeHorizonClient(
+                {client_kp.public_key: horizon_account(client_kp.public_key)}
+            )
+            sep10 = offline_sep10(horizon)
+
+            async def signed_challenge(kp, signer):
+                resp = await sep10.http_get(
+                    Sep10GetRequest(account=kp.public_key, home_domain="localhost")
+                )
+                envelope = TransactionEnvelope.from_xdr(
+                    resp.transaction, Network.TESTNET_NETWORK_PASSPHRASE
+                )
+                envelope.sign(signer)
+                return Sep10PostRequest(transaction=envelope.to_xdr())
+
+            requests = [
+                await signed_challenge(client_kp, client_kp),
+                await signed_challenge(new_kp, new_kp),
+                await signed_challenge(client_kp, new_kp),
+                Sep10PostRequest(transaction="invalid"),
+                await signed_challenge(client_kp, client_kp),
+            ]
+            results = await sep10.http_post_batch(requests, max_concurrency=2)
+            assert Sep10Token(results[0].token, "jwtsecret").account == (
+                client_kp.public_key
+            )
+            assert Sep10Token(results[1].token, "jwtsecret").account == (
+                new_kp.public_key
+            )
+            assert isinstance(results[2], ValueError)
+            assert isinstance(results[3], Exception)
+            assert results[4].token
+            assert len(horizon.requests) == 2
+
+            with self.assertRaises(ValueError):
+                await sep10.http_post_batch(requests, max_concurrency=0)
+
+            # the second challenge of the same account is rejected
+            sep10.admission_control = Sep10AdmissionControl(
+                account_limit=RateLimit(rate=0.001, burst=1)
+            )
+            results = await sep10.http_post_batch([requests[0], requests[4]])
+            assert results[0].token
+            assert isinstance(results[1], Sep10RateLimitExceeded)
+
+        asyncio.run(_async())
+
+
+class TestSep10AdmissionControl(unittest.TestCase):
+    def test_rejected_requests_take_no_tokens(self):
+        async def _async():
+            client_kp = Keypair.from_secret(CLIENT_ACCOUNT_SECRET)
+            sep10 = offline_sep10(
+                FakeHorizonClient(),
+                client_domains_denied=["*.evil.example"],
+                admission_control=Sep10AdmissionControl(
+                    account_limit=RateLimit(rate=0.001, burst=1)
+                ),
+            )
+            request = Sep10GetRequest(
+                account=client_kp.public_key, home_domain="localhost"
+            )
+            for _ in range(3):
+                with self.assertRaisesRegex(ValueError, "denied"):
+                    await sep10.http_get(
+                        request.copy(update={"client_domain": "a.evil.example"})
+                    )
+            await sep10.http_get(request)
+            with self.assertRaises(Sep10RateLimitExceeded):
+                await sep10.http_get(request)
+
+        asyncio.run(_async())
+
+
+class TestSep10Executor(unittest.TestCase):
+    def test_pool_modes(self):
+        async def _async(executor):
+            client_kp = Keypair.from_secret(CLIENT_ACCOUNT_SECRET)
+            horizon = FakeHorizonClient(
+                {client_kp.public_key: horizon_account(client_kp.public_key)}
+            )
+            sep10 = offline_sep10(horizon, executor=executor)
+            results = await asyncio.gather(
+                *[authenticate(sep10, client_kp) for _ in range(4)]
+            )
+            assert all(resp.token for resp in results)
+            with self.assertRaises(ValueError):
+                await authenticate(sep10, client_kp, signers=[Keypair.random()])
+
+        for mode in ["thread", "process"]:
+            executor = CryptoExecutor(mode, max_workers=2, max_pending=2)
+            try:
+                asyncio.run(_async(executor))
+            finally:
+                executor.shutdown()
+            # the failed verification is not counted
+            assert executor.stats()["queue_wait_count"] == 14
+
+
+class TestSep10AccountSignersCache(unittest.TestCase):
+    def test_cached_signers(self):
+        async def _async():
+            client_kp = Keypair.from_secret(CLIENT_ACCOUNT_SECRET)
+            horizon = FakeHorizonClient(
+                {client_kp.public_key: horizon_account(client_kp.public_key)}
+            )
+            sep10 = offline_sep10(
+                horizon,
+                account_signers_cache=TTLCache(
+                    ttl=30, negative_exceptions=(NotFoundError,)
+                ),
+            )
+            assert (await authenticate(sep10, client_kp)).token
+            assert (await authenticate(sep10, client_kp)).token
+            assert len(horizon.requests) == 1
+
+            await sep10.process_account_effect(
+                {"type": "signer_updated", "account": client_kp.public_key}
+            )
+            assert (await authenticate(sep10, client_kp)).token
+            assert len(horizon.requests) == 2
+
+        asyncio.run(_async())
+
+    def test_cached_missing_account(self):
+        async def _async():
+            client_kp = Keypair.random()
+            horizon = FakeHorizonClient()
+            sep10 = offline_sep10(
+                horizon,
+                account_signers_cache=TTLCache(
+                    ttl=30, negative_exceptions=(NotFoundError,)
+                ),
+            )
+            assert (await authenticate(sep10, client_kp)).token
+            assert (await authenticate(sep10, client_kp)).token
+            assert len(horizon.requests) == 1
+
+        asyncio.run(_async())
+
+
+class TestSep10TokenCache(unittest.TestCase):
+    def test_token_cache(self):
+        async def _async():
+            client_kp = Keypair.from_secret(CLIENT_ACCOUNT_SECRET)
+            horizon = FakeHorizonClient(
+                {client_kp.public_key: horizon_account(client_kp.public_key)}
+            )
+            resp = await authenticate(offline_sep10(horizon), client_kp)
+            return resp.token
+
+        jwt = asyncio.run(_async())
+        cache = Sep10TokenCache("jwtsecret")
+        token = cache.get_token(jwt)
+        assert cache.get_token(jwt) is token
+        assert token.account == Keypair.from_secret(CLIENT_ACCOUNT_SECRET).public_key
+        with self.assertRaises(Sep10InvalidToken):
+            cache.get_token(jwt + "x")
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["size"] == 1
+        assert cache.hit_rate == 1 / 3
+
+    def test_from_verified_payload(self):
+        client_kp = Keypair.from_secret(CLIENT_ACCOUNT_SECRET)
+        now = int(time.time())
+        payload = {
+            "iss": "http://localhost/auth",
+            "sub": f"{client_kp.public_key}:123",
+            "iat": now,
+            "exp": now + 60,
+        }
+        verified = Sep10Token(dict(payload), "jwtsecret")
+        token = Sep10Token.from_verified_payload(payload)
+        for attr in ["account", "muxed_account", "memo", "issued_at", "expires_at"]:
+            assert getattr(token, attr) == getattr(verified, attr)
+        assert token.memo == 123
+
+
 if __name__ == "__main__":
     unittest.main()
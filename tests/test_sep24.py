@@ -0,0 +1,357 @@
+import asyncio
+import unittest
+
+from stellar_sdk import Network
+
+from fawaris import (
+    Asset,
+    Sep24,
+    Sep24DepositPostRequest,
+    Sep24InfoRequest,
+    Sep24InfoResponse,
+    Sep24Transaction,
+    Sep24WithdrawPostRequest,
+    TTLCache,
+)
+from fawaris.concurrency import BatchBuffer, gather_bounded
+
+
+class FakeSep24(Sep24):
+    """
+    Sep24 implementation keeping the transactions in memory
+    """
+
+    def __init__(self, transactions=(), **kwargs):
+        super().__init__(
+            "jwtsecret",
+            "https://horizon-testnet.stellar.org",
+            Network.TESTNET_NETWORK_PASSPHRASE,
+            {"USD": Asset(code="USD", issuer=None)},
+            **kwargs,
+        )
+        self.transactions = {tx.id: tx for tx in transactions}
+        self.received = set()
+        self.updates = []
+        self.running = 0
+        self.max_running = 0
+
+    async def http_get_info(self, request):
+        raise NotImplementedError()
+
+    async def http_get_fee(self, request, token=None):
+        raise NotImplementedError()
+
+    async def http_get_transactions(self, request, token):
+        raise NotImplementedError()
+
+    async def http_get_transaction(self, request, token):
+        raise NotImplementedError()
+
+    async def create_transaction(self, request, token):
+        raise NotImplementedError()
+
+    async def get_interactive_url(self, request, token, tx):
+        raise NotImplementedError()
+
+    async def get_transactions(
+        self, kind=None, status=None, memo=None, withdraw_anchor_account=None
+    ):
+        return [
+            tx
+            for tx in self.transactions.values()
+            if (kind is None or tx.kind == kind)
+            and (status is None or tx.status == status)
+            and (memo is None or tx.withdraw_memo == memo)
+            and (
+                withdraw_anchor_account is None
+                or tx.withdraw_anchor_account == withdraw_anchor_account
+            )
+        ]
+
+    async def get_transaction_asset(self, transaction):
+        return self.assets["USD"]
+
+    async def is_deposit_received(self, deposit):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            if deposit.id == "slow":
+                await asyncio.sleep(10)
+            elif deposit.id == "error":
+                raise RuntimeError("bank API error")
+            await asyncio.sleep(0)
+            return deposit.id in self.received
+        finally:
+            self.running -= 1
+
+    async def is_withdrawal_complete(self, withdrawal):
+        return True
+
+    async def process_withdrawal_received(
+        self, transaction, amount_received, from_address, horizon_response
+    ):
+        raise NotImplementedError()
+
+    async def update_transactions(self, transactions, **values):
+        self.updates.append(([tx.id for tx in transactions], values))
+        for tx in transactions:
+            self.transactions[tx.id] = tx.copy(update=values)
+
+    async def send_withdrawal(self, withdrawal):
+        pass
+
+    async def send_deposit(self, deposit):
+        pass
+
+    async def get_withdraw_anchor_account_cursor(self, account):
+        return None
+
+
+class PaginatedFakeSep24(FakeSep24):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pages = 0
+
+    async def get_transactions_page(self, after_id=None, limit=500, **filters):
+        self.pages += 1
+        transactions = sorted(
+            await self.get_transactions(**filters), key=lambda tx: tx.id
+        )
+        if after_id is not None:
+            transactions = [tx for tx in transactions if tx.id > after_id]
+        return transactions[:limit]
+
+
+class BatchFakeSep24(FakeSep24):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batches = []
+
+    async def is_deposit_received(self, deposit):
+        raise AssertionError("the batch hook must be used")
+
+    async def are_deposits_received(self, deposits):
+        self.batches.append([tx.id for tx in deposits])
+        if "error" in self.batches[-1]:
+            raise RuntimeError("bank API error")
+        return {tx.id: True for tx in deposits if tx.id in self.received}
+
+
+class InfoFakeSep24(FakeSep24):
+    """
+    FakeSep24 whose /info enables deposits of USD and withdrawals of nothing
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.info_requests = []
+
+    async def http_get_info(self, request):
+        self.info_requests.append(request.lang)
+        return Sep24InfoResponse(
+            deposit={"USD": {"enabled": True}},
+            withdraw={"USD": {"enabled": False}},
+            fee={"authentication_required": False, "enabled": False},
+            features={"account_creation": False, "claimable_balances": False},
+        )
+
+    async def create_transaction(self, request, token):
+        return Sep24Transaction(id="new", kind="deposit", status="incomplete")
+
+    async def get_interactive_url(self, request, token, tx):
+        return f"https://anchor.example/{tx.id}"
+
+
+def deposit(id, status="pending_user_transfer_start"):
+    return Sep24Transaction(id=id, kind="deposit", status=status)
+
+
+class TestGatherBounded(unittest.TestCase):
+    def test_results_in_order(self):
+        async def _async():
+            async def double(value):
+                await asyncio.sleep(0.001 * (10 - value))
+                if value == 3:
+                    raise ValueError(value)
+                return value * 2
+
+            results = await gather_bounded(double, range(10), max_concurrency=3)
+            assert results[:3] == [0, 2, 4]
+            assert isinstance(results[3], ValueError)
+            assert results[4:] == [8, 10, 12, 14, 16, 18]
+
+        asyncio.run(_async())
+
+
+class TestBatchBuffer(unittest.TestCase):
+    def test_flush_by_size_and_delay(self):
+        async def _async():
+            batches = []
+
+            async def flush(items):
+                batches.append(items)
+
+            buffer = BatchBuffer(flush, max_size=3, max_delay=0.01)
+            for i in range(7):
+                await buffer.add(i)
+            assert batches == [[0, 1, 2], [3, 4, 5]]
+            await asyncio.sleep(0.05)
+            assert batches == [[0, 1, 2], [3, 4, 5], [6]]
+            await buffer.add(7)
+            await buffer.aclose()
+            assert batches[-1] == [7]
+            assert len(buffer) == 0
+
+        asyncio.run(_async())
+
+
+class TestSep24Tasks(unittest.TestCase):
+    def test_poll_deposits_bounded(self):
+        async def _async():
+            deposits = [deposit(str(i)) for i in range(50)]
+            deposits += [deposit("slow"), deposit("error")]
+            sep24 = FakeSep24(
+                deposits, task_max_concurrency=5, task_item_timeout=0.1
+            )
+            sep24.received = {"1", "2", "slow", "error"}
+            await sep24.task_poll_deposits_to_receive()
+            assert sep24.max_running == 5
+            assert sep24.transactions["1"].status == "pending_anchor"
+            assert sep24.transactions["2"].status == "pending_anchor"
+            assert sep24.transactions["3"].status == "pending_user_transfer_start"
+            # timed out and failed checks are left for the next run
+            assert sep24.transactions["slow"].status == "pending_user_transfer_start"
+            assert sep24.transactions["error"].status == "pending_user_transfer_start"
+
+        asyncio.run(_async())
+
+    def test_task_limits(self):
+        sep24 = FakeSep24(task_item_timeout=5)
+        assert sep24._task_limits("task_poll_deposits_to_receive") == (50, 5)
+        # sends aren't timed out unless explicitly configured
+        assert sep24._task_limits("task_send_deposits") == (50, None)
+        sep24 = FakeSep24(
+            task_max_concurrency={"task_send_withdrawals": 2},
+            task_item_timeout={"task_send_withdrawals": 30},
+        )
+        assert sep24._task_limits("task_send_withdrawals") == (2, 30)
+        assert sep24._task_limits("task_poll_withdrawals_sent") == (50, None)
+        with self.assertRaises(ValueError):
+            FakeSep24(task_max_concurrency={"task_send": 2})
+
+    def test_poll_deposits_paginated(self):
+        async def _async():
+            deposits = [deposit(f"{i:02}") for i in range(25)]
+            sep24 = PaginatedFakeSep24(deposits, task_page_size=10)
+            sep24.received = {"03", "12", "24"}
+            pages = [
+                [tx.id for tx in page]
+                async for page in sep24.iter_transactions(kind="deposit")
+            ]
+            assert [len(page) for page in pages] == [10, 10, 5]
+            assert sum(pages, []) == sorted(sep24.transactions)
+            await sep24.task_poll_deposits_to_receive()
+            # updates are buffered across pages
+            assert [ids for ids, _ in sep24.updates] == [["03", "12", "24"]]
+            assert sep24.pages == 6
+
+        asyncio.run(_async())
+
+    def test_iter_transactions_fallback(self):
+        async def _async():
+            sep24 = FakeSep24([deposit("1"), deposit("2")], task_page_size=1)
+            pages = [page async for page in sep24.iter_transactions()]
+            assert [[tx.id for tx in page] for page in pages] == [["1", "2"]]
+
+        asyncio.run(_async())
+
+    def test_poll_deposits_batch(self):
+        async def _async():
+            deposits = [deposit(f"{i:02}") for i in range(25)] + [deposit("error")]
+            sep24 = BatchFakeSep24(deposits, task_batch_size=10)
+            sep24.received = {"03", "12", "24", "error"}
+            await sep24.task_poll_deposits_to_receive()
+            assert [len(batch) for batch in sep24.batches] == [10, 10, 6]
+            assert sep24.updates == [(["03", "12"], {"status": "pending_anchor"})]
+            # the failed chunk is left for the next run
+            assert sep24.transactions["24"].status == "pending_user_transfer_start"
+
+        asyncio.run(_async())
+
+    def test_poll_deposits_flushes_incrementally(self):
+        async def _async():
+            deposits = [deposit(str(i)) for i in range(6)] + [deposit("slow")]
+            sep24 = FakeSep24(
+                deposits, task_flush_size=2, task_flush_delay=None, task_item_timeout=1
+            )
+            sep24.received = {"0", "1", "2", "3", "4"}
+            task = asyncio.ensure_future(sep24.task_poll_deposits_to_receive())
+            await asyncio.sleep(0.1)
+            # completed checks are saved while the slow one is still running
+            assert [ids for ids, _ in sep24.updates] == [["0", "1"], ["2", "3"]]
+            await task
+            assert [ids for ids, _ in sep24.updates][-1] == ["4"]
+
+        asyncio.run(_async())
+
+    def test_create_scheduler(self):
+        sep24 = FakeSep24()
+        scheduler = sep24.create_scheduler(
+            {"task_send_deposits": 30, "task_send_withdrawals": None}
+        )
+        intervals = {task.name: task.interval for task in scheduler.tasks}
+        assert intervals == {
+            "task_poll_deposits_to_receive": 10,
+            "task_send_deposits": 30,
+            "task_poll_withdrawals_sent": 10,
+        }
+        with self.assertRaises(ValueError):
+            sep24.create_scheduler({"task_send_deposit": 30})
+
+
+class TestSep24Info(unittest.TestCase):
+    def test_interactive_endpoints(self):
+        async def _async():
+            sep24 = InfoFakeSep24(info_cache=TTLCache(ttl=60))
+            deposit_request = Sep24DepositPostRequest(asset_code="USD", account="GA")
+            for _ in range(3):
+                response = await sep24.http_post_transactions_deposit_interactive(
+                    deposit_request, None
+                )
+                assert response.id == "new"
+            for asset_code in ("USD", "EUR"):
+                with self.assertRaises(ValueError):
+                    await sep24.http_post_transactions_withdraw_interactive(
+                        Sep24WithdrawPostRequest(asset_code=asset_code), None
+                    )
+            with self.assertRaises(ValueError):
+                await sep24.http_post_transactions_deposit_interactive(
+                    Sep24DepositPostRequest(asset_code="EUR", account="GA"), None
+                )
+            assert sep24.info_requests == ["en"]
+            await sep24.is_asset_enabled("deposit", "USD", lang="pt")
+            assert sep24.info_requests == ["en", "pt"]
+
+            await sep24.invalidate_info("pt")
+            await sep24.is_asset_enabled("deposit", "USD", lang="pt")
+            assert sep24.info_requests == ["en", "pt", "pt"]
+            await sep24.invalidate_info()
+            await sep24.is_asset_enabled("deposit", "USD", lang="en")
+            await sep24.is_asset_enabled("deposit", "USD", lang="pt")
+            assert sep24.info_requests == ["en", "pt", "pt", "en", "pt"]
+
+        asyncio.run(_async())
+
+    def test_without_cache(self):
+        async def _async():
+            sep24 = InfoFakeSep24()
+            info = await sep24.get_info(Sep24InfoRequest(lang="en"))
+            assert info.deposit["USD"].enabled
+            await sep24.get_info(Sep24InfoRequest(lang="en"))
+            assert sep24.info_requests == ["en", "en"]
+
+        asyncio.run(_async())
+
+
+if __name__ == "__main__":
+    unittest.main()
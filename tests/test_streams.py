@@ -0,0 +1,326 @@
+import asyncio
+import unittest
+
+from fawaris import Sep24Transaction
+from fawaris.streams import (
+    CursorCheckpointer,
+    PendingWithdrawalIndex,
+    WithdrawalStreamManager,
+)
+
+from test_payments import ANCHOR, WithdrawingFakeSep24, payment_transaction
+from test_sep24 import FakeSep24, deposit
+
+
+class StreamingFakeSep24(FakeSep24):
+    """
+    FakeSep24 whose account streams are fed from a list of events. The first
+    time an event with `fail` set is reached, the connection is dropped, and
+    an event with `fail_processing` set raises the first `fail_processing`
+    times it's processed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.events = {}
+        self.connections = []
+        self.processed = []
+        self.cursors = {}
+        self.saves = []
+        self.dead_letters = []
+
+    async def stream_withdraw_anchor_account_events(self, account, cursor):
+        self.connections.append((account, cursor))
+        for event in self.events.get(account, []):
+            if int(event["paging_token"]) <= int(cursor):
+                continue
+            if event.get("fail"):
+                event.pop("fail")
+                raise ConnectionError("stream dropped")
+            yield event
+        # stalled connection
+        await asyncio.sleep(10)
+
+    async def process_stream_response(self, response, account):
+        failures = response.get("fail_processing", 0)
+        if failures:
+            response["fail_processing"] = failures - 1
+            raise RuntimeError("database error")
+        self.processed.append((account, response["paging_token"]))
+
+    async def get_withdraw_anchor_account_cursor(self, account):
+        return self.cursors.get(account)
+
+    async def save_withdraw_anchor_account_cursor(self, account, cursor):
+        self.saves.append((account, cursor))
+        self.cursors[account] = cursor
+
+    async def dead_letter_stream_response(self, response, account, exception):
+        self.dead_letters.append((account, response["paging_token"], str(exception)))
+
+
+def withdrawal(id, account, memo=None, status="pending_user_transfer_start"):
+    return Sep24Transaction(
+        id=id,
+        kind="withdrawal",
+        status=status,
+        withdraw_anchor_account=account,
+        withdraw_memo=memo,
+    )
+
+
+def event(paging_token, **kwargs):
+    return {"paging_token": str(paging_token), **kwargs}
+
+
+class TestPendingWithdrawalIndex(unittest.TestCase):
+    def test_update(self):
+        index = PendingWithdrawalIndex()
+        index.update(withdrawal("1", "GA", "100"))
+        index.update(withdrawal("2", "GA", "200"))
+        index.update(deposit("3"))
+        assert [tx.id for tx in index.get("GA", "100")] == ["1"]
+        assert index.get("GB", "100") == []
+        index.update(withdrawal("1", "GA", "100", status="pending_anchor"))
+        assert index.get("GA", "100") == []
+        index.remove("2")
+        assert len(index) == 0
+
+    def test_changes_during_resync_win(self):
+        index = PendingWithdrawalIndex()
+        index.update(withdrawal("1", "GA", "100"))
+        index.start_resync()
+        index.remove("1")
+        index.update(withdrawal("2", "GA", "200"))
+        # loaded before the changes above
+        index.finish_resync([withdrawal("1", "GA", "100"), withdrawal("3", "GB")])
+        assert index.get("GA", "100") == []
+        assert [tx.id for tx in index.get("GA", "200")] == ["2"]
+        assert [tx.id for tx in index.get("GB", None)] == ["3"]
+        assert index.resyncs == 1
+
+    def test_stream_events_matched_in_memory(self):
+        async def _async():
+            index = PendingWithdrawalIndex()
+            sep24 = WithdrawingFakeSep24(
+                [withdrawal("1", ANCHOR, "100")], pending_withdrawal_index=index
+            )
+            envelope_xdr, result_xdr = payment_transaction(memo="200")
+            response = {
+                "successful": True,
+                "id": "abc",
+                "envelope_xdr": envelope_xdr,
+                "result_xdr": result_xdr,
+                "memo": "200",
+            }
+            # the index isn't loaded yet, a miss is looked up
+            await sep24.process_stream_response(response, ANCHOR)
+            assert sep24.queries == 1
+
+            manager = WithdrawalStreamManager(sep24)
+            await manager.refresh()
+            await manager.remove_account(ANCHOR)
+            assert sep24.queries == 2
+            assert index.synced
+            assert [tx.id for tx in index.get(ANCHOR, "100")] == ["1"]
+
+            # a withdrawal that became pending without updating the index is
+            # only matched after the next refresh
+            sep24.transactions["2"] = withdrawal("2", ANCHOR, "200")
+            response["id"] = "def"
+            await sep24.process_stream_response(response, ANCHOR)
+            assert sep24.queries == 2
+            assert sep24.withdrawals_received == []
+
+            index.start_resync()
+            assert not index.synced
+            response["id"] = "ghi"
+            await sep24.process_stream_response(response, ANCHOR)
+            assert sep24.queries == 3
+            assert [received[0] for received in sep24.withdrawals_received] == ["2"]
+
+        asyncio.run(_async())
+
+
+class TestCursorCheckpointer(unittest.TestCase):
+    def test_batched_saves(self):
+        async def _async():
+            saves = []
+
+            async def save(account, cursor):
+                saves.append((account, cursor))
+
+            checkpointer = CursorCheckpointer(save, max_events=3, max_delay=0.01)
+            for cursor in range(1, 5):
+                await checkpointer.record("GA", str(cursor))
+            await checkpointer.record("GB", "9")
+            # only the last token of each account is saved
+            assert saves == [("GA", "3")]
+            await asyncio.sleep(0.05)
+            assert saves == [("GA", "3"), ("GA", "4"), ("GB", "9")]
+            assert checkpointer.saves == 2
+            assert checkpointer.latest("GA") == "4"
+            await checkpointer.aclose()
+
+        asyncio.run(_async())
+
+    def test_failed_save(self):
+        async def _async():
+            saves = []
+
+            async def save(account, cursor):
+                if cursor == "1":
+                    raise RuntimeError("database error")
+                saves.append((account, cursor))
+
+            checkpointer = CursorCheckpointer(save, max_events=1)
+            await checkpointer.record("GA", "1")
+            await checkpointer.record("GA", "2")
+            assert saves == [("GA", "2")]
+
+        asyncio.run(_async())
+
+
+class TestWithdrawalStreamManager(unittest.TestCase):
+    def test_add_and_remove_accounts(self):
+        async def _async():
+            sep24 = StreamingFakeSep24([withdrawal("1", "GA"), withdrawal("2", "GB")])
+            sep24.events = {"GA": [event(1), event(2)], "GB": [event(5)]}
+            manager = WithdrawalStreamManager(sep24)
+            await manager.refresh()
+            assert set(manager.streams) == {"GA", "GB"}
+            await asyncio.sleep(0.05)
+            assert sorted(sep24.processed) == [("GA", "1"), ("GA", "2"), ("GB", "5")]
+            assert manager.stats()["GA"]["cursor"] == "2"
+            assert manager.stats()["GA"]["events"] == 2
+
+            sep24.transactions["1"] = sep24.transactions["1"].copy(
+                update={"status": "completed"}
+            )
+            sep24.transactions["3"] = withdrawal("3", "GC")
+            task = manager.streams["GA"].task
+            await manager.refresh()
+            assert set(manager.streams) == {"GB", "GC"}
+            assert task.cancelled()
+            await manager.remove_account("GB")
+            await manager.remove_account("GC")
+
+        asyncio.run(_async())
+
+    def test_reconnect_from_last_cursor(self):
+        async def _async():
+            sep24 = StreamingFakeSep24([withdrawal("1", "GA")])
+            sep24.events = {"GA": [event(1), event(2, fail=True), event(3)]}
+            manager = WithdrawalStreamManager(
+                sep24, min_backoff=0.01, heartbeat_timeout=0.05
+            )
+            await manager.refresh()
+            await asyncio.sleep(0.04)
+            assert sep24.processed == [("GA", "1"), ("GA", "2"), ("GA", "3")]
+            assert sep24.connections == [("GA", "0"), ("GA", "1")]
+            # the stalled stream is reopened after the heartbeat timeout
+            await asyncio.sleep(0.1)
+            assert sep24.connections[2] == ("GA", "3")
+            assert manager.streams["GA"].reconnects >= 2
+            await manager.remove_account("GA")
+
+        asyncio.run(_async())
+
+    def test_failed_event_retried(self):
+        async def _async():
+            sep24 = StreamingFakeSep24([withdrawal("1", "GA")])
+            sep24.events = {
+                "GA": [event(1), event(2, fail_processing=True), event(3)]
+            }
+            manager = WithdrawalStreamManager(
+                sep24, min_backoff=0.01, checkpoint_max_events=1
+            )
+            await manager.refresh()
+            await asyncio.sleep(0.05)
+            assert sep24.processed == [("GA", "1"), ("GA", "2"), ("GA", "3")]
+            assert sep24.connections == [("GA", "0"), ("GA", "1")]
+            assert sep24.saves == [("GA", "1"), ("GA", "2"), ("GA", "3")]
+            assert manager.streams["GA"].failed_events == 1
+            await manager.remove_account("GA")
+
+        asyncio.run(_async())
+
+    def test_failing_event_skipped_after_retries(self):
+        async def _async():
+            sep24 = StreamingFakeSep24([withdrawal("1", "GA")])
+            sep24.events = {
+                "GA": [event(1), event(2, fail_processing=float("inf")), event(3)]
+            }
+            manager = WithdrawalStreamManager(
+                sep24, min_backoff=0.001, checkpoint_max_events=1
+            )
+            await manager.refresh()
+            await asyncio.sleep(0.1)
+            assert sep24.processed == [("GA", "1"), ("GA", "3")]
+            assert sep24.connections == [("GA", "0")] + [("GA", "1")] * 3
+            assert sep24.dead_letters == [("GA", "2", "database error")]
+            assert sep24.saves == [("GA", "1"), ("GA", "2"), ("GA", "3")]
+            stats = manager.stats()["GA"]
+            assert stats["failed_events"] == 4
+            assert stats["dead_letters"] == 1
+            await manager.remove_account("GA")
+
+        asyncio.run(_async())
+
+    def test_idle_stream_reconnects_without_backoff(self):
+        async def _async():
+            sep24 = StreamingFakeSep24([withdrawal("1", "GA")])
+            manager = WithdrawalStreamManager(
+                sep24, min_backoff=1, heartbeat_timeout=0.01
+            )
+            await manager.refresh()
+            await asyncio.sleep(0.1)
+            stream = manager.streams["GA"]
+            assert stream.consecutive_failures == 0
+            assert stream.idle_reconnects >= 3
+            assert len(sep24.connections) == stream.idle_reconnects + 1
+            await manager.remove_account("GA")
+
+        asyncio.run(_async())
+
+    def test_run_until_stopped(self):
+        async def _async():
+            sep24 = StreamingFakeSep24([withdrawal("1", "GA")])
+            manager = WithdrawalStreamManager(sep24, refresh_interval=0.01)
+            task = asyncio.ensure_future(manager.run())
+            await asyncio.sleep(0.05)
+            assert list(manager.streams) == ["GA"]
+            manager.stop()
+            await task
+            assert manager.streams == {}
+
+        asyncio.run(_async())
+
+    def test_resume_from_checkpoint(self):
+        async def _async():
+            sep24 = StreamingFakeSep24([withdrawal("1", "GA")])
+            sep24.events = {"GA": [event(i) for i in range(1, 6)]}
+            manager = WithdrawalStreamManager(
+                sep24, refresh_interval=0.01, checkpoint_max_events=2
+            )
+            task = asyncio.ensure_future(manager.run())
+            await asyncio.sleep(0.05)
+            manager.stop()
+            await task
+            assert sep24.saves == [("GA", "2"), ("GA", "4"), ("GA", "5")]
+
+            # a new process resumes after the last processed event
+            sep24.events["GA"].append(event(6))
+            sep24.processed = []
+            manager = WithdrawalStreamManager(sep24)
+            await manager.refresh()
+            await asyncio.sleep(0.01)
+            assert sep24.connections[-1] == ("GA", "5")
+            assert sep24.processed == [("GA", "6")]
+            await manager.remove_account("GA")
+
+        asyncio.run(_async())
+
+
+if __name__ == "__main__":
+    unittest.main()